@@ -0,0 +1,77 @@
+"""
+Benchmark de pico de memória do ETLProcessor.
+
+Compara o pipeline com cleaners que copiam (wrappers limpar_*) com o pipeline
+dono dos frames (limpar_*_inplace + copy-on-write), medindo com tracemalloc.
+
+Uso (da raiz do projeto):
+    python -m app.bench_memory --rows 200000
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from app.services import data_cleaner
+from app.services.instrumentation import medir_pico_memoria
+from app.services.processor_core import ETLProcessor
+
+CLEANERS_COPIANDO = {
+    "orders": data_cleaner.limpar_pedidos,
+    "products": data_cleaner.limpar_produtos,
+    "items": data_cleaner.limpar_itens,
+    "sellers": data_cleaner.limpar_vendedores,
+}
+
+
+def gerar_payload(rows: int, seed: int = 42) -> dict:
+    rng = np.random.default_rng(seed)
+    n_dim = max(rows // 10, 1)
+    compra = pd.Timestamp("2017-01-01") + pd.to_timedelta(rng.integers(0, 365 * 24 * 3600, rows), unit="s")
+    return {
+        "orders": pd.DataFrame({
+            "order_id": [f"order_{i:08d}" for i in range(rows)],
+            "order_status": rng.choice(["delivered", "shipped", "canceled"], rows),
+            "order_purchase_timestamp": compra.strftime("%Y-%m-%d %H:%M:%S"),
+            "order_estimated_delivery_date": (compra + pd.Timedelta(days=20)).strftime("%Y-%m-%d %H:%M:%S"),
+        }),
+        "products": pd.DataFrame({
+            "product_id": [f"product_{i:06d}" for i in range(n_dim)],
+            "product_category_name": rng.choice(["cama_mesa_banho", None], n_dim),
+            "product_weight_g": np.where(rng.random(n_dim) > 0.1, rng.uniform(50, 5000, n_dim), np.nan),
+        }),
+        "order_items": pd.DataFrame({
+            "order_id": [f"order_{i:08d}" for i in rng.integers(0, rows, rows)],
+            "product_id": [f"product_{i:06d}" for i in rng.integers(0, n_dim, rows)],
+            "seller_id": [f"seller_{i:04d}" for i in rng.integers(0, 100, rows)],
+            "price": rng.uniform(5, 500, rows).round(2),
+        }),
+        "sellers": pd.DataFrame({"seller_id": [f"seller_{i:04d}" for i in range(100)]}),
+    }
+
+
+def medir(processor: ETLProcessor, rows: int, rotulo: str) -> float:
+    payload = gerar_payload(rows)  # frames novos a cada medição: o pipeline in-place os consome
+    with medir_pico_memoria(rotulo) as stats:
+        processor.process_frames(payload)
+    return stats["pico_mb"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200000)
+    args = parser.parse_args()
+
+    copiando = ETLProcessor()
+    copiando.cleaner_map = CLEANERS_COPIANDO
+    pico_copia = medir(copiando, args.rows, "copiando")
+    pico_dono = medir(ETLProcessor(), args.rows, "in-place")
+
+    print(f"📊 Pico de memória do process_frames com {args.rows} pedidos/itens:")
+    print(f"   - cleaners que copiam: {pico_copia:8.1f} MB")
+    print(f"   - pipeline in-place:   {pico_dono:8.1f} MB")
+    print(f"   💾 redução: {(1 - pico_dono / pico_copia) * 100:.0f}%")
+
+
+if __name__ == "__main__":
+    main()
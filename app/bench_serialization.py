@@ -0,0 +1,96 @@
+"""
+Benchmark da serialização da resposta de /process.
+
+Compara o caminho antigo (replace + to_dict + sanitize_list + encoder do FastAPI)
+com o encoder direto em bytes (ETLProcessor.process_payload_json).
+
+Uso (da raiz do projeto):
+    python -m app.bench_serialization --rows 10000 --repeat 5
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+from fastapi.encoders import jsonable_encoder
+
+from app.services.json_encoder import encode_response
+
+
+def gerar_frames(rows: int, seed: int = 42) -> dict:
+    rng = np.random.default_rng(seed)
+    compra = pd.Timestamp("2017-01-01") + pd.to_timedelta(rng.integers(0, 365 * 24 * 3600, rows), unit="s")
+    entrega = compra + pd.to_timedelta(rng.integers(1, 30, rows), unit="D")
+    entrega = entrega.where(rng.random(rows) > 0.1)  # ~10% NaT
+
+    orders = pd.DataFrame({
+        "order_id": [f"order_{i:08d}" for i in range(rows)],
+        "order_status": rng.choice(["delivered", "shipped", "canceled"], rows),
+        "order_purchase_timestamp": compra,
+        "order_delivered_customer_date": entrega,
+        "order_estimated_delivery_date": (compra + pd.Timedelta(days=20)).tz_localize("UTC"),
+    })
+    items = pd.DataFrame({
+        "order_id": orders["order_id"],
+        "order_item_id": rng.integers(1, 4, rows),
+        "price": np.where(rng.random(rows) > 0.05, rng.uniform(5, 500, rows).round(2), np.nan),
+        "freight_value": np.where(rng.random(rows) > 0.01, rng.uniform(0, 50, rows).round(2), np.inf),
+    })
+    return {"data": {"orders": orders, "order_items": items}, "orphans": {}}
+
+
+def caminho_antigo(sections: dict) -> bytes:
+    def sanitize_list(records):
+        return [
+            {k: (None if isinstance(v, float) and (pd.isna(v) or np.isinf(v)) else v) for k, v in r.items()}
+            for r in records
+        ]
+
+    result = {"status": "success", "data": {}, "orphans": {}}
+    for section, frames in sections.items():
+        for entity, df in frames.items():
+            result[section][entity] = sanitize_list(df.replace({np.nan: None}).to_dict(orient="records"))
+    return json.dumps(jsonable_encoder(result)).encode("utf-8")
+
+
+def caminho_novo(sections: dict) -> bytes:
+    return encode_response(sections, meta={"status": "success"})
+
+
+def medir(func, sections: dict, repeat: int) -> float:
+    tempos = []
+    for _ in range(repeat):
+        inicio = time.perf_counter()
+        func(sections)
+        tempos.append(time.perf_counter() - inicio)
+    return min(tempos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    sections = gerar_frames(args.rows)
+
+    # Os dois caminhos precisam produzir o mesmo JSON
+    antigo = json.loads(caminho_antigo(sections))
+    novo = json.loads(caminho_novo(sections))
+    for entity, records in antigo["data"].items():
+        for r_old, r_new in zip(records, novo["data"][entity]):
+            for k, v in r_old.items():
+                assert v == r_new[k], (entity, k, v, r_new[k])
+
+    t_antigo = medir(caminho_antigo, sections, args.repeat)
+    t_novo = medir(caminho_novo, sections, args.repeat)
+
+    print(f"📊 Serialização de {args.rows} linhas por entidade (melhor de {args.repeat}):")
+    print(f"   - caminho antigo (to_dict + sanitize_list): {t_antigo * 1000:8.1f} ms")
+    print(f"   - encoder direto (encode_response):         {t_novo * 1000:8.1f} ms")
+    print(f"   ⚡ speedup: {t_antigo / t_novo:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,29 @@
 # app/main.py
 import logging
 import traceback
-from fastapi import FastAPI, HTTPException, Request
-from pydantic import BaseModel
-from typing import List, Dict, Any
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request, Response, Query
+from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, ValidationError
+from typing import List, Dict, Any, Optional, Tuple
 import uvicorn
 import os
-from app.services.processor_core import etl_processor
+import hashlib
+import datetime as dt
+from fastapi.concurrency import run_in_threadpool
 import pandas as pd
-import numpy as np
+from app.services.processor_core import etl_processor, ENTITY_ALIASES, OUTPUT_NAMES, ORPHAN_REASONS
+from app.services.stats_profile import StatsProfile
+from app.services.worker_pool import etl_worker_pool, PoolSaturatedError
+from app.services.json_encoder import encode_response
+from app.services.ingestion import ColumnarIngestor, IngestionError
+from app.services import wire_formats
+from app.services.wire_formats import WireFormatUnavailable
+from app.services.refined_store import RefinedQueryError
+from app.services.dq_rules import DQ_RULES, FLAGS_COLUMN, rule_bits, rules_version
+from app.services.jobs import JobManager
+from app.services.response_cache import canonical_json, response_cache
 
 
 LOG_PATH = os.path.join(os.path.dirname(__file__), "..", "app.log")
@@ -23,10 +38,27 @@ logging.basicConfig(
 
 logger = logging.getLogger("pta-etl-api")
 
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+STREAM_CHUNK_SIZE = int(os.getenv("ETL_STREAM_CHUNK_SIZE", "1000"))
+BATCH_MAX_PAYLOADS = int(os.getenv("ETL_BATCH_MAX_PAYLOADS", "1000"))
+ORPHANS_QUERY_DESCRIPTION = (
+    "Formato da seção 'orphans': 'full' (registros completos) ou 'compact' "
+    "(chave primária + código do motivo, com contagens em 'orphan_counts'). Padrão: ETL_ORPHAN_MODE."
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    etl_worker_pool.shutdown()
+    job_manager.shutdown()
+
+
 app = FastAPI(
     title="Data Engineering PTA - ETL API (debug)",
     description="API que recebe dados brutos (JSON), processa DataFrames e retorna dados limpos.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 class PayloadInput(BaseModel):
     orders: List[Dict[str, Any]]
@@ -37,52 +69,424 @@ class PayloadInput(BaseModel):
     class Config:
         extra = "forbid"  # Não permite campos fora do modelo
 
+
+class BatchInput(BaseModel):
+    payloads: List[PayloadInput]
+
+
+# Jobs assíncronos (POST /jobs): payloads grandes processados em segundo plano
+job_manager = JobManager.from_env(etl_processor, PayloadInput.model_fields.keys())
+
 @app.get("/", tags=["Health"])
 def read_root():
     return {"message": "API de Engenharia de Dados está Online! 🚀"}
 
-@app.post("/process", tags=["ETL"], status_code=200)
-async def process_data(payload: PayloadInput, request: Request):
+async def run_etl(
+    raw_data: Dict[str, Any],
+    request: Request,
+    stream: Optional[str],
+    chunk_size: int,
+    endpoint: str,
+    orphans: Optional[str] = None,
+    cache_key: Optional[str] = None
+):
     try:
-        raw_data = payload.model_dump()  # pydantic v2
-        logger.info("Recebido payload: keys=%s", list(raw_data.keys()))
+        # Modo streaming (opt-in): cada entidade sai em blocos assim que fica pronta.
+        # O gerador roda no pool de workers e ocupa um slot até o fim do stream.
+        if stream == "ndjson" or NDJSON_MEDIA_TYPE in request.headers.get("accept", ""):
+            lines, queue_wait = await etl_worker_pool.stream(
+                etl_processor.iter_payload_ndjson, raw_data, orphans, chunk_size
+            )
+            logger.info("Stream NDJSON iniciado: espera na fila=%.1fms", queue_wait * 1000)
+            return StreamingResponse(
+                lines,
+                media_type=NDJSON_MEDIA_TYPE,
+                headers={"X-Queue-Wait-Ms": f"{queue_wait * 1000:.1f}"}
+            )
 
-        # Executa o core ETL
-        result = etl_processor.process_payload(raw_data)
-
-        # Sanitização final contra NaN / Inf para JSON
-        def sanitize_list(records):
-            clean = []
-            for r in records:
-                clean.append({
-                    k: (
-                        None if (
-                            isinstance(v, float)
-                            and (pd.isna(v) or np.isinf(v))
-                        ) else v
-                    )
-                    for k, v in r.items()
-                })
-            return clean
-
-        if isinstance(result, dict) and "data" in result:
-            for section in result.get("data", {}):
-                result["data"][section] = sanitize_list(result["data"][section])
-
-        if isinstance(result, dict) and "orphans" in result:
-            for section in result.get("orphans", {}):
-                result["orphans"][section] = sanitize_list(result["orphans"][section])
-
-        return result
+        # Negociação de conteúdo: Arrow IPC / Parquet para clientes máquina-a-máquina.
+        # Sem pyarrow, o 406 sai antes do ETL (e não depois de processar tudo)
+        columnar_format = wire_formats.negotiate(request.headers.get("accept", ""))
+        wire_formats.check_available(columnar_format)
+        if columnar_format:
+            body, queue_wait = await etl_worker_pool.run(
+                etl_processor.process_payload_encoded, raw_data, wire_formats.WRITERS[columnar_format], orphans
+            )
+            media_type = columnar_format
+        else:
+            # Executa o core ETL no pool de workers (não bloqueia o event loop).
+            # A resposta já volta serializada: NaN/NaT/Inf viram null no próprio encoder.
+            body, queue_wait = await etl_worker_pool.run(etl_processor.process_payload_json, raw_data, orphans)
+            media_type = "application/json"
+        logger.info("Payload processado: espera na fila=%.1fms", queue_wait * 1000)
+
+        headers = {"X-Queue-Wait-Ms": f"{queue_wait * 1000:.1f}"}
+        if cache_key is not None:
+            # Pode gravar em disco: fora do event loop
+            await run_in_threadpool(response_cache.put, cache_key, body, media_type)
+            headers["X-Cache"] = "MISS"
+        return Response(content=body, media_type=media_type, headers=headers)
+
+    except WireFormatUnavailable as e:
+        raise HTTPException(status_code=406, detail={"error": str(e)})
+
+    except PoolSaturatedError as e:
+        logger.warning("Requisição rejeitada em %s: %s", endpoint, e)
+        raise HTTPException(status_code=503, detail={"error": str(e)})
 
     except Exception as e:
         tb = traceback.format_exc()
-        logger.error("Erro no endpoint /process: %s\n%s", str(e), tb)
+        logger.error("Erro no endpoint %s: %s\n%s", endpoint, str(e), tb)
 
         raise HTTPException(
             status_code=500,
             detail={"error": str(e), "traceback": tb}
         )
 
+
+def response_cache_key(request: Request, stream: Optional[str], orphans: Optional[str], content_hash: Optional[str]) -> Optional[str]:
+    """
+    Chave do cache de respostas, ou None quando a resposta não pode vir do cache
+    (cache desligado, streaming, corpo não canônico ou processamento com estado).
+    """
+    if not response_cache.enabled or content_hash is None or not etl_processor.response_cacheable():
+        return None
+    if stream == "ndjson" or NDJSON_MEDIA_TYPE in request.headers.get("accept", ""):
+        return None
+    response_cache.check_version(etl_processor.cache_version())
+    variant = f"{wire_formats.negotiate(request.headers.get('accept', '')) or 'json'}|{orphans or etl_processor.orphan_mode}"
+    return response_cache.key(content_hash, variant)
+
+
+def cached_response(cache_key: Optional[str]) -> Optional[Response]:
+    """Resposta já serializada do cache (sem parse, ETL nem serialização)."""
+    entry = response_cache.get(cache_key) if cache_key is not None else None
+    if entry is None:
+        return None
+    return Response(content=entry.body, media_type=entry.media_type, headers={"X-Cache": "HIT"})
+
+
+def cache_lookup(
+    request: Request, stream: Optional[str], orphans: Optional[str], content_hash: Optional[str]
+) -> Tuple[Optional[str], Optional[Response]]:
+    """(chave, resposta em cache ou None). Pode ler o disco: chamar fora do event loop."""
+    cache_key = response_cache_key(request, stream, orphans, content_hash)
+    return cache_key, cached_response(cache_key)
+
+
+def _hash_process_body(body: bytes, columnar_format: Optional[str]) -> Tuple[Optional[str], Any]:
+    # JSON em forma canônica (o documento decodificado segue para a validação); formatos binários, bytes crus
+    if columnar_format:
+        return hashlib.sha256(columnar_format.encode("utf-8") + b"\n" + body).hexdigest(), None
+    return canonical_json(body)
+
+
+def _validate_payload(body: bytes, document: Any) -> Dict[str, Any]:
+    # Reaproveita o documento já decodificado para o hash do cache (sem parse duplo)
+    if document is not None:
+        return PayloadInput.model_validate(document).model_dump()
+    return PayloadInput.model_validate_json(body).model_dump()  # pydantic v2
+
+
+# O corpo de /process é lido manualmente para permitir negociação de conteúdo;
+# o schema JSON continua documentado no OpenAPI.
+PROCESS_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {"schema": PayloadInput.model_json_schema()},
+            wire_formats.ARROW_STREAM_MEDIA_TYPE: {"schema": {"type": "string", "format": "binary"}},
+            wire_formats.PARQUET_MEDIA_TYPE: {"schema": {"type": "string", "format": "binary"}},
+        },
+    }
+}
+
+
+@app.post("/process", tags=["ETL"], status_code=200, openapi_extra=PROCESS_OPENAPI)
+async def process_data(
+    request: Request,
+    stream: Optional[str] = Query(None, description="Use 'ndjson' para receber a resposta em streaming."),
+    chunk_size: int = Query(STREAM_CHUNK_SIZE, ge=1, description="Registros por linha no modo NDJSON."),
+    orphans: Optional[str] = Query(None, pattern="^(full|compact)$", description=ORPHANS_QUERY_DESCRIPTION)
+):
+    """
+    Recebe JSON (PayloadInput), um stream Arrow IPC ou um ZIP de arquivos Parquet
+    (uma tabela por entidade) e responde no formato pedido no header Accept.
+    """
+    body = await request.body()
+    columnar_format = wire_formats.negotiate(request.headers.get("content-type", ""))
+
+    # Cache endereçado pelo conteúdo. Hash e leitura do disco rodam fora do event loop
+    cache_key, document = None, None
+    if response_cache.enabled and etl_processor.response_cacheable():
+        content_hash, document = await run_in_threadpool(_hash_process_body, body, columnar_format)
+        cache_key, hit = await run_in_threadpool(cache_lookup, request, stream, orphans, content_hash)
+        if hit is not None:
+            logger.info("Resposta servida do cache")
+            return hit
+
+    if columnar_format:
+        # A decodificação (Arrow/Parquet -> DataFrames) também é CPU-bound: roda no pool
+        try:
+            wire_formats.check_available(columnar_format)
+            raw_data, _ = await etl_worker_pool.run(
+                wire_formats.READERS[columnar_format], body, tuple(PayloadInput.model_fields.keys())
+            )
+        except WireFormatUnavailable as e:
+            raise HTTPException(status_code=415, detail={"error": str(e)})
+        except IngestionError as e:
+            logger.warning("Payload colunar rejeitado: %s", e)
+            raise HTTPException(status_code=422, detail={"error": str(e)})
+        except PoolSaturatedError as e:
+            logger.warning("Requisição rejeitada em /process: %s", e)
+            raise HTTPException(status_code=503, detail={"error": str(e)})
+        logger.info("Recebido payload %s: %s", columnar_format, {name: len(df) for name, df in raw_data.items()})
+    else:
+        try:
+            raw_data = await run_in_threadpool(_validate_payload, body, document)
+        except ValidationError as e:
+            raise RequestValidationError(e.errors())
+        logger.info("Recebido payload: keys=%s", list(raw_data.keys()))
+
+    return await run_etl(raw_data, request, stream, chunk_size, endpoint="/process", orphans=orphans, cache_key=cache_key)
+
+
+def _feed_ndjson_chunk(ingestor: ColumnarIngestor, hasher: Any, chunk: bytes) -> None:
+    hasher.update(chunk)
+    ingestor.feed_ndjson(chunk)
+
+
+def _feed_columnar_body(ingestor: ColumnarIngestor, hasher: Any, body: bytes) -> None:
+    hasher.update(body)
+    ingestor.feed_columnar_json(body)
+
+
+@app.post("/process/ingest", tags=["ETL"], status_code=200)
+async def ingest_data(
+    request: Request,
+    stream: Optional[str] = Query(None, description="Use 'ndjson' para receber a resposta em streaming."),
+    chunk_size: int = Query(STREAM_CHUNK_SIZE, ge=1, description="Registros por linha no modo NDJSON."),
+    orphans: Optional[str] = Query(None, pattern="^(full|compact)$", description=ORPHANS_QUERY_DESCRIPTION)
+):
+    """
+    Ingestão colunar: aceita NDJSON com blocos por entidade
+    ({"entity": "orders", "records": [...]} ou {"entity": "orders", "columns": {...}})
+    ou JSON colunar ({"orders": {"order_id": [...]}, ...}). O corpo vai direto para
+    colunas, bloco a bloco, sem validação Pydantic por linha; só os nomes das
+    entidades são validados (mesmas de PayloadInput).
+    """
+    ingestor = ColumnarIngestor(allowed_entities=PayloadInput.model_fields.keys())
+    # Hash dos bytes crus, calculado enquanto o corpo chega (chave do cache de respostas)
+    hasher = hashlib.sha256(request.headers.get("content-type", "").encode("utf-8") + b"\n")
+    # O parse de cada pedaço roda no threadpool: o event loop segue atendendo outras requisições
+    try:
+        if request.headers.get("content-type", "").startswith(NDJSON_MEDIA_TYPE):
+            async for chunk in request.stream():
+                await run_in_threadpool(_feed_ndjson_chunk, ingestor, hasher, chunk)
+            await run_in_threadpool(ingestor.finish_ndjson)
+        else:
+            # JSON colunar precisa do documento inteiro para ser decodificado
+            body = await request.body()
+            await run_in_threadpool(_feed_columnar_body, ingestor, hasher, body)
+    except IngestionError as e:
+        logger.warning("Payload de ingestão rejeitado: %s", e)
+        raise HTTPException(status_code=422, detail={"error": str(e)})
+
+    cache_key, hit = await run_in_threadpool(cache_lookup, request, stream, orphans, f"ingest:{hasher.hexdigest()}")
+    if hit is not None:
+        logger.info("Resposta servida do cache")
+        return hit
+
+    frames = await run_in_threadpool(ingestor.frames)
+    logger.info("Recebido payload colunar: %s", {name: len(df) for name, df in frames.items()})
+    return await run_etl(frames, request, stream, chunk_size, endpoint="/process/ingest", orphans=orphans, cache_key=cache_key)
+
+@app.post("/process/batch", tags=["ETL"], status_code=200)
+async def process_batch(
+    batch: BatchInput,
+    orphans: Optional[str] = Query(None, pattern="^(full|compact)$", description=ORPHANS_QUERY_DESCRIPTION)
+):
+    """
+    Processa vários payloads (mesmo formato de /process) em uma passada só:
+    as entidades são concatenadas com a coluna payload_id, limpas e validadas
+    uma vez e separadas de volta. Medianas, dedup, integridade e contagens
+    continuam por payload. A resposta traz `results`, um item por payload na
+    ordem recebida, cada um com as seções de /process.
+    """
+    if len(batch.payloads) > BATCH_MAX_PAYLOADS:
+        raise HTTPException(
+            status_code=413,
+            detail={"error": f"Lote com {len(batch.payloads)} payloads (máximo {BATCH_MAX_PAYLOADS})."}
+        )
+    payloads = [payload.model_dump() for payload in batch.payloads]
+    logger.info("Recebido lote: %d payloads", len(payloads))
+    try:
+        body, queue_wait = await etl_worker_pool.run(etl_processor.process_batch_json, payloads, orphans)
+    except PoolSaturatedError as e:
+        logger.warning("Requisição rejeitada em /process/batch: %s", e)
+        raise HTTPException(status_code=503, detail={"error": str(e)})
+    except Exception as e:
+        tb = traceback.format_exc()
+        logger.error("Erro no endpoint /process/batch: %s\n%s", str(e), tb)
+        raise HTTPException(status_code=500, detail={"error": str(e), "traceback": tb})
+    logger.info("Lote processado: espera na fila=%.1fms", queue_wait * 1000)
+    return Response(
+        content=body,
+        media_type="application/json",
+        headers={"X-Queue-Wait-Ms": f"{queue_wait * 1000:.1f}"}
+    )
+
+
+@app.post("/jobs", tags=["Jobs"], status_code=202)
+async def create_job(
+    request: Request,
+    orphans: Optional[str] = Query(None, pattern="^(full|compact)$", description=ORPHANS_QUERY_DESCRIPTION)
+):
+    """
+    Cria um job para payloads grandes demais para /process. O corpo (JSON no
+    formato de /process, JSON colunar ou NDJSON de /process/ingest) é gravado
+    em disco conforme chega; o processamento roda em segundo plano, com os
+    itens em blocos. Acompanhe em GET /jobs/{job_id}.
+    """
+    try:
+        job = await job_manager.submit(request.stream(), request.headers.get("content-type", ""), orphans)
+    except PoolSaturatedError as e:
+        logger.warning("Job rejeitado: %s", e)
+        raise HTTPException(status_code=503, detail={"error": str(e)})
+    return {**job, "status_url": f"/jobs/{job['job_id']}", "result_url": f"/jobs/{job['job_id']}/result"}
+
+
+@app.get("/jobs/{job_id}", tags=["Jobs"])
+def get_job(job_id: str):
+    """Situação e progresso do job (linhas processadas / total)."""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail={"error": f"Job desconhecido: {job_id!r}."})
+    return job
+
+
+@app.get("/jobs/{job_id}/result", tags=["Jobs"])
+def get_job_result(job_id: str):
+    """
+    Resultado do job em NDJSON (mesmo formato de /process?stream=ndjson),
+    enviado do disco em streaming. A última linha indica sucesso ou erro.
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail={"error": f"Job desconhecido: {job_id!r}."})
+    path = job_manager.result_path(job_id)
+    if path is None:
+        raise HTTPException(status_code=409, detail={"error": f"Job ainda não concluído (status: {job['status']})."})
+    return FileResponse(path, media_type=NDJSON_MEDIA_TYPE)
+
+
+@app.delete("/jobs/{job_id}", tags=["Jobs"], status_code=204)
+def delete_job(job_id: str):
+    """Remove o payload e o resultado de um job concluído."""
+    try:
+        removed = job_manager.delete(job_id)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail={"error": str(e)})
+    if not removed:
+        raise HTTPException(status_code=404, detail={"error": f"Job desconhecido: {job_id!r}."})
+    return Response(status_code=204)
+
+
+@app.get("/refined/{entity}", tags=["Refined"])
+async def query_refined(
+    entity: str,
+    request: Request,
+    columns: Optional[str] = Query(None, description="Colunas separadas por vírgula (padrão: todas)."),
+    date_from: Optional[dt.date] = Query(None, description="Data inicial (inclusiva) da coluna de referência da entidade."),
+    date_to: Optional[dt.date] = Query(None, description="Data final (inclusiva)."),
+    order_status: Optional[List[str]] = Query(None, description="Filtra por status (pode repetir)."),
+    seller_state: Optional[List[str]] = Query(None, description="Filtra por UF do vendedor (pode repetir)."),
+    limit: Optional[int] = Query(None, ge=1, description="Máximo de linhas.")
+):
+    """
+    Consulta o refined store Parquet (ETL_REFINED_STORE_PATH) com projeção de
+    colunas e filtros empurrados para a leitura: só as partições de mês e os
+    row groups que podem conter linhas do filtro são lidos (via memory-map).
+    Responde em JSON, Arrow ou Parquet conforme o header Accept.
+    """
+    store = etl_processor.refined_store
+    if store is None:
+        raise HTTPException(status_code=404, detail={"error": "Refined store não configurado (ETL_REFINED_STORE_PATH)."})
+    if entity not in PayloadInput.model_fields:
+        raise HTTPException(status_code=404, detail={"error": f"Entidade desconhecida: {entity!r}."})
+
+    filters = {"order_status": order_status, "seller_state": seller_state}
+    projection = [col.strip() for col in columns.split(",") if col.strip()] if columns else None
+    try:
+        df = await run_in_threadpool(store.query, entity, projection, date_from, date_to, filters, limit)
+        sections = {"data": {entity: df}}
+        columnar_format = wire_formats.negotiate(request.headers.get("accept", ""))
+        if columnar_format:
+            return Response(content=wire_formats.WRITERS[columnar_format](sections), media_type=columnar_format)
+        return Response(content=encode_response(sections, meta={"rows": len(df)}), media_type="application/json")
+    except RefinedQueryError as e:
+        raise HTTPException(status_code=422, detail={"error": str(e)})
+    except WireFormatUnavailable as e:
+        raise HTTPException(status_code=406, detail={"error": str(e)})
+
+
+@app.get("/dq/rules", tags=["Data Quality"])
+def get_dq_rules():
+    """Bits de cada regra de qualidade por entidade (coluna dq_flags) e do código `reason` dos órfãos compactos."""
+    return {
+        "column": FLAGS_COLUMN,
+        "version": rules_version(),
+        "enabled": etl_processor.dq_rules,
+        "orphan_reasons": ORPHAN_REASONS,
+        "rules": {
+            OUTPUT_NAMES.get(entity, entity): rule_bits(entity) for entity in DQ_RULES
+        },
+    }
+
+
+@app.get("/cache/stats", tags=["Cache"])
+def get_cache_stats():
+    """Métricas do cache de respostas (acertos, falhas, evicções, ocupação por camada)."""
+    return {**response_cache.stats(), "enabled": response_cache.enabled, "cacheable": etl_processor.response_cacheable()}
+
+
+@app.post("/cache/invalidate", tags=["Cache"])
+def invalidate_cache():
+    """Descarta todas as respostas em cache (memória e disco)."""
+    response_cache.invalidate()
+    return response_cache.stats()
+
+
+@app.get("/stats/profile", tags=["Stats"])
+def get_stats_profile():
+    """Perfil estatístico (medianas e limites IQR) usado hoje pelo /process."""
+    if etl_processor.stats_profile is None:
+        raise HTTPException(status_code=404, detail={"error": "Nenhum perfil estatístico ajustado."})
+    return etl_processor.stats_profile.to_dict()
+
+
+def _fit_stats_profile(raw_data: Dict[str, Any]) -> StatsProfile:
+    frames = {ENTITY_ALIASES.get(name, name): pd.DataFrame(records) for name, records in raw_data.items()}
+    return StatsProfile.fit(frames)
+
+
+@app.post("/stats/refit", tags=["Stats"])
+async def refit_stats_profile(payload: PayloadInput):
+    """
+    Reajusta o perfil estatístico a partir de um dataset de referência e passa a
+    aplicá-lo em todo /process. Se ETL_STATS_PROFILE_PATH estiver definido, o
+    perfil também é persistido (e recarregado na próxima inicialização).
+    """
+    profile = await run_in_threadpool(_fit_stats_profile, payload.model_dump())
+
+    path = os.getenv("ETL_STATS_PROFILE_PATH")
+    if path:
+        # Grava em disco: fora do event loop
+        await run_in_threadpool(profile.save, path)
+    etl_processor.stats_profile = profile
+    logger.info("Perfil estatístico reajustado: versão %s", profile.version)
+    return profile.to_dict()
+
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000, log_level="info")
@@ -1,83 +1,511 @@
+"""
+Pipeline batch: limpa os CSVs de data/processed e grava em data/refined.
+
+Os arquivos são distribuídos entre processos, e um manifesto (hash SHA-256,
+mtime e tamanho de cada entrada) faz as reexecuções pularem os arquivos que
+não mudaram. As saídas são gravadas de forma atômica (arquivo temporário +
+rename), então uma execução interrompida nunca deixa um CSV pela metade.
+
+Com --incremental, um estado SQLite (hash do conteúdo por chave primária)
+faz os arquivos alterados passarem só as linhas novas/alteradas pela limpeza;
+elas substituem as versões antigas no CSV refinado (upsert).
+
+Uso (da raiz do projeto):
+    python app/run_etl.py [--workers 4] [--force] [--incremental]
+"""
 import os
 import glob
-import shutil
+import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
 import pandas as pd
 
 # --- IMPORTAÇÃO DAS FUNÇÕES QUE CRIAMOS NO OUTRO ARQUIVO ---
-# O 'sys' e o 'append' abaixo ajudam o Python a encontrar a pasta services se necessário
+# O 'sys' e o 'append' abaixo ajudam o Python a encontrar o pacote 'app'
+# (temporal_cleaner fica em app/, os serviços em app/services/)
 import sys
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.temporal_cleaner import convert_to_datetime_utc, validate_pedidos, validate_itens
+from app.services.stats_profile import PROFILE_COLUMNS, SketchProfileFitter, StatsProfile
+from app.services.dtype_profiles import compactar_dtypes
+from app.services.refined_store import refined_store_from_env
+from app.services.dq_rules import FLAGS_COLUMN, merge_summaries, rules_version, summarize
+from app.services.dedup import DEFAULT_DEDUP_POLICY, DEDUP_POLICIES, deduplicate, keep_mask, newest_order, text_key_hashes
+from app.services.incremental import (
+    CHANGED, PRIMARY_KEYS, UNCHANGED, IncrementalStateStore, has_primary_key, primary_keys, row_hashes
+)
+
+# Entidade Olist de cada arquivo, pelo nome (usada no perfil de dtypes).
+# 'items' vem antes de 'orders' por causa de 'olist_order_items_dataset.csv'
+ENTIDADES_POR_NOME = {
+    'items': ('itens', 'items'),
+    'orders': ('pedidos', 'orders'),
+    'products': ('produtos', 'products'),
+    'sellers': ('vendedores', 'sellers'),
+}
+
+# Manifesto das entradas já processadas (fica junto das saídas)
+MANIFEST_NAME = '.manifest.json'
+# Estado incremental padrão (ETL_INCREMENTAL_STATE_PATH tem precedência)
+INCREMENTAL_STATE_NAME = '.incremental.sqlite'
 
-try:
-    from services.temporal_cleaner import convert_to_datetime_utc, validate_pedidos, validate_itens
-except ImportError:
-    # Caso esteja rodando da raiz do projeto
-    from app.services.temporal_cleaner import convert_to_datetime_utc, validate_pedidos, validate_itens
 
 # ==============================================================================
 # PARTE 1: CONFIGURAÇÃO DE PASTAS (Baseada na Célula 1 do Colab)
 # ==============================================================================
-print("🔄 INICIANDO CONFIGURAÇÃO DE AMBIENTE LOCAL...")
+def configurar_pastas(base_dir=None):
+    # Define o diretório base como o local onde o projeto está
+    # Assumindo que você roda o script da raiz do projeto ou da pasta app
+    base_dir = base_dir or os.getcwd()
 
-# Define o diretório base como o local onde o projeto está
-# Assumindo que você roda o script da raiz do projeto ou da pasta app
-BASE_DIR = os.getcwd() 
+    # Ajuste para garantir que caia na pasta 'data' correta independente de onde rodar
+    if os.path.basename(base_dir) == 'app':
+        base_dir = os.path.dirname(base_dir) # Sobe um nível para a raiz
 
-# Ajuste para garantir que caia na pasta 'data' correta independente de onde rodar
-if os.path.basename(BASE_DIR) == 'app':
-    BASE_DIR = os.path.dirname(BASE_DIR) # Sobe um nível para a raiz
+    raw_dir = os.path.join(base_dir, 'data', 'processed')
+    refined_dir = os.path.join(base_dir, 'data', 'refined')
 
-RAW_DIR = os.path.join(BASE_DIR, 'data', 'processed')
-REFINED_DIR = os.path.join(BASE_DIR, 'data', 'refined')
+    # Criar as pastas (se não existirem)
+    os.makedirs(raw_dir, exist_ok=True)
+    os.makedirs(refined_dir, exist_ok=True)
+    return raw_dir, refined_dir
 
-# Criar as pastas (se não existirem)
-os.makedirs(RAW_DIR, exist_ok=True)
-os.makedirs(REFINED_DIR, exist_ok=True)
-print(f"✅ Pastas configuradas: \n - {RAW_DIR} \n - {REFINED_DIR}")
 
 # ==============================================================================
-# PARTE 2: EXECUÇÃO DO PIPELINE (Baseada na Célula 3 do Colab)
+# PARTE 2: MANIFESTO E ESCRITA ATÔMICA
 # ==============================================================================
+def hash_arquivo(path, bloco=1 << 20):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for parte in iter(lambda: f.read(bloco), b''):
+            sha.update(parte)
+    return sha.hexdigest()
 
-# Pega todos os CSVs na pasta processed
-files = glob.glob(os.path.join(RAW_DIR, '*.csv'))
 
-print(f"\n🚀 INICIANDO PIPELINE PARA {len(files)} ARQUIVOS ENCONTRADOS EM 'data/processed'...\n")
+def carregar_manifesto(path):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        print("⚠️  Manifesto ilegível: todos os arquivos serão reprocessados.")
+        return {}
 
-if not files:
-    print("⚠️  AVISO: Nenhum arquivo .csv encontrado na pasta 'data/processed'.")
-    print("👉 Certifique-se de colocar seus arquivos csv dentro de PTA-ENGENHARIA-DE-DADOS/data/processed")
 
-for file_path in files:
-    filename = os.path.basename(file_path)
-    print(f"📄 PROCESSANDO: {filename}")
-   
-    # 1. Carregar
-    try:
-        df = pd.read_csv(file_path)
-    except Exception as e:
-        print(f"❌ Erro ao ler {filename}: {e}")
-        continue
+def salvar_manifesto(path, manifesto):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifesto, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def precisa_processar(file_path, save_path, registro, config):
+    """
+    Decide se o arquivo precisa ser reprocessado. Devolve (precisa, hash, stat);
+    o hash só é calculado quando mtime/tamanho mudaram em relação ao manifesto.
+    """
+    stat = os.stat(file_path)
+    if registro is None or not os.path.exists(save_path) or registro.get('config') != config:
+        return True, None, stat
+    if registro.get('mtime') == stat.st_mtime and registro.get('tamanho') == stat.st_size:
+        return False, registro['sha256'], stat
+    # mtime mudou (ex.: arquivo copiado de novo): só o conteúdo decide
+    sha = hash_arquivo(file_path)
+    return sha != registro.get('sha256'), sha, stat
+
+
+# ==============================================================================
+# PARTE 3: PROCESSAMENTO DE UM ARQUIVO (roda em um processo do pool)
+# ==============================================================================
+def entidade_do_arquivo(filename):
+    return next(
+        (ent for ent, nomes in ENTIDADES_POR_NOME.items() if any(n in filename.lower() for n in nomes)), None
+    )
+
+
+def transformar(df, filename, entidade, perfil, economia, final=True, agora=None, dq=None):
+    """
+    Conversão de datas + validações (+ perfil estatístico) de um DataFrame ou chunk.
+    `agora` fixa o instante da regra de data no futuro (o mesmo em todos os chunks);
+    o resumo das regras de qualidade é somado em `dq`.
+    """
+    # 1b. Perfil de dtypes: ids em strings Arrow, categóricos e inteiros reduzidos
+    df = compactar_dtypes(entidade, df, final=False, relatorio=economia)
 
     # 2. Converter Datas (Usa a função importada de temporal_cleaner)
     df = convert_to_datetime_utc(df)
 
     # 3. Decisão (Branching Logic)
     if 'itens' in filename.lower() or 'items' in filename.lower():
-        df_final = validate_itens(df)
+        df_final = validate_itens(df, agora)
         tipo = "ITENS"
+        if perfil is not None:
+            df_final = perfil.apply('items', df_final)
     elif 'pedidos' in filename.lower() or 'orders' in filename.lower():
-        df_final = validate_pedidos(df)
+        df_final = validate_pedidos(df, agora)
         tipo = "PEDIDOS"
+    elif perfil is not None and ('produtos' in filename.lower() or 'products' in filename.lower()):
+        df_final = perfil.apply('products', df)
+        tipo = "PRODUTOS"
     else:
         df_final = df
         tipo = "GENÉRICO"
-        print("   ℹ️ Nenhum validador específico encontrado. Apenas conversão de data aplicada.")
 
-    # 4. Salvar
-    output_name = f"refined_{filename}"
-    save_path = os.path.join(REFINED_DIR, output_name)
-    df_final.to_csv(save_path, index=False)
-    print(f"   💾 [{tipo}] Salvo com sucesso em: {save_path}\n")
+    # Resumo das regras de qualidade (pedidos e itens recebem dq_flags nas validações)
+    if dq is not None and FLAGS_COLUMN in df_final.columns:
+        merge_summaries(dq, summarize(entidade, df_final[FLAGS_COLUMN].to_numpy()))
+
+    # Segunda passada do perfil (floats sem nulos)
+    if final:
+        df_final = compactar_dtypes(entidade, df_final, final=True, relatorio=economia)
+    return df_final, tipo
+
+
+def _tipo_comum(kinds):
+    # Mesmo dtype que o read_csv do arquivo inteiro inferiria a partir dos chunks
+    if kinds <= {'i'}:
+        return 'int64'
+    if kinds <= {'b'}:
+        return 'bool'
+    if kinds <= {'i', 'u', 'f'}:
+        return 'float64'
+    return 'object'
+
+
+def primeira_passada(file_path, entidade, chunksize, ajuste, dedup=None):
+    """
+    Passada de leitura (sem transformar) do modo em chunks. Fixa os dtypes das
+    colunas para o arquivo inteiro, para que todos os chunks sejam lidos e
+    escritos como na leitura de uma vez só. Com `ajuste`, também calcula as
+    estatísticas globais (medianas/IQR):
+      - 'exact': guarda só as colunas numéricas do perfil e ajusta com StatsProfile.fit
+        (mesmo resultado da execução sem chunks);
+      - 'sketch': sketches KLL por coluna, memória constante (aproximado).
+    Com `dedup`, guarda o hash de 64 bits da chave primária de cada linha (8 bytes
+    por linha) e devolve a máscara global das linhas mantidas (None = nenhuma repetida).
+    """
+    kinds = {}
+    colunas_perfil = PROFILE_COLUMNS.get(entidade, []) if ajuste else []
+    partes = []
+    fitter = SketchProfileFitter() if ajuste == 'sketch' else None
+    hashes, ordens = [], []
+
+    for chunk in pd.read_csv(file_path, chunksize=chunksize):
+        for col, dtype in chunk.dtypes.items():
+            kinds.setdefault(col, set()).add(dtype.kind)
+        if dedup and has_primary_key(entidade, chunk):
+            hashes.append(text_key_hashes(entidade, chunk))
+            if dedup == 'newest':
+                ordens.append(newest_order(entidade, chunk))
+        if fitter is not None:
+            # Sketches não têm como descontar linhas depois: as duplicatas entram no ajuste
+            fitter.update(entidade, chunk)
+        elif colunas_perfil:
+            partes.append(chunk[[col for col in colunas_perfil if col in chunk.columns]])
+
+    manter = None
+    if hashes:
+        ordem = np.concatenate(ordens) if ordens and all(o is not None for o in ordens) else None
+        manter = keep_mask(np.concatenate(hashes), dedup, ordem)
+        if manter.all():
+            manter = None
+
+    dtypes = {col: _tipo_comum(k) for col, k in kinds.items()}
+    if fitter is not None:
+        perfil = fitter.profile()
+    elif colunas_perfil and partes:
+        df_perfil = pd.concat(partes, ignore_index=True)
+        perfil = StatsProfile.fit({entidade: df_perfil if manter is None else df_perfil[manter]})
+    else:
+        perfil = None
+    return dtypes, perfil, manter
+
+
+def mesclar_refinado(save_path, tmp_path, df_delta, chaves_alteradas, entidade):
+    """
+    Upsert no CSV refinado: copia as linhas antigas (como texto, sem reformatar)
+    exceto as das chaves alteradas e anexa o delta já transformado.
+    Devolve False se as colunas mudaram (aí o arquivo precisa ser refeito inteiro).
+    """
+    antigo = pd.read_csv(save_path, dtype=str, keep_default_na=False)
+    if list(antigo.columns) != list(df_delta.columns):
+        return False
+    if chaves_alteradas:
+        antigo = antigo[~primary_keys(entidade, antigo).isin(chaves_alteradas).to_numpy()]
+    antigo.to_csv(tmp_path, index=False)
+    df_delta.to_csv(tmp_path, mode='a', header=False, index=False)
+    return True
+
+
+def processar_arquivo(file_path, save_path, perfil=None, sha=None, chunksize=None, ajuste=None, store=None,
+                      estado=None, mesclar=False, dedup=None):
+    filename = os.path.basename(file_path)
+    inicio = time.perf_counter()
+    # Arquivo novo: o hash do manifesto é calculado aqui, em paralelo
+    sha = sha or hash_arquivo(file_path)
+    entidade = entidade_do_arquivo(filename)
+    economia = {}
+    tmp_path = f"{save_path}.tmp"
+    # Regras de qualidade: o mesmo "agora" em todos os chunks, resumo somado por arquivo
+    agora = pd.Timestamp.now(tz='UTC')
+    dq = {}
+
+    # Refined store Parquet (opcional): a origem é o nome do arquivo, então
+    # reprocessar o mesmo arquivo substitui as partições gravadas antes
+    entidade_store = 'order_items' if entidade == 'items' else entidade
+    origem = os.path.splitext(filename)[0]
+    execucao = None
+    incremental = False
+    duplicatas = 0
+
+    def gravar_store(df_final):
+        nonlocal execucao
+        if store is not None and entidade_store is not None:
+            execucao = store.write(entidade_store, df_final, source=origem, run_id=execucao)
+
+    if chunksize:
+        # Modo out-of-core: memória limitada ao tamanho do chunk, saída anexada aos poucos
+        dtypes, perfil_arquivo, manter = primeira_passada(
+            file_path, entidade, chunksize, None if perfil else ajuste, dedup
+        )
+        perfil = perfil or perfil_arquivo
+        duplicatas = 0 if manter is None else int((~manter).sum())
+        linhas, tipo = 0, "GENÉRICO"
+        for i, chunk in enumerate(pd.read_csv(file_path, chunksize=chunksize, dtype=dtypes)):
+            inicio_chunk = linhas
+            linhas += len(chunk)
+            if manter is not None:
+                chunk = chunk[manter[inicio_chunk:linhas]]
+            # final=False: floats mantêm o dtype do arquivo inteiro (o texto do CSV não muda por chunk)
+            df_final, tipo = transformar(chunk, filename, entidade, perfil, economia, final=False,
+                                         agora=agora, dq=dq)
+            df_final.to_csv(tmp_path, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+            gravar_store(df_final)
+        if linhas == 0:
+            pd.read_csv(file_path, nrows=0).to_csv(tmp_path, index=False)
+    else:
+        # 1. Carregar
+        df = pd.read_csv(file_path)
+        linhas = len(df)
+        if dedup and entidade is not None:
+            # 1a. Chaves primárias repetidas saem antes de tudo (perfil, incremental, limpeza)
+            df, contagem = deduplicate(entidade, df, dedup)
+            duplicatas = contagem['duplicates'] if contagem else 0
+        if perfil is None and ajuste and entidade in PROFILE_COLUMNS and linhas:
+            # Ajustado sobre o arquivo inteiro, também no modo incremental
+            perfil = StatsProfile.fit({entidade: df})
+
+        # 1b. Incremental: hash por chave primária contra o estado da execução anterior
+        incremental = estado is not None and entidade is not None and has_primary_key(entidade, df)
+        if incremental:
+            chaves, hashes = primary_keys(entidade, df), row_hashes(df)
+        if incremental and mesclar:
+            status = estado.diff(entidade, chaves, hashes)
+            pendentes = np.flatnonzero(status != UNCHANGED)
+            alterados = chaves[status == CHANGED]
+            # take() mantém os dtypes do arquivo inteiro: o texto do delta sai igual ao de uma carga completa
+            df_final, tipo = transformar(df.take(pendentes), filename, entidade, perfil, economia,
+                                         agora=agora, dq=dq)
+            if mesclar_refinado(save_path, tmp_path, df_final, set(alterados), entidade):
+                if store is not None and entidade_store is not None:
+                    # Upsert no store: nada de prune, a origem acumula as execuções incrementais
+                    store.upsert(entidade_store, df_final, PRIMARY_KEYS[entidade], alterados.tolist(), source=origem)
+                os.replace(tmp_path, save_path)
+                estado.commit(entidade, chaves.iloc[pendentes], hashes[pendentes])
+                return {
+                    'tipo': tipo,
+                    'entidade': entidade,
+                    'linhas': linhas,
+                    'delta': len(pendentes),
+                    'duplicatas': duplicatas,
+                    'dq': dq,
+                    'segundos': time.perf_counter() - inicio,
+                    'economia_bytes': sum(economia.values()),
+                    'sha256': sha,
+                    'incremental': True,
+                }
+            print(f"⚠️  {filename}: colunas mudaram desde a última execução, refazendo o arquivo inteiro.")
+
+        df_final, tipo = transformar(df, filename, entidade, perfil, economia, agora=agora, dq=dq)
+        df_final.to_csv(tmp_path, index=False)
+        gravar_store(df_final)
+
+    # 4. Salvar (atômico: grava ao lado e renomeia)
+    os.replace(tmp_path, save_path)
+    if store is not None and entidade_store is not None:
+        # Sem execução (arquivo vazio) remove tudo o que a origem tinha gravado
+        store.prune(entidade_store, origem, execucao or "")
+    if incremental:
+        # Carga completa: o estado passa a refletir o arquivo inteiro (e só ele)
+        estado.commit(entidade, chaves, hashes, replace=True)
+
+    return {
+        'tipo': tipo,
+        'entidade': entidade,
+        'linhas': linhas,
+        'delta': linhas,
+        'duplicatas': duplicatas,
+        'dq': dq,
+        'segundos': time.perf_counter() - inicio,
+        'economia_bytes': sum(economia.values()),
+        'sha256': sha,
+        'incremental': incremental,
+    }
+
+
+# ==============================================================================
+# PARTE 4: EXECUÇÃO DO PIPELINE (Baseada na Célula 3 do Colab)
+# ==============================================================================
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1),
+                        help="processos em paralelo (1 = sequencial)")
+    parser.add_argument("--force", action="store_true", help="reprocessa tudo, ignorando o manifesto")
+    parser.add_argument("--base-dir", default=None, help="raiz do projeto (padrão: diretório atual)")
+    parser.add_argument("--chunksize", type=int, default=0,
+                        help="linhas por chunk (modo out-of-core, memória limitada); 0 = arquivo inteiro")
+    parser.add_argument("--fit-stats", choices=["exact", "sketch"], default=None,
+                        help="sem ETL_STATS_PROFILE_PATH, ajusta medianas/IQR por arquivo "
+                             "(em chunks: 'exact' = duas passadas, 'sketch' = sketches KLL aproximados)")
+    parser.add_argument("--dedup", choices=[*DEDUP_POLICIES, "off"],
+                        default=os.getenv("ETL_DEDUP_POLICY", DEFAULT_DEDUP_POLICY),
+                        help="chaves primárias repetidas: mantém a primeira, a última ou a mais recente "
+                             "(padrão: ETL_DEDUP_POLICY, desligado se não definida)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="nos arquivos alterados, limpa só as linhas novas/alteradas (hash por chave primária)")
+    args = parser.parse_args()
+
+    print("🔄 INICIANDO CONFIGURAÇÃO DE AMBIENTE LOCAL...")
+    raw_dir, refined_dir = configurar_pastas(args.base_dir)
+    print(f"✅ Pastas configuradas: \n - {raw_dir} \n - {refined_dir}")
+
+    # Perfil estatístico ajustado (opcional): mesmas medianas/limites IQR da API
+    perfil_path = os.getenv("ETL_STATS_PROFILE_PATH")
+    perfil = StatsProfile.load(perfil_path) if perfil_path and os.path.exists(perfil_path) else None
+    if perfil is not None:
+        print(f"📐 Perfil estatístico carregado: {perfil_path} (versão {perfil.version})")
+    # Refined store Parquet (ETL_REFINED_STORE_PATH), além dos CSVs
+    store = refined_store_from_env()
+    if store is not None:
+        print(f"🗄️  Refined store Parquet: {store.root}")
+
+    # Estado incremental (hash por chave primária), compartilhado pelos processos do pool
+    estado = None
+    if args.incremental and args.chunksize:
+        print("⚠️  --incremental só vale no modo arquivo inteiro: ignorado com --chunksize.")
+    elif args.incremental:
+        estado = IncrementalStateStore(
+            os.getenv("ETL_INCREMENTAL_STATE_PATH") or os.path.join(refined_dir, INCREMENTAL_STATE_NAME)
+        )
+        print(f"🧮 Estado incremental: {estado.path}")
+
+    # A configuração entra no manifesto: mudar de perfil, de modo de ajuste, de regras
+    # de qualidade ou ligar o refined store reprocessa tudo
+    if perfil is not None:
+        versao_perfil = perfil.version
+    elif args.fit_stats:
+        versao_perfil = f"ajuste-por-arquivo:{args.fit_stats if args.chunksize else 'exact'}"
+    else:
+        versao_perfil = None
+    dedup = None if args.dedup == "off" else args.dedup
+    config = {
+        'perfil': versao_perfil,
+        'store': store.root if store is not None else None,
+        'dedup': dedup,
+        'regras_dq': rules_version(),
+    }
+
+    # Pega todos os CSVs na pasta processed
+    files = sorted(glob.glob(os.path.join(raw_dir, '*.csv')))
+    print(f"\n🚀 INICIANDO PIPELINE PARA {len(files)} ARQUIVOS ENCONTRADOS EM 'data/processed'...\n")
+
+    if not files:
+        print("⚠️  AVISO: Nenhum arquivo .csv encontrado na pasta 'data/processed'.")
+        print("👉 Certifique-se de colocar seus arquivos csv dentro de PTA-ENGENHARIA-DE-DADOS/data/processed")
+        return
+
+    manifest_path = os.path.join(refined_dir, MANIFEST_NAME)
+    manifesto = {} if args.force else carregar_manifesto(manifest_path)
+
+    # Só entram no pool os arquivos novos ou alterados
+    pendentes = {}
+    for file_path in files:
+        filename = os.path.basename(file_path)
+        save_path = os.path.join(refined_dir, f"refined_{filename}")
+        precisa, sha, stat = precisa_processar(file_path, save_path, manifesto.get(filename), config)
+        if not precisa:
+            # Mesmo conteúdo: só atualiza o mtime registrado
+            manifesto[filename].update(mtime=stat.st_mtime, tamanho=stat.st_size)
+            print(f"⏭️  {filename}: sem alterações desde a última execução.")
+            continue
+        # Upsert só se a saída atual foi gerada com o estado e na mesma configuração
+        registro = manifesto.get(filename) or {}
+        mesclar = (
+            estado is not None and registro.get('incremental', False)
+            and registro.get('config') == config and os.path.exists(save_path)
+        )
+        pendentes[filename] = (file_path, save_path, sha, stat, mesclar)
+
+    inicio = time.perf_counter()
+    total_linhas = 0
+    falhas = 0
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        futures = {
+            pool.submit(
+                processar_arquivo, file_path, save_path, perfil, sha, args.chunksize, args.fit_stats, store,
+                estado, mesclar, dedup
+            ): filename
+            for filename, (file_path, save_path, sha, _, mesclar) in pendentes.items()
+        }
+        for future in as_completed(futures):
+            filename = futures[future]
+            _, save_path, _, stat, mesclar = pendentes[filename]
+            try:
+                res = future.result()
+            except Exception as e:
+                falhas += 1
+                print(f"❌ Erro ao processar {filename}: {e}")
+                continue
+
+            total_linhas += res['linhas']
+            taxa = res['linhas'] / res['segundos'] if res['segundos'] > 0 else float('inf')
+            print(f"📄 [{res['tipo']}] {filename}: {res['linhas']} linhas em {res['segundos']:.2f}s ({taxa:,.0f} linhas/s)")
+            if res['duplicatas']:
+                print(f"   🧹 {res['duplicatas']} linhas com chave primária repetida descartadas (política '{dedup}')")
+            violacoes = {regra: n for regra, n in res['dq'].items() if regra != 'linhas' and n}
+            if violacoes:
+                print(f"   🧪 Regras de qualidade ({'delta' if mesclar else 'arquivo'}): {violacoes}")
+            if mesclar:
+                print(f"   🧮 Incremental: {res['delta']} linhas novas/alteradas mescladas no refinado")
+            if res['economia_bytes']:
+                print(f"   📉 Perfil de dtypes ({res['entidade']}): {res['economia_bytes'] / 2**20:.2f} MB economizados em memória")
+            print(f"   💾 Salvo com sucesso em: {save_path}")
+
+            manifesto[filename] = {
+                'sha256': res['sha256'],
+                'mtime': stat.st_mtime,
+                'tamanho': stat.st_size,
+                'linhas': res['linhas'],
+                'config': config,
+                'saida': os.path.basename(save_path),
+                'incremental': res['incremental'],
+            }
+            # Grava a cada arquivo concluído: uma falha no meio não perde o progresso
+            salvar_manifesto(manifest_path, manifesto)
+
+    salvar_manifesto(manifest_path, manifesto)
+    duracao = time.perf_counter() - inicio
+    pulados = len(files) - len(pendentes)
+    taxa_total = total_linhas / duracao if duracao > 0 else 0.0
+    print(f"\n📊 {len(pendentes) - falhas} processados, {pulados} pulados, {falhas} com erro.")
+    print(f"   ⏱️ {total_linhas} linhas em {duracao:.2f}s ({taxa_total:,.0f} linhas/s no total)")
+    print("🏁 PIPELINE CONCLUÍDO.")
+
 
-print("🏁 PIPELINE CONCLUÍDO.")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,8 @@
+import logging
+
 import pandas as pd
-import numpy as np
+
+logger = logging.getLogger("pta-etl-api.outliers")
 
 def tratar_outliers_iqr(df, coluna, fator_iqr=1.5, metodo='capping'):
 
@@ -23,9 +26,8 @@ def tratar_outliers_iqr(df, coluna, fator_iqr=1.5, metodo='capping'):
             print(f"AVISO: Limites IQR NaN/Inf para coluna '{coluna}'. Retornando sem tratamento de Outliers")
             return df
 
-        df[coluna] = np.where(df[coluna] < limite_inferior, limite_inferior, df[coluna])
-        df[coluna] = np.where(df[coluna] > limite_superior, limite_superior, df[coluna])
-        
+        # Uma única passada aplica os dois limites (NaN continua NaN)
+        df[coluna] = df[coluna].clip(lower=limite_inferior, upper=limite_superior)
         return df
     
     elif metodo == 'remover':
@@ -36,4 +38,54 @@ def tratar_outliers_iqr(df, coluna, fator_iqr=1.5, metodo='capping'):
         ].copy()
         return df_tratado
     else:
-        raise ValueError("Método inválido. Use 'capping' ou 'remover'.")
\ No newline at end of file
+        raise ValueError("Método inválido. Use 'capping' ou 'remover'.")
+
+def calcular_limites_iqr(df, colunas, fator_iqr=1.5):
+    """
+    Calcula Q1/Q3 de todas as colunas em uma única chamada vetorizada de quantile().
+    Retorna (limites_inferiores, limites_superiores) como Series indexadas por coluna.
+    """
+    quartis = df[colunas].quantile([0.25, 0.75])
+    Q1, Q3 = quartis.loc[0.25], quartis.loc[0.75]
+    IQR = Q3 - Q1
+    return Q1 - fator_iqr * IQR, Q3 + fator_iqr * IQR
+
+
+def limites_iqr_de_sketches(sketches, fator_iqr=1.5):
+    """
+    Limites IQR a partir de sketches de quantis ({coluna: KLLSketch}), para
+    execuções em chunks ou em vários workers sem manter a coluna inteira em memória.
+    """
+    Q1 = pd.Series({coluna: sketch.quantile(0.25) for coluna, sketch in sketches.items()}, dtype=float)
+    Q3 = pd.Series({coluna: sketch.quantile(0.75) for coluna, sketch in sketches.items()}, dtype=float)
+    IQR = Q3 - Q1
+    return Q1 - fator_iqr * IQR, Q3 + fator_iqr * IQR
+
+
+def tratar_outliers_iqr_lote(df, colunas, fator_iqr=1.5, limites=None):
+    """
+    Capping IQR em lote: calcula os limites de todas as colunas de uma vez (ou
+    usa `limites` já calculados, ex. de sketches) e aplica os dois limites em um
+    único clip por coluna, alterando df no lugar. Mesmo resultado que chamar
+    tratar_outliers_iqr(df, coluna, metodo='capping') para cada coluna.
+    """
+    colunas = [coluna for coluna in colunas if coluna in df.columns]
+    if not colunas:
+        return df
+
+    if limites is None:
+        # REGRA DE SEGURANÇA: não trata DF muito pequeno
+        if len(df) < 3:
+            logger.warning("DataFrame muito pequeno para colunas %s", colunas)
+            return df
+        limites = calcular_limites_iqr(df, colunas, fator_iqr)
+
+    limite_inferior, limite_superior = limites
+    for coluna in colunas:
+        inferior, superior = limite_inferior.get(coluna), limite_superior.get(coluna)
+        if inferior is None or superior is None or pd.isna(inferior) or pd.isna(superior):
+            logger.warning("Limites IQR NaN/Inf para coluna '%s'. Coluna sem tratamento de outliers", coluna)
+            continue
+        df[coluna] = df[coluna].clip(lower=inferior, upper=superior)
+
+    return df
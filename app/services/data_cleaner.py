@@ -1,51 +1,96 @@
 import pandas as pd
 import numpy as np
+from typing import Optional, TYPE_CHECKING
+
+from app.services.date_parser import parse_datetime_columns
+
+if TYPE_CHECKING:
+    from app.services.stats_profile import StatsProfile
 
 # ==========================================================
 # CLEANERS — Funções soltas (agora compatíveis com o ETLProcessor)
 # ==========================================================
-
-def limpar_pedidos(df: pd.DataFrame) -> pd.DataFrame:
-    df_clean = df.copy()
-
+# Modelo de posse: as funções *_inplace assumem que o chamador é dono do
+# DataFrame e o alteram no lugar (usadas pelo ETLProcessor, que constrói os
+# frames). As funções sem sufixo são wrappers finos que copiam antes, para
+# chamadores externos que precisam preservar o original.
+#
+# Todas aceitam `perfil` (StatsProfile): com ele, as medianas de imputação vêm do
+# perfil ajustado em vez de serem recalculadas sobre o lote recebido. Os passos
+# são os mesmos com ou sem perfil: estes cleaners não convertem tipos nem fazem
+# capping IQR (os limites do perfil só valem no pipeline batch, em
+# data_normalization, que aplica o capping também sem perfil). As versões
+# in-place aceitam também `grupo`: coluna que separa lotes independentes dentro
+# do mesmo frame (endpoint em lote), com as medianas calculadas por grupo.
+
+def limpar_pedidos_inplace(
+    df: pd.DataFrame, perfil: Optional["StatsProfile"] = None, grupo: Optional[str] = None
+) -> pd.DataFrame:
     date_cols = [
         'order_purchase_timestamp', 'order_approved_at',
         'order_delivered_carrier_date', 'order_delivered_customer_date',
         'order_estimated_delivery_date'
     ]
 
-    for col in date_cols:
-        if col in df_clean.columns:
-            df_clean[col] = pd.to_datetime(df_clean[col], errors='coerce')
+    # Em lote, cada payload tem o formato de data (e o fuso) detectado à parte
+    parse_datetime_columns(df, date_cols, groups=df[grupo] if grupo is not None else None)
+    return df
 
-    return df_clean
 
-
-def limpar_produtos(df: pd.DataFrame) -> pd.DataFrame:
-    df_clean = df.copy()
-
-    if 'product_category_name' in df_clean.columns:
-        df_clean['product_category_name'] = df_clean['product_category_name'].fillna('outros')
+def limpar_produtos_inplace(
+    df: pd.DataFrame, perfil: Optional["StatsProfile"] = None, grupo: Optional[str] = None
+) -> pd.DataFrame:
+    if 'product_category_name' in df.columns:
+        categoria = df['product_category_name']
+        # Com perfil de dtypes a coluna já chega categórica: 'outros' precisa existir
+        if isinstance(categoria.dtype, pd.CategoricalDtype) and 'outros' not in categoria.cat.categories:
+            categoria = categoria.cat.add_categories('outros')
+        df['product_category_name'] = categoria.fillna('outros')
 
     cols_zero = ['product_name_lenght', 'product_description_lenght', 'product_photos_qty']
     for col in cols_zero:
-        if col in df_clean.columns:
-            df_clean[col] = df_clean[col].fillna(0)
+        if col in df.columns:
+            df[col] = df[col].fillna(0)
+
+    if perfil is not None:
+        return perfil.fill_medians('products', df)
 
     cols_dims = ['product_weight_g', 'product_length_cm', 'product_height_cm', 'product_width_cm']
     for col in cols_dims:
-        if col in df_clean.columns:
-            df_clean[col] = df_clean[col].fillna(df_clean[col].median())
+        if col in df.columns:
+            mediana = df[col].median() if grupo is None else df.groupby(grupo, sort=False)[col].transform('median')
+            df[col] = df[col].fillna(mediana)
+
+    return df
+
+
+def limpar_itens_inplace(
+    df: pd.DataFrame, perfil: Optional["StatsProfile"] = None, grupo: Optional[str] = None
+) -> pd.DataFrame:
+    # Itens não têm imputação na API (nem com perfil)
+    return df
+
+
+def limpar_vendedores_inplace(
+    df: pd.DataFrame, perfil: Optional["StatsProfile"] = None, grupo: Optional[str] = None
+) -> pd.DataFrame:
+    return df
+
+
+def limpar_pedidos(df: pd.DataFrame, perfil: Optional["StatsProfile"] = None) -> pd.DataFrame:
+    return limpar_pedidos_inplace(df.copy(), perfil)
+
 
-    return df_clean
+def limpar_produtos(df: pd.DataFrame, perfil: Optional["StatsProfile"] = None) -> pd.DataFrame:
+    return limpar_produtos_inplace(df.copy(), perfil)
 
 
-def limpar_itens(df: pd.DataFrame) -> pd.DataFrame:
-    return df.copy()
+def limpar_itens(df: pd.DataFrame, perfil: Optional["StatsProfile"] = None) -> pd.DataFrame:
+    return limpar_itens_inplace(df.copy(), perfil)
 
 
-def limpar_vendedores(df: pd.DataFrame) -> pd.DataFrame:
-    return df.copy()
+def limpar_vendedores(df: pd.DataFrame, perfil: Optional["StatsProfile"] = None) -> pd.DataFrame:
+    return limpar_vendedores_inplace(df.copy(), perfil)
 
 
 # Função opcional caso você precise sanitizar para JSON
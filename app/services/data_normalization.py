@@ -1,6 +1,15 @@
 import pandas as pd
 import numpy as np
-from app.services.adjust_outliers import tratar_outliers_iqr
+from typing import Optional, TYPE_CHECKING
+from app.services.adjust_outliers import tratar_outliers_iqr_lote
+from app.services.date_parser import parse_datetime_columns
+from app.services.dq_rules import apply_rules
+from app.services.string_transform import (
+    normalizar_categoria, normalizar_cidade, normalizar_maiusculas, transformar_categorias
+)
+
+if TYPE_CHECKING:
+    from app.services.stats_profile import StatsProfile
 
 # Dicionário de tradução de status conforme requisito
 MAPA_STATUS_PEDIDOS = {
@@ -15,11 +24,46 @@ MAPA_STATUS_PEDIDOS = {
 }
 
 
-def limpar_pedidos(df: pd.DataFrame) -> pd.DataFrame:
+CATEGORIAS_PRAZO = ['Sim', 'Não', 'Não Entregue']
+
+
+def classificar_prazo_entrega(data_entrega: pd.Series, data_estimada: pd.Series) -> pd.Series:
+    """
+    Classifica cada pedido em 'Sim', 'Não' ou 'Não Entregue' com máscaras vetorizadas:
+      1. entrega real nula/NaT            -> 'Não Entregue'
+      2. entrega ocorreu, estimada nula   -> 'Não'
+      3. ambas válidas                    -> 'Sim' se entrega <= estimada, senão 'Não'
+    """
+    nao_entregue = data_entrega.isna().to_numpy()
+    no_prazo = (data_entrega <= data_estimada).to_numpy()  # False se qualquer lado é NaT
+
+    codigos = np.where(nao_entregue, 2, np.where(no_prazo, 0, 1))
+    return pd.Series(
+        pd.Categorical.from_codes(codigos, categories=CATEGORIAS_PRAZO),
+        index=data_entrega.index
+    )
+
+
+def _imputar_e_tratar_outliers(df: pd.DataFrame, colunas: list) -> pd.DataFrame:
+    """Converte para numérico, imputa a mediana e aplica o capping IQR em lote (in-place)."""
+    colunas = [col for col in colunas if col in df.columns]
+    if not colunas:
+        return df
+
+    for col in colunas:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+
+    # CORREÇÃO: REGRA DE SEGURANÇA para mediana (evita NaN no fillna)
+    medianas = pd.Series({col: df[col].median() for col in colunas}, dtype=float).fillna(0)
+    df[colunas] = df[colunas].fillna(medianas)
+
+    # Q1/Q3 de todas as colunas em uma chamada; um clip por coluna
+    return tratar_outliers_iqr_lote(df, colunas)
+
+
+def limpar_pedidos_inplace(df: pd.DataFrame) -> pd.DataFrame:
     if df.empty:
         return df
-    
-    df = df.copy()
 
     # 1. Conversão de Datas
     cols_datas = [
@@ -27,17 +71,10 @@ def limpar_pedidos(df: pd.DataFrame) -> pd.DataFrame:
         'order_delivered_carrier_date', 'order_delivered_customer_date', 
         'order_estimated_delivery_date'
     ]
-    for col in cols_datas:
-        if col in df.columns:
-            df[col] = pd.to_datetime(df[col], errors='coerce', utc=True)
+    parse_datetime_columns(df, cols_datas, utc=True)
             
-    # Validação de Regras de Negócio (Colunas DQ - Comentadas na análise de erro, mas mantidas)
-    if 'order_delivered_customer_date' in df.columns and 'order_purchase_timestamp' in df.columns:
-        df['dq_erro_cronologia'] = df['order_delivered_customer_date'] < df['order_purchase_timestamp']
-    
-    if 'order_purchase_timestamp' in df.columns:
-        now_utc = pd.Timestamp.now(tz='UTC')
-        df['dq_erro_futuro'] = df['order_purchase_timestamp'] > now_utc
+    # Validação de Regras de Negócio (todas as regras de pedidos na coluna dq_flags)
+    apply_rules('orders', df)
 
     # 2. Tradução de Status
     if 'order_status' in df.columns:
@@ -53,84 +90,56 @@ def limpar_pedidos(df: pd.DataFrame) -> pd.DataFrame:
         df['tempo_entrega_estimado_dias'] = (df['order_estimated_delivery_date'] - df['order_purchase_timestamp']).dt.days
 
     # Lógica Estrita do Desafio: Sim, Não, Não Entregue (CORREÇÃO DE LÓGICA DE NULL)
-    def verificar_prazo(row):
-        data_entrega = row.get('order_delivered_customer_date')
-        data_estimada = row.get('order_estimated_delivery_date')
-
-        # 1. Se a data de entrega real é nula/NaT
-        if pd.isnull(data_entrega):
-            return 'Não Entregue'
-
-        # 2. Se a entrega ocorreu, mas a data estimada é nula
-        if pd.isnull(data_estimada):
-            return 'Não'
-        
-        # 3. Faz a comparação APENAS se ambas as datas são válidas
-        if data_entrega <= data_estimada:
-            return 'Sim'
-        else:
-            return 'Não'
-
     if 'order_delivered_customer_date' in df.columns and 'order_estimated_delivery_date' in df.columns:
-        df['entrega_no_prazo'] = df.apply(verificar_prazo, axis=1)
+        df['entrega_no_prazo'] = classificar_prazo_entrega(
+            df['order_delivered_customer_date'], df['order_estimated_delivery_date']
+        )
 
     return df
 
 
-def limpar_produtos(df: pd.DataFrame) -> pd.DataFrame:
+def limpar_produtos_inplace(df: pd.DataFrame, perfil: Optional["StatsProfile"] = None) -> pd.DataFrame:
     if df.empty:
         return df
-        
-    df = df.copy()
 
-    # 1. Categoria (Texto)
+    # 1. Categoria (Texto) — transformada só nos valores distintos, saída categórica
     if 'product_category_name' in df.columns:
-        df['product_category_name'] = (
-            df['product_category_name']
-            .astype(str).str.lower().str.strip()
-            .str.replace(' ', '_')
-            .replace(['nan', 'none', ''], 'indefinido')
-        )
+        df['product_category_name'] = transformar_categorias(df['product_category_name'], normalizar_categoria)
 
     # 2. Estatística (Mediana e Outliers)
-    cols_dims = ['product_weight_g', 'product_length_cm', 'product_height_cm', 'product_width_cm']
-    for col in cols_dims:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors='coerce')
-
-            # CORREÇÃO: REGRA DE SEGURANÇA para mediana (evita NaN no fillna)
-            mediana = df[col].median()
-            mediana_segura = mediana if not pd.isna(mediana) else 0
-
-            df[col] = df[col].fillna(mediana_segura)
-            df = tratar_outliers_iqr(df, col, metodo='capping')
+    # Com perfil ajustado: medianas e limites IQR fixos (só fillna + clip)
+    if perfil is not None:
+        return perfil.apply('products', df)
 
-    return df
+    cols_dims = ['product_weight_g', 'product_length_cm', 'product_height_cm', 'product_width_cm']
+    return _imputar_e_tratar_outliers(df, cols_dims)
 
 
-def limpar_itens(df: pd.DataFrame) -> pd.DataFrame:
+def limpar_itens_inplace(df: pd.DataFrame, perfil: Optional["StatsProfile"] = None) -> pd.DataFrame:
     if df.empty:
         return df
-        
-    df = df.copy()
-    
+
     # Datas
-    if 'shipping_limit_date' in df.columns:
-        df['shipping_limit_date'] = pd.to_datetime(df['shipping_limit_date'], errors='coerce', utc=True)
+    parse_datetime_columns(df, ['shipping_limit_date'], utc=True)
         
     # Estatística
-    for col in ['price', 'freight_value']:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors='coerce')
+    if perfil is not None:
+        return perfil.apply('items', df)
+    return _imputar_e_tratar_outliers(df, ['price', 'freight_value'])
 
-            # CORREÇÃO: REGRA DE SEGURANÇA para mediana (evita NaN no fillna)
-            mediana = df[col].median()
-            mediana_segura = mediana if not pd.isna(mediana) else 0
 
-            df[col] = df[col].fillna(mediana_segura)
-            df = tratar_outliers_iqr(df, col, metodo='capping')
-            
-    return df
+# Wrappers que copiam: preservam o DataFrame do chamador (as versões *_inplace
+# alteram o frame recebido e são usadas quando o pipeline é dono dele)
+def limpar_pedidos(df: pd.DataFrame) -> pd.DataFrame:
+    return df if df.empty else limpar_pedidos_inplace(df.copy())
+
+
+def limpar_produtos(df: pd.DataFrame, perfil: Optional["StatsProfile"] = None) -> pd.DataFrame:
+    return df if df.empty else limpar_produtos_inplace(df.copy(), perfil)
+
+
+def limpar_itens(df: pd.DataFrame, perfil: Optional["StatsProfile"] = None) -> pd.DataFrame:
+    return df if df.empty else limpar_itens_inplace(df.copy(), perfil)
 
 
 # Wrappers para compatibilidade
@@ -140,24 +149,20 @@ def olist_order_items_dataset(df): return limpar_itens(df)
 
 
 def olist_sellers_dataset(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
+    return olist_sellers_dataset_inplace(df.copy())
+
 
+def olist_sellers_dataset_inplace(df: pd.DataFrame) -> pd.DataFrame:
     # 1. Garantia de Tipos (String)
-    columns_str = ['seller_id', 'seller_zip_code_prefix', 'seller_city', 'seller_state']
-    
+    columns_str = ['seller_id', 'seller_zip_code_prefix']
+
     for col in columns_str:
         df[col] = df[col].astype(str)
 
-    # 2. Regra: Remover Acentos (Normalização) da Cidade
-    df['seller_city'] = (
-        df['seller_city']
-        .str.normalize('NFKD')
-        .str.encode('ascii', errors='ignore')
-        .str.decode('utf-8')
-    )
-
-    # 3. Regra: Uppercase
-    df['seller_city'] = df['seller_city'].str.upper().str.strip()
-    df['seller_state'] = df['seller_state'].str.upper().str.strip()
+    # 2. Regra: Remover Acentos (Normalização) da Cidade + Uppercase
+    # Cidade e UF têm baixa cardinalidade: a transformação roda uma vez por
+    # valor distinto (com cache entre requisições) e a saída é categórica
+    df['seller_city'] = transformar_categorias(df['seller_city'], normalizar_cidade)
+    df['seller_state'] = transformar_categorias(df['seller_state'], normalizar_maiusculas)
 
     return df
\ No newline at end of file
@@ -0,0 +1,95 @@
+import warnings
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.api import guess_datetime_format
+
+# Colunas temporais conhecidas das entidades Olist (fonte única para todos os módulos)
+DATE_COLUMNS = [
+    'order_purchase_timestamp', 'order_approved_at',
+    'order_delivered_carrier_date', 'order_delivered_customer_date',
+    'order_estimated_delivery_date', 'shipping_limit_date'
+]
+
+
+def _parse_unique(uniques: pd.Index, fmt: Optional[str], utc: bool) -> pd.Series:
+    if fmt is None:
+        # Sem formato detectável: caminho lento (dateutil), como pd.to_datetime faria
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", UserWarning)
+            return pd.Series(pd.to_datetime(uniques, errors='coerce', utc=utc))
+
+    # Valores que não casam com o formato da coluna viram NaT, como no
+    # pd.to_datetime sem formato (que também fixa o formato do primeiro valor)
+    return pd.Series(pd.to_datetime(uniques, format=fmt, errors='coerce', utc=utc))
+
+
+def _parse_groups(serie: pd.Series, groups, utc: bool) -> pd.Series:
+    codes, _ = pd.factorize(np.asarray(groups))
+    order = np.argsort(codes, kind="stable")
+    bounds = np.flatnonzero(np.diff(codes[order])) + 1
+    parts = [parse_datetime(serie.iloc[positions], utc=utc) for positions in np.split(order, bounds)]
+    # Grupos com e sem fuso não cabem em um dtype só: a coluna vira object com os Timestamps
+    merged = pd.concat(parts)
+    return pd.Series(merged.array.take(np.argsort(order, kind="stable")), index=serie.index, name=serie.name)
+
+
+def parse_datetime(serie: pd.Series, utc: bool = False, groups=None) -> pd.Series:
+    """
+    Converte uma coluna para datetime (inválidos -> NaT), equivalente a
+    pd.to_datetime(serie, errors='coerce', utc=utc), porém:
+      - cada string distinta é convertida uma única vez e o resultado é
+        replicado para as linhas (timestamps Olist se repetem muito);
+      - o formato é detectado uma vez, a partir do primeiro valor não nulo, e as
+        strings são lidas com esse formato exato (caminho rápido); as que não
+        casam com ele viram NaT, como no pd.to_datetime;
+      - sem formato detectável, os valores distintos vão para o caminho lento
+        (dateutil).
+
+    `groups` (um rótulo por linha, ex.: o payload no endpoint em lote) separa
+    lotes independentes: cada grupo é convertido sozinho, com o próprio formato,
+    e o resultado é o mesmo de converter cada lote em separado.
+    """
+    if groups is not None and len(serie) and pd.Series(groups).nunique(dropna=False) > 1:
+        return _parse_groups(serie, groups, utc)
+
+    if pd.api.types.is_datetime64_any_dtype(serie.dtype) or not (
+        pd.api.types.is_object_dtype(serie.dtype) or pd.api.types.is_string_dtype(serie.dtype)
+    ):
+        return pd.to_datetime(serie, errors='coerce', utc=utc)
+
+    codes, uniques = pd.factorize(serie)
+    uniques = pd.Index(uniques, dtype=object)
+    if len(uniques) == 0:
+        return pd.to_datetime(serie, errors='coerce', utc=utc)
+
+    first = next((value for value in uniques if isinstance(value, str)), None)
+    fmt = guess_datetime_format(first) if first is not None else None
+    parsed_uniques = _parse_unique(uniques, fmt, utc)
+
+    # Código -1 (valor nulo) aponta para um NaT extra no fim
+    lookup = pd.concat([parsed_uniques, pd.Series([pd.NaT], dtype=parsed_uniques.dtype)], ignore_index=True)
+    codes = np.where(codes < 0, len(uniques), codes)
+    return pd.Series(lookup.array.take(codes), index=serie.index, name=serie.name)
+
+
+def parse_datetime_columns(
+    df: pd.DataFrame,
+    columns: Iterable[str] = DATE_COLUMNS,
+    utc: bool = False,
+    groups=None
+) -> Dict[str, int]:
+    """
+    Converte no lugar as colunas de data presentes em df e devolve, por coluna,
+    quantos valores não nulos viraram NaT (datas inválidas), contados uma única vez.
+    `groups` como em parse_datetime.
+    """
+    invalid = {}
+    for col in columns:
+        if col not in df.columns:
+            continue
+        original_notna = df[col].notna().to_numpy()
+        df[col] = parse_datetime(df[col], utc=utc, groups=groups)
+        invalid[col] = int((original_notna & df[col].isna().to_numpy()).sum())
+    return invalid
@@ -0,0 +1,206 @@
+import json
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.services.date_parser import parse_datetime
+from app.services.incremental import PRIMARY_KEYS, primary_keys
+
+logger = logging.getLogger("pta-etl-api.dedup")
+
+# Política de deduplicação por chave primária:
+#   first  -> mantém a primeira ocorrência de cada chave
+#   last   -> mantém a última (cargas posteriores são atualizações)
+#   newest -> mantém a linha com a data mais recente (empate: a última); entidades
+#             sem coluna de data usam 'last'
+DEDUP_POLICIES = ("first", "last", "newest")
+# Padrão de ETL_DEDUP_POLICY e do --dedup do run_etl.py: desligado. Descartar
+# linhas muda a resposta de quem já integra com a API, então o dedup é opt-in.
+DEFAULT_DEDUP_POLICY = "off"
+
+# Colunas de data que indicam a versão mais recente de uma linha (maior data
+# presente na linha). Nomes internos: 'items' = order_items.
+NEWEST_COLUMNS = {
+    "orders": [
+        "order_purchase_timestamp", "order_approved_at",
+        "order_delivered_carrier_date", "order_delivered_customer_date",
+    ],
+    "items": ["shipping_limit_date"],
+}
+
+
+def dedup_policy_from_env() -> Optional[str]:
+    """ETL_DEDUP_POLICY: first, last, newest ou off (padrão)."""
+    policy = os.getenv("ETL_DEDUP_POLICY", DEFAULT_DEDUP_POLICY).strip().lower()
+    if policy == "off":
+        return None
+    if policy not in DEDUP_POLICIES:
+        raise ValueError(f"ETL_DEDUP_POLICY inválida: {policy!r}. Use uma de {list(DEDUP_POLICIES)} ou 'off'.")
+    return policy
+
+
+def _json_text(value):
+    return json.dumps(value, sort_keys=True, default=str) if isinstance(value, (dict, list)) else value
+
+
+def _frame_hashes(df: pd.DataFrame) -> np.ndarray:
+    """
+    Hash de 64 bits de cada linha de df. Objetos/listas JSON aninhados (que o
+    pandas não sabe hashear) entram pelo texto JSON canônico.
+    """
+    # categorize=False: ids têm alta cardinalidade, fatorar antes só custaria tempo
+    try:
+        return pd.util.hash_pandas_object(df, index=False, categorize=False).to_numpy()
+    except (TypeError, ValueError):
+        columns = [col for col in df.columns if df[col].dtype == object]
+        df = df.assign(**{col: df[col].map(_json_text) for col in columns})
+        return pd.util.hash_pandas_object(df, index=False, categorize=False).to_numpy()
+
+
+def key_hashes(df: pd.DataFrame, columns) -> np.ndarray:
+    """Hash de 64 bits da chave de cada linha (vetorizado, sem montar strings)."""
+    return _frame_hashes(df[list(columns)])
+
+
+def text_key_hashes(entity: str, df: pd.DataFrame) -> np.ndarray:
+    """
+    Hash da chave primária normalizada como texto: o mesmo valor em pedaços do
+    arquivo lidos com dtypes diferentes (1 e 1.0) tem o mesmo hash.
+    """
+    return pd.util.hash_array(primary_keys(entity, df).to_numpy(dtype=object), categorize=False)
+
+
+def newest_order(entity: str, df: pd.DataFrame, scope: Optional[str] = None) -> Optional[np.ndarray]:
+    """
+    Maior data de NEWEST_COLUMNS em cada linha, em ns (NaT = mais antiga); None
+    se não houver. Com `scope`, as datas em texto são lidas por valor do escopo.
+    """
+    columns = [col for col in NEWEST_COLUMNS.get(entity, []) if col in df.columns]
+    if not columns:
+        return None
+    newest = np.full(len(df), np.iinfo(np.int64).min, dtype=np.int64)
+    for col in columns:
+        serie = df[col]
+        if not pd.api.types.is_datetime64_any_dtype(serie.dtype):
+            serie = parse_datetime(serie, utc=True, groups=df[scope] if scope is not None else None)
+        # NaT vira o menor int64, então nunca vence uma data válida
+        np.maximum(newest, serie.to_numpy(dtype="datetime64[ns]").view(np.int64), out=newest)
+    return newest
+
+
+def keep_mask(hashes: np.ndarray, policy: str, order: Optional[np.ndarray] = None) -> np.ndarray:
+    """Máscara das linhas mantidas: uma por valor de `hashes`, escolhida pela política."""
+    if policy == "first":
+        return ~pd.Series(hashes).duplicated(keep="first").to_numpy()
+    if policy == "last" or order is None:
+        return ~pd.Series(hashes).duplicated(keep="last").to_numpy()
+
+    # newest: ordena por (chave, data) de forma estável e fica com a última de cada grupo
+    sorter = np.lexsort((order, hashes))
+    sorted_hashes = hashes[sorter]
+    last_of_group = np.ones(len(hashes), dtype=bool)
+    last_of_group[:-1] = sorted_hashes[:-1] != sorted_hashes[1:]
+    keep = np.zeros(len(hashes), dtype=bool)
+    keep[sorter[last_of_group]] = True
+    return keep
+
+
+def _duplicate_masks(
+    entity: str,
+    df: pd.DataFrame,
+    policy: str,
+    columns: List[str],
+    scope: Optional[str] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (mantidas, idênticas): máscara das linhas mantidas e, entre as descartadas,
+    das idênticas à linha mantida da mesma chave.
+    """
+    keep = np.ones(len(df), dtype=bool)
+    identical = np.zeros(len(df), dtype=bool)
+    if len(df) < 2:
+        return keep, identical
+
+    hashes = key_hashes(df, columns)
+    candidates = np.flatnonzero(pd.Series(hashes).duplicated(keep=False).to_numpy())
+    if len(candidates) == 0:
+        return keep, identical
+
+    # Colisão de hash (chaves diferentes, mesmo hash) é improvável, mas é conferida
+    # nas linhas candidatas; se houver, as chaves reais substituem os hashes
+    if df.iloc[candidates][columns].drop_duplicates().shape[0] != len(np.unique(hashes[candidates])):
+        logger.warning("Dedup [%s]: colisão de hash nas chaves, usando comparação exata.", entity)
+        hashes = df[columns].groupby(columns, sort=False, dropna=False).ngroup().to_numpy()
+
+    # Só as linhas com chave repetida passam pela política (e pelas datas, em 'newest')
+    candidate_keys = hashes[candidates]
+    order = newest_order(entity, df.iloc[candidates], scope) if policy == "newest" else None
+    kept = keep_mask(candidate_keys, policy, order)
+    keep[candidates[~kept]] = False
+
+    # Duplicatas exatas (mesmo conteúdo da linha mantida) x versões conflitantes;
+    # só as linhas com chave repetida têm o conteúdo inteiro hasheado
+    rows = _frame_hashes(df.iloc[candidates])
+    position = pd.Index(candidate_keys[kept]).get_indexer(candidate_keys[~kept])
+    identical[candidates[~kept]] = rows[kept][position] == rows[~kept]
+    return keep, identical
+
+
+def deduplicate(
+    entity: str,
+    df: pd.DataFrame,
+    policy: str = "last"
+) -> Tuple[pd.DataFrame, Optional[Dict[str, int]]]:
+    """
+    Remove chaves primárias repetidas de df segundo `policy`, preservando a ordem
+    das linhas mantidas. Devolve (df, contagens) com received, duplicates e
+    identical (duplicatas idênticas à linha mantida); contagens é None se a
+    entidade não tiver chave primária conhecida.
+    """
+    columns = PRIMARY_KEYS.get(entity)
+    if columns is None or any(col not in df.columns for col in columns):
+        return df, None
+    keep, identical = _duplicate_masks(entity, df, policy, columns)
+    counts = {"received": len(df), "duplicates": int((~keep).sum()), "identical": int(identical.sum())}
+    if counts["duplicates"] == 0:
+        return df, counts
+
+    logger.info(
+        "Dedup [%s/%s]: %d de %d linhas removidas (%d idênticas)",
+        entity, policy, counts["duplicates"], counts["received"], counts["identical"]
+    )
+    return df.take(np.flatnonzero(keep)).reset_index(drop=True), counts
+
+
+def deduplicate_by(
+    entity: str,
+    df: pd.DataFrame,
+    scope: str,
+    policy: str = "last"
+) -> Tuple[pd.DataFrame, Optional[pd.DataFrame]]:
+    """
+    deduplicate com a chave primária composta com a coluna `scope` (ex.: o id
+    do payload no endpoint em lote): chaves iguais em escopos diferentes não
+    são duplicatas. As contagens saem por escopo, uma linha por valor de `scope`.
+    """
+    columns = PRIMARY_KEYS.get(entity)
+    if columns is None or any(col not in df.columns for col in columns):
+        return df, None
+    keep, identical = _duplicate_masks(entity, df, policy, [scope, *columns], scope)
+    codes, scopes = pd.factorize(df[scope], sort=True)
+    counts = pd.DataFrame({
+        scope: scopes,
+        "received": np.bincount(codes, minlength=len(scopes)),
+        "duplicates": np.bincount(codes, weights=~keep, minlength=len(scopes)).astype(np.int64),
+        "identical": np.bincount(codes, weights=identical, minlength=len(scopes)).astype(np.int64),
+    })
+    if keep.all():
+        return df, counts
+    logger.info(
+        "Dedup [%s/%s por %s]: %d de %d linhas removidas",
+        entity, policy, scope, int((~keep).sum()), len(df)
+    )
+    return df.take(np.flatnonzero(keep)).reset_index(drop=True), counts
@@ -0,0 +1,111 @@
+import logging
+import os
+import sqlite3
+import threading
+from typing import Iterable, Optional, Set, Dict
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger("pta-etl-api.dimension_store")
+
+# Limite de parâmetros por consulta (SQLITE_MAX_VARIABLE_NUMBER antigo = 999)
+_SQL_BATCH = 900
+
+
+class DimensionKeyStore:
+    """
+    Índice persistente (SQLite) das chaves de dimensão já vistas pela API.
+
+    Cada requisição adiciona incrementalmente as chaves de orders/products/sellers
+    que carrega; itens cujo pai não veio no payload são então validados contra o
+    índice acumulado. As chaves encontradas ficam em um cache em memória, então
+    cada chave é consultada no SQLite no máximo uma vez por processo.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._conn_pid: Optional[int] = None
+        self._known: Dict[str, Set[str]] = {}
+
+    def __getstate__(self):
+        # No modo 'process' o ETLProcessor é serializado para os workers:
+        # só o caminho viaja; conexão, lock e cache são recriados no destino.
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"])
+
+    def _connect(self) -> sqlite3.Connection:
+        # Conexões SQLite não sobrevivem a fork: reabre se estivermos em outro processo
+        if self._conn is None or self._conn_pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS dimension_keys ("
+                " key_name TEXT NOT NULL, key TEXT NOT NULL,"
+                " PRIMARY KEY (key_name, key)) WITHOUT ROWID"
+            )
+            self._conn_pid = os.getpid()
+            self._known = {}
+        return self._conn
+
+    @staticmethod
+    def _unique_keys(values: Iterable) -> np.ndarray:
+        return pd.Series(values).dropna().astype(str).unique()
+
+    def update(self, key_name: str, values: Iterable) -> None:
+        """Adiciona ao índice as chaves ainda não conhecidas."""
+        keys = self._unique_keys(values)
+        with self._lock:
+            conn = self._connect()
+            known = self._known.setdefault(key_name, set())
+            new_keys = [k for k in keys if k not in known]
+            if not new_keys:
+                return
+            with conn:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO dimension_keys (key_name, key) VALUES (?, ?)",
+                    ((key_name, k) for k in new_keys)
+                )
+            known.update(new_keys)
+        logger.debug("Índice de dimensões: %d novas chaves em %s", len(new_keys), key_name)
+
+    def contains(self, key_name: str, values: pd.Series) -> np.ndarray:
+        """Retorna uma máscara booleana (alinhada a values) das chaves presentes no índice."""
+        codes, uniques = pd.factorize(values)
+        if len(uniques) == 0:
+            return np.zeros(len(values), dtype=bool)
+
+        unique_keys = pd.Index(uniques).astype(str)
+        with self._lock:
+            conn = self._connect()
+            known = self._known.setdefault(key_name, set())
+            missing = [k for k in unique_keys if k not in known]
+            for start in range(0, len(missing), _SQL_BATCH):
+                batch = missing[start:start + _SQL_BATCH]
+                rows = conn.execute(
+                    "SELECT key FROM dimension_keys WHERE key_name = ? AND key IN (%s)"
+                    % ",".join("?" * len(batch)),
+                    [key_name, *batch]
+                ).fetchall()
+                known.update(row[0] for row in rows)
+            found_uniques = np.fromiter((k in known for k in unique_keys), dtype=bool, count=len(unique_keys))
+
+        # codes == -1 são chaves nulas: nunca presentes no índice
+        return np.where(codes >= 0, found_uniques[codes], False)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None and self._conn_pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+            self._known = {}
+
+
+def dimension_store_from_env() -> Optional[DimensionKeyStore]:
+    path = os.getenv("ETL_DIMENSION_STORE_PATH")
+    return DimensionKeyStore(path) if path else None
@@ -0,0 +1,181 @@
+import hashlib
+import json
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.services.date_parser import DATE_COLUMNS, parse_datetime
+
+# Coluna única com as violações de cada linha: o bit i indica a i-ésima regra da entidade
+FLAGS_COLUMN = "dq_flags"
+
+# Condição de uma regra: (df, agora) -> máscara booleana das linhas que violam a regra
+Condition = Callable[[pd.DataFrame, pd.Timestamp], np.ndarray]
+
+
+def _datas(df: pd.DataFrame, col: str) -> pd.Series:
+    serie = df[col]
+    if not pd.api.types.is_datetime64_any_dtype(serie.dtype):
+        serie = parse_datetime(serie, utc=True)
+    return serie
+
+
+def _sem_fuso(serie: pd.Series) -> pd.Series:
+    return serie.dt.tz_convert("UTC").dt.tz_localize(None) if serie.dt.tz is not None else serie
+
+
+def _agora_como(serie: pd.Series, agora: pd.Timestamp) -> pd.Timestamp:
+    # Colunas sem fuso (cleaners da API) são comparadas com o "agora" em UTC sem fuso
+    return agora if serie.dt.tz is not None else agora.tz_convert("UTC").tz_localize(None)
+
+
+def _antes(col_a: str, col_b: str) -> Condition:
+    def condicao(df, agora):
+        a, b = _datas(df, col_a), _datas(df, col_b)
+        if (a.dt.tz is None) != (b.dt.tz is None):
+            a, b = _sem_fuso(a), _sem_fuso(b)
+        return (a < b).to_numpy()
+    return condicao
+
+
+def _no_futuro(col: str) -> Condition:
+    def condicao(df, agora):
+        datas = _datas(df, col)
+        return (datas > _agora_como(datas, agora)).to_numpy()
+    return condicao
+
+
+def _nula(col: str) -> Condition:
+    def condicao(df, agora):
+        return _datas(df, col).isna().to_numpy()
+    return condicao
+
+
+# Regras por entidade (nomes internos: 'items' = order_items): (nome, colunas, condição).
+# A posição na lista é o bit da regra; novas regras entram no fim para não mudar os bits
+# já publicados. Regras com condição None são preenchidas por outra etapa (integridade).
+DQ_RULES: Dict[str, List[Tuple[str, Sequence[str], Optional[Condition]]]] = {
+    "orders": [
+        ("erro_cronologia", ("order_delivered_customer_date", "order_purchase_timestamp"),
+         _antes("order_delivered_customer_date", "order_purchase_timestamp")),
+        ("erro_futuro", ("order_purchase_timestamp",), _no_futuro("order_purchase_timestamp")),
+    ],
+    "items": [
+        ("erro_data_limite", ("shipping_limit_date",), _nula("shipping_limit_date")),
+        # Mesma ordem dos pais em IntegrityValidator.validate_fused_integrity
+        ("orfao_pedido", (), None),
+        ("orfao_produto", (), None),
+        ("orfao_vendedor", (), None),
+    ],
+}
+
+# Regras preenchidas pela validação de integridade (bit 0 da máscara de motivos = primeira)
+INTEGRITY_RULES = {"items": "orfao_pedido"}
+
+
+def _dtype(entity: str) -> np.dtype:
+    n = len(DQ_RULES.get(entity, []))
+    return np.dtype(np.uint8 if n <= 8 else np.uint16 if n <= 16 else np.uint32 if n <= 32 else np.uint64)
+
+
+def rule_bits(entity: str) -> Dict[str, int]:
+    """{regra: valor do bit} da entidade (para decodificar dq_flags)."""
+    return {nome: 1 << pos for pos, (nome, _, _) in enumerate(DQ_RULES.get(entity, []))}
+
+
+def rules_version() -> str:
+    """Hash dos nomes/bits das regras: muda quando uma regra entra (reprocessa o batch)."""
+    content = json.dumps({entity: list(rule_bits(entity)) for entity in sorted(DQ_RULES)})
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+
+
+def evaluate_rules(
+    entity: str,
+    df: pd.DataFrame,
+    agora: Optional[pd.Timestamp] = None,
+    grupo: Optional[str] = None
+) -> Optional[np.ndarray]:
+    """
+    Avalia todas as regras da entidade e devolve a máscara de bits por linha
+    (None se a entidade não tiver regras). Regras cujas colunas não estão no
+    df ficam com o bit desligado. `grupo`: coluna que separa lotes
+    independentes (endpoint em lote), com as datas em texto lidas por lote.
+    """
+    rules = DQ_RULES.get(entity)
+    if not rules:
+        return None
+    agora = agora if agora is not None else pd.Timestamp.now(tz="UTC")
+    dtype = _dtype(entity)
+    flags = np.zeros(len(df), dtype=dtype)
+    if df.empty:
+        return flags
+    if grupo is not None:
+        textos = [col for col in DATE_COLUMNS if col in df.columns and not pd.api.types.is_datetime64_any_dtype(df[col].dtype)]
+        if textos:
+            df = df.assign(**{col: parse_datetime(df[col], utc=True, groups=df[grupo]) for col in textos})
+    for pos, (nome, colunas, condicao) in enumerate(rules):
+        if condicao is None or any(col not in df.columns for col in colunas):
+            continue
+        violacoes = condicao(df, agora)
+        flags |= violacoes.astype(dtype) << dtype.type(pos)
+    return flags
+
+
+def integrity_flags(entity: str, reasons: np.ndarray) -> np.ndarray:
+    """Converte a máscara de motivos da validação de integridade nos bits de órfão da entidade."""
+    dtype = _dtype(entity)
+    primeira = INTEGRITY_RULES.get(entity)
+    if primeira is None:
+        return np.zeros(len(reasons), dtype=dtype)
+    pos = [nome for nome, _, _ in DQ_RULES[entity]].index(primeira)
+    return reasons.astype(dtype) << dtype.type(pos)
+
+
+def apply_rules(
+    entity: str,
+    df: pd.DataFrame,
+    agora: Optional[pd.Timestamp] = None,
+    grupo: Optional[str] = None
+) -> pd.DataFrame:
+    """Grava a coluna dq_flags em df (no lugar) e o devolve; entidades sem regras ficam como estão."""
+    flags = evaluate_rules(entity, df, agora, grupo)
+    if flags is not None:
+        df[FLAGS_COLUMN] = flags
+    return df
+
+
+def summarize(entity: str, flags: np.ndarray) -> Dict[str, int]:
+    """Resumo agregado: linhas avaliadas, linhas que violam cada regra e linhas com alguma violação."""
+    resumo = {"linhas": len(flags)}
+    resumo.update({
+        nome: int(np.count_nonzero(flags & np.asarray(bit, dtype=flags.dtype)))
+        for nome, bit in rule_bits(entity).items()
+    })
+    resumo["linhas_com_violacao"] = int(np.count_nonzero(flags))
+    return resumo
+
+
+def summarize_by(entity: str, flags: np.ndarray, groups: pd.Series) -> pd.DataFrame:
+    """summarize por grupo (ex.: payload do endpoint em lote): uma linha por valor de `groups`."""
+    codes, uniques = pd.factorize(groups, sort=True)
+    resumo = {groups.name: uniques, "linhas": np.bincount(codes, minlength=len(uniques))}
+    for nome, bit in rule_bits(entity).items():
+        violou = (flags & np.asarray(bit, dtype=flags.dtype)) != 0
+        resumo[nome] = np.bincount(codes, weights=violou, minlength=len(uniques)).astype(np.int64)
+    resumo["linhas_com_violacao"] = np.bincount(codes, weights=flags != 0, minlength=len(uniques)).astype(np.int64)
+    return pd.DataFrame(resumo)
+
+
+def merge_summaries(total: Dict[str, int], parcial: Dict[str, int]) -> Dict[str, int]:
+    """Soma um resumo parcial (ex.: de um chunk) ao acumulado."""
+    for nome, n in parcial.items():
+        total[nome] = total.get(nome, 0) + n
+    return total
+
+
+def decode_flags(entity: str, flags: np.ndarray) -> pd.DataFrame:
+    """Expande dq_flags em uma coluna booleana por regra (para análise, não para o pipeline)."""
+    return pd.DataFrame({
+        nome: (flags & np.asarray(bit, dtype=flags.dtype)) != 0 for nome, bit in rule_bits(entity).items()
+    })
@@ -0,0 +1,133 @@
+import logging
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger("pta-etl-api.dtype_profiles")
+
+try:  # pyarrow é opcional: sem ele os ids continuam como object
+    import pyarrow  # noqa: F401
+    ID_DTYPE = "string[pyarrow]"
+except ImportError:  # pragma: no cover - depende do ambiente
+    ID_DTYPE = None
+
+# Perfis de dtype por entidade (nomes internos do ETLProcessor: 'items' = order_items).
+#   id        -> strings Arrow (ids inteiros, como o CEP lido de CSV, viram o menor int)
+#   category  -> categórico (colunas de baixa cardinalidade)
+#   count     -> menor inteiro que comporta os valores (contagens/tamanhos sem nulos)
+#   measure   -> menor tipo numérico sem perda (int continua int; float só vira float32 se
+#                todos os valores forem inteiros < 2**24, que têm o mesmo texto nos dois tipos)
+DTYPE_PROFILES: Dict[str, Dict[str, str]] = {
+    "orders": {
+        "order_id": "id",
+        "customer_id": "id",
+        "order_status": "category",
+    },
+    "products": {
+        "product_id": "id",
+        "product_category_name": "category",
+        "product_name_lenght": "count",
+        "product_description_lenght": "count",
+        "product_photos_qty": "count",
+        "product_weight_g": "measure",
+        "product_length_cm": "measure",
+        "product_height_cm": "measure",
+        "product_width_cm": "measure",
+    },
+    "items": {
+        "order_id": "id",
+        "order_item_id": "count",
+        "product_id": "id",
+        "seller_id": "id",
+        "price": "measure",
+        "freight_value": "measure",
+    },
+    "sellers": {
+        "seller_id": "id",
+        "seller_zip_code_prefix": "id",
+        "seller_city": "category",
+        "seller_state": "category",
+    },
+}
+
+
+def _is_text(dtype) -> bool:
+    return pd.api.types.is_object_dtype(dtype) or pd.api.types.is_string_dtype(dtype)
+
+
+def _menor_inteiro(serie: pd.Series) -> pd.Series:
+    return pd.to_numeric(serie, downcast="unsigned" if (serie >= 0).all() else "integer")
+
+
+def _compactar_numero(serie: pd.Series, kind: str, final: bool) -> pd.Series:
+    dtype = serie.dtype
+    if pd.api.types.is_bool_dtype(dtype) or not pd.api.types.is_numeric_dtype(dtype) or serie.empty:
+        return serie
+    if pd.api.types.is_integer_dtype(dtype):
+        return _menor_inteiro(serie)
+
+    # Floats só são reduzidos depois da limpeza (final=True): as medianas e os
+    # limites IQR dos cleaners continuam calculados em float64.
+    if not final or serie.isna().any():
+        return serie
+    values = serie.to_numpy()
+    if not np.array_equal(values, np.round(values)):
+        # Frações ficam em float64: um float32 "exato" pode ser escrito com outro
+        # texto (0.30000001192092896 -> 0.3) em CSV/JSON
+        return serie
+    if kind == "count":
+        return _menor_inteiro(serie.astype(np.int64))
+    if dtype == np.float64 and (np.abs(values) < 2**24).all():
+        return serie.astype(np.float32)
+    return serie
+
+
+def compactar_dtypes(
+    entity: str,
+    df: pd.DataFrame,
+    final: bool = True,
+    profiles: Optional[Dict[str, Dict[str, str]]] = None,
+    relatorio: Optional[Dict[str, int]] = None
+) -> pd.DataFrame:
+    """
+    Aplica o perfil de dtypes da entidade (altera df no lugar e o devolve).
+
+    Com final=False (logo após construir o DataFrame) converte ids, categorias
+    e inteiros; com final=True (após a limpeza, sem nulos imputáveis) também
+    reduz floats, sempre sem perder valores. Se `relatorio` for passado, soma
+    nele os bytes economizados por coluna.
+    """
+    profile = (profiles or DTYPE_PROFILES).get(entity, {})
+    for col, kind in profile.items():
+        if col not in df.columns:
+            continue
+        serie = df[col]
+        nova = serie
+        if kind == "category":
+            if _is_text(serie.dtype) and not isinstance(serie.dtype, pd.CategoricalDtype):
+                nova = serie.astype("category")
+        elif kind == "id" and _is_text(serie.dtype):
+            # Só colunas 100% texto: ids mistos (ex.: números em object) ficam como estão
+            if ID_DTYPE is not None and serie.dtype != ID_DTYPE and pd.api.types.infer_dtype(serie, skipna=True) == "string":
+                nova = serie.astype(ID_DTYPE)
+        else:
+            nova = _compactar_numero(serie, kind, final)
+
+        if nova is serie:
+            continue
+        df[col] = nova
+        if relatorio is not None:
+            economia = serie.memory_usage(deep=True, index=False) - nova.memory_usage(deep=True, index=False)
+            relatorio[col] = relatorio.get(col, 0) + int(economia)
+    return df
+
+
+def relatorio_economia(entity: str, relatorio: Dict[str, int]) -> int:
+    """Loga o total de bytes economizados pelo perfil de dtypes em uma entidade."""
+    total = sum(relatorio.values())
+    logger.info(
+        "Perfil de dtypes [%s]: %.2f MB economizados (%s)",
+        entity, total / 2**20, ", ".join(f"{col}={b / 2**20:.2f}MB" for col, b in relatorio.items())
+    )
+    return total
@@ -0,0 +1,171 @@
+import logging
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger("pta-etl-api.incremental")
+
+# Chaves primárias por entidade (nomes internos do ETLProcessor: 'items' = order_items)
+PRIMARY_KEYS: Dict[str, List[str]] = {
+    "orders": ["order_id"],
+    "products": ["product_id"],
+    "sellers": ["seller_id"],
+    "items": ["order_id", "order_item_id"],
+}
+
+# Chave de dimensão -> entidade dona dela (para validar itens contra o estado)
+_KEY_OWNERS = {"order_id": "orders", "product_id": "products", "seller_id": "sellers"}
+
+# Situação de cada linha em relação ao estado
+UNCHANGED, NEW, CHANGED = 0, 1, 2
+
+
+def _key_strings(serie: pd.Series) -> pd.Series:
+    # 1, 1.0 e "1" são a mesma chave (o CSV e o JSON podem inferir tipos diferentes)
+    if pd.api.types.is_float_dtype(serie.dtype):
+        inteiros = serie.dropna()
+        if (inteiros == inteiros.round()).all():
+            serie = serie.astype("Int64")
+    return serie.astype(str)
+
+
+def composite_keys(df: pd.DataFrame, columns: List[str]) -> pd.Series:
+    """Chave de cada linha como texto (chaves compostas unidas por '|')."""
+    keys = _key_strings(df[columns[0]])
+    for col in columns[1:]:
+        keys = keys + "|" + _key_strings(df[col])
+    return keys.reset_index(drop=True)
+
+
+def primary_keys(entity: str, df: pd.DataFrame) -> pd.Series:
+    return composite_keys(df, PRIMARY_KEYS[entity])
+
+
+def has_primary_key(entity: str, df: pd.DataFrame) -> bool:
+    return entity in PRIMARY_KEYS and all(col in df.columns for col in PRIMARY_KEYS[entity])
+
+
+def row_hashes(df: pd.DataFrame) -> np.ndarray:
+    """Hash de conteúdo (64 bits) de cada linha, independente da ordem das colunas."""
+    return pd.util.hash_pandas_object(df[sorted(df.columns)], index=False).to_numpy()
+
+
+class IncrementalStateStore:
+    """
+    Estado incremental (SQLite): hash do conteúdo de cada linha já processada,
+    por entidade e chave primária.
+
+    diff() classifica as linhas recebidas em novas, alteradas ou inalteradas;
+    só as novas/alteradas seguem para os cleaners, e commit() registra os
+    hashes depois que o processamento termina sem erro. Também responde
+    contains() como o DimensionKeyStore, para validar itens cujo pai chegou
+    em uma carga anterior.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._conn_pid: Optional[int] = None
+
+    def __getstate__(self):
+        # Só o caminho viaja entre processos; a conexão é reaberta no destino
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"])
+
+    def _connect(self) -> sqlite3.Connection:
+        # Conexões SQLite não sobrevivem a fork: reabre se estivermos em outro processo
+        if self._conn is None or self._conn_pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS row_hashes ("
+                " entity TEXT NOT NULL, pk TEXT NOT NULL, hash INTEGER NOT NULL,"
+                " PRIMARY KEY (entity, pk)) WITHOUT ROWID"
+            )
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    def _stored_hashes(self, conn: sqlite3.Connection, entity: str, keys: np.ndarray) -> Dict[str, int]:
+        # Tabela temporária + join: uma consulta só, qualquer que seja o tamanho do lote
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS lote_pk (pk TEXT PRIMARY KEY) WITHOUT ROWID")
+        conn.execute("DELETE FROM lote_pk")
+        conn.executemany("INSERT OR IGNORE INTO lote_pk (pk) VALUES (?)", ((k,) for k in keys))
+        rows = conn.execute(
+            "SELECT r.pk, r.hash FROM lote_pk l JOIN row_hashes r ON r.entity = ? AND r.pk = l.pk",
+            (entity,)
+        ).fetchall()
+        conn.execute("DELETE FROM lote_pk")
+        return dict(rows)
+
+    def diff(self, entity: str, keys: pd.Series, hashes: np.ndarray) -> np.ndarray:
+        """Situação de cada linha (UNCHANGED, NEW ou CHANGED) em relação ao estado."""
+        status = np.full(len(keys), NEW, dtype=np.uint8)
+        if len(keys) == 0:
+            return status
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                stored = self._stored_hashes(conn, entity, keys.unique())
+        if not stored:
+            return status
+
+        # Busca posicional em int64 (keys.map passaria por float e perderia bits do hash)
+        position = pd.Index(list(stored)).get_indexer(keys)
+        stored_hash = np.fromiter(stored.values(), dtype=np.int64, count=len(stored))
+        known = position >= 0
+        same = known.copy()
+        same[known] = stored_hash[position[known]] == hashes.view(np.int64)[known]
+        status[known] = CHANGED
+        status[same] = UNCHANGED
+        return status
+
+    def commit(self, entity: str, keys: pd.Series, hashes: np.ndarray, replace: bool = False) -> None:
+        """Registra (upsert) os hashes; replace=True descarta antes todo o estado da entidade."""
+        if len(keys) == 0 and not replace:
+            return
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                if replace:
+                    conn.execute("DELETE FROM row_hashes WHERE entity = ?", (entity,))
+                conn.executemany(
+                    "INSERT INTO row_hashes (entity, pk, hash) VALUES (?, ?, ?)"
+                    " ON CONFLICT (entity, pk) DO UPDATE SET hash = excluded.hash",
+                    zip(
+                        (entity for _ in range(len(keys))),
+                        keys.tolist(),
+                        hashes.view(np.int64).tolist(),
+                    )
+                )
+        logger.debug("Estado incremental: %d linhas registradas em %s", len(keys), entity)
+
+    def contains(self, key_name: str, values: pd.Series) -> np.ndarray:
+        """Máscara das chaves de dimensão (order_id/product_id/seller_id) já registradas."""
+        entity = _KEY_OWNERS.get(key_name)
+        if entity is None or len(values) == 0:
+            return np.zeros(len(values), dtype=bool)
+        keys = _key_strings(pd.Series(values).reset_index(drop=True))
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                stored = self._stored_hashes(conn, entity, keys[pd.notna(values).to_numpy()].unique())
+        return keys.isin(list(stored)).to_numpy() & pd.notna(values).to_numpy()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None and self._conn_pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+
+
+def incremental_state_from_env() -> Optional[IncrementalStateStore]:
+    path = os.getenv("ETL_INCREMENTAL_STATE_PATH")
+    return IncrementalStateStore(path) if path else None
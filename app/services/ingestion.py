@@ -0,0 +1,273 @@
+import codecs
+import json
+import re
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+# Bloco de leitura dos payloads lidos de arquivo (jobs)
+READ_BLOCK = 1 << 20
+
+# Bloco do payload: (entidade, 'records' | 'columns', valor)
+Block = Tuple[Any, str, Any]
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_DECODER = json.JSONDecoder()
+
+
+class IngestionError(ValueError):
+    """Payload de ingestão malformado ou com entidade desconhecida."""
+
+
+class ColumnarBuffer:
+    """Acumula registros de uma entidade direto em colunas (dict de listas)."""
+
+    def __init__(self):
+        self.columns: Dict[str, List[Any]] = {}
+        self.n_rows = 0
+
+    def _column(self, name: str) -> List[Any]:
+        column = self.columns.get(name)
+        if column is None:
+            # Coluna nova: preenche com None as linhas que já chegaram sem ela
+            column = self.columns[name] = [None] * self.n_rows
+        return column
+
+    def add_records(self, records: Iterable[Dict[str, Any]]) -> None:
+        if not isinstance(records, list):
+            raise IngestionError("'records' deve ser uma lista de objetos JSON.")
+        for record in records:
+            if not isinstance(record, dict):
+                raise IngestionError("Cada registro deve ser um objeto JSON.")
+            for name, value in record.items():
+                self._column(name).append(value)
+            self.n_rows += 1
+            for column in self.columns.values():
+                if len(column) < self.n_rows:
+                    column.append(None)
+
+    def add_columns(self, columns: Dict[str, List[Any]]) -> None:
+        if not isinstance(columns, dict) or not all(isinstance(v, list) for v in columns.values()):
+            raise IngestionError("'columns' deve ser um objeto {coluna: [valores]}.")
+        lengths = {len(values) for values in columns.values()}
+        if len(lengths) > 1:
+            raise IngestionError("Todas as colunas de um bloco devem ter o mesmo tamanho.")
+        n_new = lengths.pop() if lengths else 0
+
+        for name, values in columns.items():
+            self._column(name).extend(values)
+        self.n_rows += n_new
+        for column in self.columns.values():
+            if len(column) < self.n_rows:
+                column.extend([None] * (self.n_rows - len(column)))
+
+    def to_frame(self) -> pd.DataFrame:
+        # Construtor a partir de dict de listas: bem mais rápido que lista de dicts
+        return pd.DataFrame(self.columns)
+
+
+def _parse_ndjson_line(line: bytes, line_no: int) -> Optional[Block]:
+    if not line.strip():
+        return None
+    try:
+        block = json.loads(line)
+    except json.JSONDecodeError as e:
+        raise IngestionError(f"Linha {line_no}: JSON inválido ({e.msg}).")
+    if not isinstance(block, dict):
+        raise IngestionError(f"Linha {line_no}: esperado um objeto JSON.")
+    for kind in ("records", "columns"):
+        if kind in block:
+            return block.get("entity"), kind, block[kind]
+    raise IngestionError(f"Linha {line_no}: informe 'records' ou 'columns'.")
+
+
+def iter_ndjson_blocks(f: BinaryIO, block_size: int = READ_BLOCK) -> Iterator[Block]:
+    """Blocos de um arquivo NDJSON lido aos poucos (uma linha na memória por vez)."""
+    pending = b""
+    line_no = 0
+    for chunk in iter(lambda: f.read(block_size), b""):
+        *lines, pending = (pending + chunk).split(b"\n")
+        for line in lines:
+            line_no += 1
+            block = _parse_ndjson_line(line, line_no)
+            if block is not None:
+                yield block
+    if pending:
+        block = _parse_ndjson_line(pending, line_no + 1)
+        if block is not None:
+            yield block
+
+
+class _JsonReader:
+    """Decodifica um documento JSON valor a valor, lendo o arquivo em blocos."""
+
+    def __init__(self, f: BinaryIO, block_size: int):
+        self._f = f
+        self._block_size = block_size
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._text = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self, size: int) -> None:
+        # Descarta o que já foi consumido e acrescenta o próximo bloco
+        chunk = self._f.read(size)
+        self._eof = not chunk
+        try:
+            text = self._decoder.decode(chunk, final=self._eof)
+        except UnicodeDecodeError as e:
+            raise IngestionError(f"JSON inválido ({e.reason}).")
+        self._text = self._text[self._pos:] + text
+        self._pos = 0
+
+    def peek(self) -> str:
+        """Próximo caractere fora de espaços ('' no fim do arquivo)."""
+        while True:
+            self._pos = _WHITESPACE.match(self._text, self._pos).end()
+            if self._pos < len(self._text):
+                return self._text[self._pos]
+            if self._eof:
+                return ""
+            self._fill(self._block_size)
+
+    def take(self, expected: str) -> str:
+        char = self.peek()
+        if not char or char not in expected:
+            raise IngestionError(f"JSON inválido (esperado {' ou '.join(map(repr, expected))}).")
+        self._pos += 1
+        return char
+
+    def value(self) -> Any:
+        self.peek()
+        size = self._block_size
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self._text, self._pos)
+                # Um número no fim do bloco pode continuar no próximo
+                if end < len(self._text) or self._eof:
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError as e:
+                if self._eof:
+                    raise IngestionError(f"JSON inválido ({e.msg}).")
+            # Valor maior que o que já foi lido: blocos crescentes evitam decodificar
+            # o mesmo começo muitas vezes
+            self._fill(size)
+            size *= 2
+
+
+def iter_json_blocks(f: BinaryIO, block_size: int = READ_BLOCK, batch: int = 1000) -> Iterator[Block]:
+    """
+    Blocos de um arquivo JSON no formato do /process ({entidade: [registros]}) ou
+    colunar ({entidade: {coluna: [valores]}}) lido aos poucos, sem o documento
+    inteiro na memória: os registros saem em lotes de até `batch` (as colunas de
+    uma entidade colunar saem de uma vez).
+    """
+    reader = _JsonReader(f, block_size)
+    if reader.peek() != "{":
+        raise IngestionError("Esperado um objeto {entidade: [registros]} ou {entidade: {coluna: [valores]}}.")
+    reader.take("{")
+    if reader.peek() == "}":
+        reader.take("}")
+    else:
+        while True:
+            entity = reader.value()
+            reader.take(":")
+            if reader.peek() == "[":
+                reader.take("[")
+                records = []
+                if reader.peek() == "]":
+                    reader.take("]")
+                else:
+                    while True:
+                        records.append(reader.value())
+                        if len(records) >= batch:
+                            yield entity, "records", records
+                            records = []
+                        if reader.take(",]") == "]":
+                            break
+                yield entity, "records", records
+            else:
+                yield entity, "columns", reader.value()
+            if reader.take(",}") == "}":
+                break
+    if reader.peek():
+        raise IngestionError("JSON inválido (conteúdo após o fim do documento).")
+
+
+class ColumnarIngestor:
+    """
+    Converte o corpo da requisição direto em DataFrames por entidade, bloco a
+    bloco, sem Pydantic por linha. Só os nomes das entidades são validados
+    (mesma semântica de extra="forbid" do PayloadInput).
+
+    Formatos aceitos:
+      - NDJSON: uma linha por bloco, {"entity": "orders", "records": [...]} ou
+        {"entity": "orders", "columns": {"order_id": [...], ...}};
+      - JSON colunar: {"orders": {"order_id": [...], ...}, "products": {...}}.
+    """
+
+    def __init__(self, allowed_entities: Iterable[str]):
+        self.allowed_entities = tuple(allowed_entities)
+        self.buffers: Dict[str, ColumnarBuffer] = {}
+        self._pending = b""
+        self._line_no = 0
+
+    def _buffer(self, entity: Any) -> ColumnarBuffer:
+        if entity not in self.allowed_entities:
+            raise IngestionError(
+                f"Entidade desconhecida: {entity!r}. Use uma de {list(self.allowed_entities)}."
+            )
+        return self.buffers.setdefault(entity, ColumnarBuffer())
+
+    def add_block(self, entity: Any, kind: str, value: Any) -> None:
+        buffer = self._buffer(entity)
+        if kind == "records":
+            buffer.add_records(value)
+        else:
+            buffer.add_columns(value)
+
+    def _feed_line(self, line: bytes) -> None:
+        self._line_no += 1
+        block = _parse_ndjson_line(line, self._line_no)
+        if block is not None:
+            self.add_block(*block)
+
+    def feed_ndjson(self, chunk: bytes) -> None:
+        """Processa um pedaço do stream NDJSON; linhas incompletas ficam pendentes."""
+        data = self._pending + chunk
+        *lines, self._pending = data.split(b"\n")
+        for line in lines:
+            self._feed_line(line)
+
+    def finish_ndjson(self) -> None:
+        if self._pending:
+            self._feed_line(self._pending)
+            self._pending = b""
+
+    def feed_columnar_json(self, body: bytes) -> None:
+        try:
+            document = json.loads(body)
+        except json.JSONDecodeError as e:
+            raise IngestionError(f"JSON inválido ({e.msg}).")
+        if not isinstance(document, dict):
+            raise IngestionError("Esperado um objeto {entidade: {coluna: [valores]}}.")
+        for entity, columns in document.items():
+            self._buffer(entity).add_columns(columns)
+
+    def feed_json(self, body: bytes) -> None:
+        """JSON no formato do /process ({entidade: [registros]}) ou colunar ({entidade: {coluna: [valores]}})."""
+        try:
+            document = json.loads(body)
+        except json.JSONDecodeError as e:
+            raise IngestionError(f"JSON inválido ({e.msg}).")
+        if not isinstance(document, dict):
+            raise IngestionError("Esperado um objeto {entidade: [registros]} ou {entidade: {coluna: [valores]}}.")
+        for entity, value in document.items():
+            if isinstance(value, list):
+                self._buffer(entity).add_records(value)
+            else:
+                self._buffer(entity).add_columns(value)
+
+    def frames(self) -> Dict[str, pd.DataFrame]:
+        return {entity: buffer.to_frame() for entity, buffer in self.buffers.items()}
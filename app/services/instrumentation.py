@@ -0,0 +1,40 @@
+import logging
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+logger = logging.getLogger("pta-etl-api.instrumentation")
+
+# tracemalloc é global ao processo: medições concorrentes se misturariam,
+# então só uma medição roda por vez (as outras seguem sem instrumentação).
+_trace_lock = threading.Lock()
+
+
+@contextmanager
+def medir_pico_memoria(rotulo: str) -> Iterator[Dict[str, float]]:
+    """
+    Mede o pico de memória alocada (Python + NumPy/pandas) dentro do bloco.
+
+    O resultado fica em stats['pico_mb'] ao sair do bloco e também vai para o log.
+    Ferramenta de diagnóstico: o tracemalloc deixa o código bem mais lento.
+    """
+    stats = {"pico_mb": float("nan")}
+    if not _trace_lock.acquire(blocking=False):
+        yield stats
+        return
+
+    ja_ativo = tracemalloc.is_tracing()
+    try:
+        if not ja_ativo:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        yield stats
+        _, pico = tracemalloc.get_traced_memory()
+        stats["pico_mb"] = (pico - base) / 1024 ** 2
+        logger.info("[%s] pico de memória: %.1f MB", rotulo, stats["pico_mb"])
+    finally:
+        if not ja_ativo:
+            tracemalloc.stop()
+        _trace_lock.release()
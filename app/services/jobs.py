@@ -0,0 +1,356 @@
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import anyio
+import pandas as pd
+from fastapi.concurrency import run_in_threadpool
+
+from app.services.ingestion import ColumnarBuffer, ColumnarIngestor, IngestionError, iter_json_blocks, iter_ndjson_blocks
+from app.services.json_encoder import iter_ndjson
+from app.services.worker_pool import PoolSaturatedError
+
+logger = logging.getLogger("pta-etl-api.jobs")
+
+# Situação de um job
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+
+PAYLOAD_NAME = "payload"
+RESULT_NAME = "result.ndjson"
+STATUS_NAME = "status.json"
+# Blocos de itens separados do payload (apagados ao fim do job)
+CHUNK_NAME = "items-{:05d}.pkl"
+
+# Entidade que passa em blocos; as demais (dimensões) são limpas inteiras
+ITEMS_ENTITY = "order_items"
+
+# Ids gerados por submit() (uuid4 em hex): qualquer outra coisa nem chega ao disco
+_JOB_ID = re.compile(r"[0-9a-f]{32}")
+
+
+class JobManager:
+    """
+    Jobs assíncronos para payloads grandes (acima do limite de /process).
+
+    O corpo da requisição é gravado em disco conforme chega (sem ficar inteiro
+    na memória do servidor web) e um pool limitado de processos roda o
+    ETLProcessor, gravando o resultado em NDJSON no mesmo diretório: o pico de
+    memória de um payload grande fica no processo do job, não no do uvicorn. O
+    payload é lido do disco aos poucos; as dimensões vão para a memória e os
+    itens são separados em blocos de `chunk_rows` linhas, carregados um de cada
+    vez. A situação de cada job (status.json) é atualizada a cada bloco e é
+    sempre lida do disco; em memória ficam só os jobs ainda não concluídos.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        processor: Any,
+        allowed_entities: Iterable[str],
+        workers: int = 2,
+        queue_depth: int = 8,
+        chunk_rows: int = 50000,
+        stream_chunk_size: int = 1000
+    ):
+        if workers < 1 or queue_depth < 0 or chunk_rows < 1:
+            raise ValueError("Workers e tamanho do bloco devem ser >= 1 e fila >= 0.")
+        self.root = root
+        self.processor = processor
+        self.allowed_entities = tuple(allowed_entities)
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.chunk_rows = chunk_rows
+        self.stream_chunk_size = stream_chunk_size
+        # Jobs em recebimento, na fila ou em execução (saem ao concluir)
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def __getstate__(self):
+        # Vai para o processo do job só a configuração (sem lock, pool nem jobs)
+        return {
+            "root": self.root,
+            "processor": self.processor,
+            "allowed_entities": self.allowed_entities,
+            "workers": self.workers,
+            "queue_depth": self.queue_depth,
+            "chunk_rows": self.chunk_rows,
+            "stream_chunk_size": self.stream_chunk_size,
+        }
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    @classmethod
+    def from_env(cls, processor: Any, allowed_entities: Iterable[str]) -> "JobManager":
+        return cls(
+            root=os.getenv("ETL_JOBS_DIR") or os.path.join(tempfile.gettempdir(), "pta-etl-jobs"),
+            processor=processor,
+            allowed_entities=allowed_entities,
+            workers=int(os.getenv("ETL_JOBS_WORKERS", "2")),
+            queue_depth=int(os.getenv("ETL_JOBS_QUEUE_DEPTH", "8")),
+            chunk_rows=int(os.getenv("ETL_JOBS_CHUNK_ROWS", "50000")),
+            stream_chunk_size=int(os.getenv("ETL_STREAM_CHUNK_SIZE", "1000")),
+        )
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            logger.info("Pool de jobs iniciado: workers=%d fila=%d bloco=%d linhas", self.workers, self.queue_depth, self.chunk_rows)
+        return self._executor
+
+    def _job_dir(self, job_id: str) -> str:
+        return os.path.join(self.root, job_id)
+
+    @staticmethod
+    def _open_payload(job_dir: str):
+        os.makedirs(job_dir, exist_ok=True)
+        return open(os.path.join(job_dir, PAYLOAD_NAME), "wb")
+
+    @staticmethod
+    def _discard_payload(f, job_dir: str) -> None:
+        if f is not None:
+            f.close()
+        shutil.rmtree(job_dir, ignore_errors=True)
+
+    def _save(self, job: Dict[str, Any]) -> None:
+        # Atômico: grava ao lado e renomeia (quem consulta nunca lê um JSON pela metade)
+        path = os.path.join(self._job_dir(job["job_id"]), STATUS_NAME)
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(job, f)
+        os.replace(f"{path}.tmp", path)
+
+    def _read(self, job_id: str) -> Optional[Dict[str, Any]]:
+        path = os.path.join(self._job_dir(job_id), STATUS_NAME)
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def _update(self, job: Dict[str, Any], **changes: Any) -> None:
+        job.update(changes)
+        self._save(job)
+
+    def _finished(self, job_id: str, future: Future) -> None:
+        # Chamado no processo da API quando o job sai do pool
+        with self._lock:
+            self._jobs.pop(job_id, None)
+        if future.cancelled():
+            return  # shutdown: fica 'queued' no disco e get() o mostra como interrompido
+        error = future.exception()
+        if error is not None:
+            # O processo do job morreu (ex.: sem memória) antes de gravar a situação final
+            logger.error("Job %s: processo do job falhou: %s", job_id, error)
+            job = self._read(job_id)
+            if job is not None:
+                self._update(job, status=FAILED, error=f"Processo do job falhou: {error}", finished_at=time.time())
+
+    async def submit(self, body: AsyncIterator[bytes], content_type: str, orphan_mode: Optional[str] = None) -> Dict[str, Any]:
+        """Grava o corpo em disco, enfileira o job e devolve a situação inicial."""
+        with self._lock:
+            if len(self._jobs) >= self.workers + self.queue_depth:
+                raise PoolSaturatedError("Fila de jobs cheia.")
+            job_id = uuid.uuid4().hex
+            job = {
+                "job_id": job_id,
+                "status": QUEUED,
+                "format": "ndjson" if content_type.startswith("application/x-ndjson") else "json",
+                "orphan_mode": orphan_mode,
+                "created_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+                "payload_bytes": 0,
+                "rows_total": None,
+                "rows_done": 0,
+                "progress": 0.0,
+                "error": None,
+            }
+            self._jobs[job_id] = job
+
+        # Disco fora do event loop: criar o diretório, abrir, gravar cada pedaço e fechar
+        job_dir = self._job_dir(job_id)
+        f = None
+        try:
+            f = await run_in_threadpool(self._open_payload, job_dir)
+            async for chunk in body:
+                await run_in_threadpool(f.write, chunk)
+                job["payload_bytes"] += len(chunk)
+            await run_in_threadpool(f.close)
+            snapshot = dict(job)
+            await run_in_threadpool(self._save, snapshot)
+        except BaseException:
+            with self._lock:
+                self._jobs.pop(job_id, None)
+            # Mesmo com a requisição cancelada, a limpeza termina
+            with anyio.CancelScope(shield=True):
+                await run_in_threadpool(self._discard_payload, f, job_dir)
+            raise
+
+        future = self._get_executor().submit(self._run, job_id)
+        future.add_done_callback(lambda f: self._finished(job_id, f))
+        logger.info("Job %s enfileirado: %d bytes (%s)", job_id, job["payload_bytes"], job["format"])
+        return snapshot
+
+    # ------------------------------------------------- no processo do job
+
+    def _split_payload(self, job_dir: str, fmt: str) -> Tuple[Dict[str, pd.DataFrame], List[str], List[str], int]:
+        """
+        Lê o payload do disco aos poucos. As dimensões vão para a memória e os
+        itens são gravados em blocos de `chunk_rows` linhas ao lado do payload.
+        Devolve (dimensões, arquivos dos blocos, colunas dos itens, total de linhas).
+        """
+        ingestor = ColumnarIngestor(allowed_entities=self.allowed_entities)
+        items = ColumnarBuffer()
+        chunk_paths: List[str] = []
+        # Colunas na ordem em que apareceram (um bloco pode não ter todas)
+        columns: Dict[str, None] = {}
+
+        def flush() -> None:
+            df = items.to_frame()
+            columns.update(dict.fromkeys(df.columns))
+            for start in range(0, len(df), self.chunk_rows):
+                path = os.path.join(job_dir, CHUNK_NAME.format(len(chunk_paths)))
+                df.iloc[start:start + self.chunk_rows].reset_index(drop=True).to_pickle(path)
+                chunk_paths.append(path)
+
+        n_items = 0
+        with open(os.path.join(job_dir, PAYLOAD_NAME), "rb") as f:
+            blocks = iter_ndjson_blocks(f) if fmt == "ndjson" else iter_json_blocks(f)
+            for entity, kind, value in blocks:
+                if entity != ITEMS_ENTITY:
+                    ingestor.add_block(entity, kind, value)
+                    continue
+                if kind == "records":
+                    items.add_records(value)
+                else:
+                    items.add_columns(value)
+                if items.n_rows >= self.chunk_rows:
+                    n_items += items.n_rows
+                    flush()
+                    items = ColumnarBuffer()
+        if items.n_rows:
+            n_items += items.n_rows
+            flush()
+
+        frames = ingestor.frames()
+        return frames, chunk_paths, list(columns), n_items + sum(len(df) for df in frames.values())
+
+    @staticmethod
+    def _iter_chunks(chunk_paths: List[str], columns: List[str]) -> Iterator[pd.DataFrame]:
+        # Um bloco na memória por vez, com todas as colunas vistas no payload
+        for path in chunk_paths:
+            df = pd.read_pickle(path)
+            os.remove(path)
+            missing = [col for col in columns if col not in df.columns]
+            if missing:
+                df = df.assign(**dict.fromkeys(missing))[columns]
+            yield df
+
+    def _run(self, job_id: str) -> None:
+        # Roda em um processo do pool: a situação do job só existe no disco
+        job = self._read(job_id)
+        try:
+            self._execute(job)
+        except Exception as e:
+            logger.exception("Job %s falhou: %s", job_id, e)
+            self._update(job, status=FAILED, error=str(e), finished_at=time.time())
+        finally:
+            job_dir = self._job_dir(job_id)
+            for name in os.listdir(job_dir):
+                if name.startswith("items-"):
+                    os.remove(os.path.join(job_dir, name))
+
+    def _execute(self, job: Dict[str, Any]) -> None:
+        job_id = job["job_id"]
+        self._update(job, status=RUNNING, started_at=time.time())
+        job_dir = self._job_dir(job_id)
+        result_path = os.path.join(job_dir, RESULT_NAME)
+        failure = []
+
+        try:
+            frames, chunk_paths, columns, rows_total = self._split_payload(job_dir, job["format"])
+            self._update(job, rows_total=rows_total)
+        except (IngestionError, OSError) as e:
+            logger.warning("Job %s: payload rejeitado: %s", job_id, e)
+            self._update(job, status=FAILED, error=str(e), finished_at=time.time())
+            return
+
+        done = 0
+
+        def progress(rows: int) -> None:
+            nonlocal done
+            done += rows
+            self._update(job, rows_done=done, progress=round(min(done / rows_total, 1.0), 4) if rows_total else 1.0)
+
+        def sections():
+            try:
+                yield from self.processor.iter_frames_chunked(
+                    frames, self.chunk_rows, job["orphan_mode"], progress=progress,
+                    item_chunks=self._iter_chunks(chunk_paths, columns)
+                )
+            except Exception as e:
+                logger.exception("Job %s falhou: %s", job_id, e)
+                failure.append(e)
+                raise  # iter_ndjson grava a linha de erro no resultado
+
+        # Resultado no mesmo formato do /process?stream=ndjson, gravado bloco a bloco
+        with open(f"{result_path}.tmp", "wb") as f:
+            for line in iter_ndjson(sections(), chunk_size=self.stream_chunk_size):
+                f.write(line)
+        os.replace(f"{result_path}.tmp", result_path)
+
+        if failure:
+            self._update(job, status=FAILED, error=str(failure[0]), finished_at=time.time())
+        else:
+            self._update(job, status=SUCCEEDED, progress=1.0, finished_at=time.time())
+            logger.info("Job %s concluído: %d linhas", job_id, rows_total)
+
+    # ---------------------------------------------------------------- público
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Situação do job (também de jobs de execuções anteriores da API, lida do disco)."""
+        if not _JOB_ID.fullmatch(job_id):
+            return None
+        with self._lock:
+            pending = self._jobs.get(job_id)
+            pending = dict(pending) if pending is not None else None
+        job = self._read(job_id)
+        if job is None:
+            # Corpo ainda chegando: a situação só está em memória
+            return pending
+        if job["status"] in (QUEUED, RUNNING) and pending is None:
+            # Nenhum worker desta execução está com ele: a API reiniciou no meio
+            job.update(status=FAILED, error="Job interrompido (reinício da API).")
+        return job
+
+    def result_path(self, job_id: str) -> Optional[str]:
+        job = self.get(job_id)
+        if job is None:
+            return None
+        path = os.path.join(self._job_dir(job_id), RESULT_NAME)
+        if job["status"] not in (SUCCEEDED, FAILED) or not os.path.exists(path):
+            return None
+        return path
+
+    def delete(self, job_id: str) -> bool:
+        """Remove os arquivos do job (só depois de concluído)."""
+        job = self.get(job_id)
+        if job is None:
+            return False
+        if job_id in self._jobs:
+            raise RuntimeError("Job ainda em execução.")
+        shutil.rmtree(self._job_dir(job_id), ignore_errors=True)
+        return True
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
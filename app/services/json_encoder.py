@@ -0,0 +1,127 @@
+import json
+import re
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Casas decimais máximas aceitas pelo encoder C do pandas (só usadas por colunas
+# que não são float; floats são pré-formatados com a representação mais curta)
+_DOUBLE_PRECISION = 15
+
+# Marca as strings de floats pré-formatados: o encoder do pandas as escreve entre
+# aspas e o padrão abaixo tira as aspas e a marca, deixando o número cru
+_FLOAT_MARK = "\ue000"
+_FLOAT_PATTERN = re.compile(r'"\\ue000([-+.0-9e]+)\\ue000"')
+
+
+def _iso_strings(serie: pd.Series) -> pd.Series:
+    """
+    Formata uma coluna datetime64 como strings ISO 8601 (mesmo formato de
+    Timestamp.isoformat: 'T' como separador e offset '+00:00' se houver fuso).
+    NaT vira None.
+    """
+    mask_nat = serie.isna().to_numpy()
+    tz = getattr(serie.dtype, "tz", None)
+    local = serie.dt.tz_localize(None) if tz is not None else serie
+
+    values = local.to_numpy(dtype="datetime64[ns]")
+    has_fraction = bool((values[~mask_nat].astype(np.int64) % 1_000_000_000).any())
+    strings = np.datetime_as_string(values, unit="us" if has_fraction else "s").astype(object)
+
+    if tz is not None:
+        offsets = serie.dt.strftime("%z").fillna("")
+        strings = strings + (offsets.str[:3] + ":" + offsets.str[3:]).to_numpy(dtype=object)
+
+    strings[mask_nat] = None
+    return pd.Series(strings, index=serie.index, dtype=object)
+
+
+def _float_strings(serie: pd.Series) -> Tuple[pd.Series, int]:
+    """
+    Formata uma coluna float com a representação mais curta que volta ao mesmo
+    valor (a mesma de repr/json.dumps), envolvida pela marca. NaN e ±Inf viram
+    None. Devolve também quantos valores foram formatados.
+    """
+    values = serie.to_numpy(dtype=np.float64, na_value=np.nan)
+    finite = np.isfinite(values)
+    strings = np.full(len(values), None, dtype=object)
+    strings[finite] = _FLOAT_MARK + values[finite].astype(str).astype(object) + _FLOAT_MARK
+    return pd.Series(strings, index=serie.index, dtype=object), int(finite.sum())
+
+
+def encode_records(df: pd.DataFrame) -> str:
+    """
+    Serializa o DataFrame como uma lista JSON de registros em uma única passada
+    vetorizada (encoder C do pandas), sem criar a lista intermediária de dicts.
+
+    NaN, NaT e ±Inf viram null; datetimes (com ou sem fuso) viram strings ISO.
+    """
+    if df.empty:
+        return "[]"
+
+    datetime_cols = [col for col, dtype in df.dtypes.items() if pd.api.types.is_datetime64_any_dtype(dtype)]
+    if datetime_cols:
+        df = df.assign(**{col: _iso_strings(df[col]) for col in datetime_cols})
+
+    # O encoder do pandas arredonda floats em double_precision casas (58.9 sairia
+    # 58.899999999999999): as colunas float vão como strings marcadas e voltam a
+    # ser números depois
+    float_cols = [col for col, dtype in df.dtypes.items() if pd.api.types.is_float_dtype(dtype)]
+    if not float_cols:
+        return df.to_json(orient="records", double_precision=_DOUBLE_PRECISION, date_format="iso")
+
+    formatted, expected = {}, 0
+    for col in float_cols:
+        formatted[col], count = _float_strings(df[col])
+        expected += count
+    encoded = df.assign(**formatted).to_json(orient="records", double_precision=_DOUBLE_PRECISION, date_format="iso")
+
+    encoded, replaced = _FLOAT_PATTERN.subn(r"\1", encoded)
+    if replaced != expected:
+        # Algum texto do payload tinha a própria marca: caminho lento, mas exato
+        return _dumps_records(df, float_cols)
+    return encoded
+
+
+def _dumps_records(df: pd.DataFrame, float_cols: List[str]) -> str:
+    """Serialização registro a registro com json.dumps (floats em repr, NaN/±Inf como null)."""
+    df = df.assign(**{col: df[col].replace([np.inf, -np.inf], np.nan) for col in float_cols})
+    records = df.astype(object).where(df.notna(), None).to_dict(orient="records")
+    return json.dumps(records, separators=(",", ":"), default=str)
+
+
+def encode_response(
+    sections: Dict[str, Dict[str, pd.DataFrame]],
+    meta: Optional[Dict[str, Any]] = None
+) -> bytes:
+    """
+    Monta a resposta JSON final a partir dos DataFrames, concatenando os
+    fragmentos já serializados: {**meta, secao: {entidade: [registros]}}.
+    """
+    parts = []
+    for key, value in (meta or {}).items():
+        parts.append(f"{json.dumps(key)}:{json.dumps(value, default=str)}")
+    for section, frames in sections.items():
+        entities = ",".join(f"{json.dumps(entity)}:{encode_records(df)}" for entity, df in frames.items())
+        parts.append(f"{json.dumps(section)}:{{{entities}}}")
+    return ("{" + ",".join(parts) + "}").encode("utf-8")
+
+
+def iter_ndjson(frames: Iterable[Tuple[str, str, pd.DataFrame]], chunk_size: int = 1000) -> Iterator[bytes]:
+    """
+    Gera a resposta em NDJSON, um bloco de até chunk_size registros por linha:
+        {"section": "data", "entity": "orders", "records": [...]}
+
+    A última linha é {"status": "success"}; se o processamento falhar no meio do
+    stream (o status HTTP já foi enviado), a última linha é {"status": "error", ...}.
+    """
+    try:
+        for section, entity, df in frames:
+            header = f'{{"section":{json.dumps(section)},"entity":{json.dumps(entity)},"records":'
+            for start in range(0, max(len(df), 1), chunk_size):
+                yield f"{header}{encode_records(df.iloc[start:start + chunk_size])}}}\n".encode("utf-8")
+    except Exception as e:
+        yield (json.dumps({"status": "error", "error": str(e)}) + "\n").encode("utf-8")
+        return
+    yield b'{"status":"success"}\n'
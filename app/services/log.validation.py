@@ -4,6 +4,10 @@ import time
 import pandas as pd
 import numpy as np
 
+from app.services.date_parser import DATE_COLUMNS, parse_datetime_columns
+from app.services.dedup import deduplicate
+from app.services.dq_rules import evaluate_rules, summarize
+
 # configuração básica de logging e função orfã
 def setup_logging(log_level=logging.INFO):
     logging.basicConfig(level=log_level, format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
@@ -23,7 +27,7 @@ def get_orphan_mask(df_order_items, df_orders, df_products, df_sellers):
     return mask_orphan_order | mask_orphan_product | mask_orphan_seller
 
 
-def process_payload_with_logging(payload, max_rows_limit=10000, request_user="API_Caller"):
+def process_payload_with_logging(payload, max_rows_limit=10000, request_user="API_Caller", dedup_policy=None):
 
     request_id = str(uuid.uuid4())
     start_time = time.time()
@@ -34,6 +38,8 @@ def process_payload_with_logging(payload, max_rows_limit=10000, request_user="AP
         'processing_start_timestamp': time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(start_time)),
         'total_processing_time_sec': 0.0,
         'payload_sizes': {},
+        'duplicate_counts': {},
+        'dq_violations': {},
         'orphan_count': 0,
         'discarded_count': 0,
         'validations_passed': True
@@ -45,7 +51,7 @@ def process_payload_with_logging(payload, max_rows_limit=10000, request_user="AP
         total_rows = sum(len(df) for df in payload.values())
         if total_rows > max_rows_limit:
             logger.error(f"[{request_id}] FALHA: Payload excede o limite de linhas ({total_rows} > {max_rows_limit}).")
-            raise ValueError("Payload muito grande.")
+            raise ValueError("Payload muito grande. Use POST /jobs para cargas acima do limite.")
             
         for name, df in payload.items():
             rows = len(df)
@@ -79,17 +85,12 @@ def process_payload_with_logging(payload, max_rows_limit=10000, request_user="AP
         # cópia do dataframe para evitar alterações no original
         df_copy = df.copy() 
         
-        # conversão de datas
-        date_cols = [col for col in df_copy.columns if 'date' in col or 'timestamp' in col]
-        for col in date_cols:
-            if col in df_copy.columns:
-                initial_na_count = df_copy[col].isna().sum()
-                df_copy[col] = pd.to_datetime(df_copy[col], errors='coerce')
-                new_na_count = df_copy[col].isna().sum()
-                if new_na_count > initial_na_count:
-                    warnings_count = new_na_count - initial_na_count
-                    logger.warning(f"[{request_id}] WARNING: {warnings_count} datas inválidas/inconsistentes (NaT) em '{dataset_name}.{col}'.")
-                    audit_metrics['validations_passed'] = False # ✅ CORREÇÃO: Data inválida = Falha na Validação
+        # conversão de datas (só as colunas temporais conhecidas; inválidos contados uma vez)
+        datas_invalidas = parse_datetime_columns(df_copy, DATE_COLUMNS)
+        for col, warnings_count in datas_invalidas.items():
+            if warnings_count > 0:
+                logger.warning(f"[{request_id}] WARNING: {warnings_count} datas inválidas/inconsistentes (NaT) em '{dataset_name}.{col}'.")
+                audit_metrics['validations_passed'] = False # ✅ CORREÇÃO: Data inválida = Falha na Validação
         
         # conversão de numéricos 
         if dataset_name == 'order_items':
@@ -101,6 +102,24 @@ def process_payload_with_logging(payload, max_rows_limit=10000, request_user="AP
                          logger.warning(f"[{request_id}] WARNING: {na_after_coerce} valores não numéricos em '{col}' (convertidos para NaN).")
                          audit_metrics['validations_passed'] = False
                     
+        # chaves primárias repetidas (antes dos órfãos, que então comparam conjuntos menores)
+        entity = 'items' if dataset_name == 'order_items' else dataset_name
+        if dedup_policy is not None:
+            df_copy, dup_counts = deduplicate(entity, df_copy, dedup_policy)
+            if dup_counts is not None:
+                audit_metrics['duplicate_counts'][dataset_name] = dup_counts['duplicates']
+                if dup_counts['duplicates'] > 0:
+                    logger.warning(f"[{request_id}] WARNING: {dup_counts['duplicates']} chaves primárias repetidas em '{dataset_name}' ({dup_counts['identical']} linhas idênticas), política '{dedup_policy}'.")
+                    audit_metrics['validations_passed'] = False
+
+        # regras de qualidade (mesmo motor dos cleaners); só contagens, as linhas seguem
+        flags = evaluate_rules(entity, df_copy)
+        if flags is not None:
+            resumo = summarize(entity, flags)
+            audit_metrics['dq_violations'][dataset_name] = resumo
+            if resumo['linhas_com_violacao'] > 0:
+                logger.warning(f"[{request_id}] WARNING: {resumo['linhas_com_violacao']} linhas violam regras de qualidade em '{dataset_name}'.")
+
         processed_payload[dataset_name] = df_copy
         
         processing_end = time.time()
@@ -1,108 +1,753 @@
+import copy
+import itertools
 import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import numpy as np
-from typing import Dict, List, Any
+from typing import Callable, Dict, Iterable, List, Any, Optional, Iterator, Tuple, Union
 from app.services import data_cleaner  # Módulo com as funções de limpeza
 from app.services.validators import IntegrityValidator # Assumindo que esta classe existe
+from app.services.dimension_store import DimensionKeyStore, dimension_store_from_env
+from app.services.json_encoder import encode_response, iter_ndjson
+from app.services.instrumentation import medir_pico_memoria
+from app.services.stats_profile import StatsProfile, stats_profile_from_env
+from app.services.dtype_profiles import DTYPE_PROFILES, compactar_dtypes, relatorio_economia
+from app.services.refined_store import RefinedStore, refined_store_from_env
+from app.services.dedup import deduplicate, deduplicate_by, dedup_policy_from_env
+from app.services.date_parser import DATE_COLUMNS
+from app.services.dq_rules import (
+    FLAGS_COLUMN, apply_rules, integrity_flags, merge_summaries, rules_version, summarize, summarize_by
+)
+from app.services.incremental import (
+    CHANGED, NEW, PRIMARY_KEYS, UNCHANGED, IncrementalStateStore, has_primary_key,
+    incremental_state_from_env, primary_keys, row_hashes
+)
 
 logger = logging.getLogger("pta-etl-api.processor")
 
-# Mapeamento das funções de limpeza (usa 'items' e 'sellers' para compatibilidade)
+# Copy-on-write: frames derivados (fatias, take, colunas) compartilham memória
+# com a origem até serem escritos, em vez de copiar tudo a cada etapa.
+# ATENÇÃO: a opção vale para o processo inteiro (API, jobs, run_etl quando
+# importa este módulo), não só para os cleaners. Ela não fica em um
+# option_context em volta da limpeza porque as opções do pandas são globais:
+# ligar/desligar por chamada mudaria a semântica das outras threads do pool no
+# meio do processamento. É o comportamento padrão do pandas 3.0.
+pd.set_option("mode.copy_on_write", True)
+
+# Mapeamento das funções de limpeza (usa 'items' e 'sellers' para compatibilidade).
+# O processor é dono dos DataFrames que constrói, então usa as versões in-place
+# (sem df.copy()); DataFrames recebidos prontos no payload também são consumidos.
 CLEANER_MAP = {
-    "orders": data_cleaner.limpar_pedidos,
-    "products": data_cleaner.limpar_produtos,
-    "items": data_cleaner.limpar_itens, # Corrigido para 'items' (nome interno do payload)
-    "sellers": data_cleaner.limpar_vendedores,
+    "orders": data_cleaner.limpar_pedidos_inplace,
+    "products": data_cleaner.limpar_produtos_inplace,
+    "items": data_cleaner.limpar_itens_inplace, # Corrigido para 'items' (nome interno do payload)
+    "sellers": data_cleaner.limpar_vendedores_inplace,
+}
+
+# Versão da limpeza: incrementar quando uma mudança nos cleaners alterar a saída
+# para o mesmo payload (invalida o cache de respostas do /process)
+CLEANER_VERSION = "1"
+
+# Dados de uma entidade: registros (lista de dicts) ou DataFrame colunar
+EntityData = Union[List[Dict[str, Any]], pd.DataFrame]
+
+# O payload da API chega com 'order_items'; internamente a entidade se chama 'items'
+ENTITY_ALIASES = {
+    "order_items": "items",
+}
+OUTPUT_NAMES = {internal: name for name, internal in ENTITY_ALIASES.items()}
+
+# Formato da seção 'orphans':
+#   full    -> registros completos dos itens órfãos, um frame por grupo (items_orders, ...)
+#   compact -> só a chave primária (ou a posição da linha) e o código do motivo, mais a
+#              seção 'orphan_counts'; nenhum registro órfão é copiado
+ORPHAN_MODES = ("full", "compact")
+
+# Bits do código de motivo dos órfãos (mesma ordem das chaves na validação de integridade)
+ORPHAN_REASONS = {"order_id": 1, "product_id": 2, "seller_id": 4}
+
+# Coluna com o índice do payload de origem no endpoint em lote (process_batch_frames)
+BATCH_COLUMN = "payload_id"
+
+# Seções só com contagens: no processamento em blocos são somadas e saem no fim
+COUNT_SECTIONS = ("dq", "orphan_counts", "incremental")
+
+# Chaves das dimensões que alimentam o índice persistente (entidade -> chave primária)
+DIMENSION_KEYS = {
+    "orders": "order_id",
+    "products": "product_id",
+    "sellers": "seller_id",
 }
 
+
+class _ChainedKeyStore:
+    """Consulta vários índices de chaves: uma chave vale se estiver em qualquer um."""
+
+    def __init__(self, *stores):
+        self.stores = stores
+
+    def contains(self, key_name: str, values: pd.Series) -> np.ndarray:
+        found = np.zeros(len(values), dtype=bool)
+        for store in self.stores:
+            if found.all():
+                break
+            pending = np.flatnonzero(~found)
+            found[pending] = store.contains(key_name, values.iloc[pending])
+        return found
+
+
 class ETLProcessor:
-    def __init__(self):
+    def __init__(
+        self,
+        parallel: bool = False,
+        dimension_store: Optional[DimensionKeyStore] = None,
+        trace_memory: bool = False,
+        stats_profile: Optional[StatsProfile] = None,
+        dtype_profiles: Optional[Dict[str, Dict[str, str]]] = None,
+        refined_store: Optional[RefinedStore] = None,
+        incremental_state: Optional[IncrementalStateStore] = None,
+        dedup_policy: Optional[str] = None,
+        dq_rules: bool = False,
+        orphan_mode: str = "full"
+    ):
+        if orphan_mode not in ORPHAN_MODES:
+            raise ValueError(f"Modo de órfãos inválido: {orphan_mode!r}. Use um de {list(ORPHAN_MODES)}.")
         self.cleaner_map = CLEANER_MAP
+        # parallel=True limpa as entidades ao mesmo tempo; o modo sequencial
+        # continua disponível (e é o padrão) para facilitar a depuração.
+        self.parallel = parallel
+        # Índice persistente de chaves: permite enviar itens sem reenviar as dimensões
+        self.dimension_store = dimension_store
+        # Loga o pico de memória de cada process_frames (diagnóstico, deixa mais lento)
+        self.trace_memory = trace_memory
+        # Perfil estatístico ajustado: medianas/limites IQR fixos em vez de recalculados
+        self.stats_profile = stats_profile
+        # Perfis de dtype por entidade (ids Arrow, categóricos, números reduzidos);
+        # None mantém os dtypes inferidos pelo pandas
+        self.dtype_profiles = dtype_profiles
+        # Store Parquet particionado: a seção 'data' de cada processamento é gravada nele
+        self.refined_store = refined_store
+        # Modo incremental: só linhas novas/alteradas (hash por chave primária) são limpas
+        self.incremental_state = incremental_state
+        # Deduplicação por chave primária antes de tudo ('first', 'last', 'newest'; None = desligada)
+        self.dedup_policy = dedup_policy
+        # Regras de qualidade (app/services/dq_rules.py): coluna dq_flags + seção 'dq' com o resumo
+        self.dq_rules = dq_rules
+        # Formato padrão da seção 'orphans' (pode ser trocado por requisição)
+        self.orphan_mode = orphan_mode
+        # Coluna que separa os payloads de um lote (só na cópia usada por process_batch_frames):
+        # medianas, dedup, integridade e contagens passam a ser por payload
+        self.batch_column: Optional[str] = None
+
+    def cache_version(self) -> str:
+        """
+        Tudo o que muda a resposta para o mesmo payload: versão dos cleaners,
+        perfil estatístico, regras de qualidade, dedup, modo de órfãos e dtypes.
+        """
+        return ":".join([
+            CLEANER_VERSION,
+            self.stats_profile.version if self.stats_profile is not None else "-",
+            rules_version() if self.dq_rules else "-",
+            self.dedup_policy or "-",
+            self.orphan_mode,
+            "dtypes" if self.dtype_profiles is not None else "-",
+        ])
+
+    def response_cacheable(self) -> bool:
+        """
+        Com índice de dimensões ou estado incremental, a resposta depende do que
+        já foi recebido; com refined store, um acerto deixaria de gravar o payload.
+        """
+        return self.dimension_store is None and self.incremental_state is None and self.refined_store is None
+
+    def _clean_entity(self, entity_name: str, raw_data: EntityData):
+        try:
+            # Aceita registros (lista de dicts) ou um DataFrame já colunar (ingestão)
+            if isinstance(raw_data, pd.DataFrame):
+                if raw_data.empty:
+                    return None
+            elif not raw_data:
+                return None
+            cleaner_func = self.cleaner_map.get(entity_name)
+
+            if cleaner_func is None:
+                logger.warning("Nenhum cleaner para entidade: %s", entity_name)
+                return None
+
+            df = raw_data if isinstance(raw_data, pd.DataFrame) else pd.DataFrame(raw_data)
+            if self.dtype_profiles is None:
+                df = cleaner_func(df, perfil=self.stats_profile, grupo=self.batch_column)
+            else:
+                # Perfil de dtypes aplicado na construção (ids/categorias/inteiros) e
+                # de novo após a limpeza, quando os floats já não têm nulos a imputar
+                relatorio = {} if self.trace_memory else None
+                df = compactar_dtypes(entity_name, df, final=False, profiles=self.dtype_profiles, relatorio=relatorio)
+                df = cleaner_func(df, perfil=self.stats_profile, grupo=self.batch_column)
+                df = compactar_dtypes(entity_name, df, final=True, profiles=self.dtype_profiles, relatorio=relatorio)
+                if relatorio:
+                    relatorio_economia(entity_name, relatorio)
+
+            # Todas as regras da entidade em uma passada, gravadas em uma única coluna de bits
+            return apply_rules(entity_name, df, grupo=self.batch_column) if self.dq_rules else df
 
-    def process_payload(self, payload: Dict[str, List[Dict[str, Any]]]) -> Dict[str, Any]:
+        except Exception as e:
+            logger.exception("Erro ao limpar entidade %s: %s", entity_name, e)
+            raise
+
+    def _iter_cleaned(self, payload: Dict[str, EntityData]) -> Iterator[Tuple[str, Optional[pd.DataFrame]]]:
+        # As entidades são independentes até a validação de integridade, então
+        # no modo paralelo cada uma roda em sua thread e o join acontece aqui.
+        if self.parallel and len(payload) > 1:
+            with ThreadPoolExecutor(max_workers=len(payload), thread_name_prefix="etl-cleaner") as pool:
+                futures = {
+                    entity_name: pool.submit(self._clean_entity, entity_name, raw_data)
+                    for entity_name, raw_data in payload.items()
+                }
+                for entity_name, future in futures.items():
+                    yield entity_name, future.result()
+        else:
+            for entity_name, raw_data in payload.items():
+                yield entity_name, self._clean_entity(entity_name, raw_data)
+
+    def iter_frames(
+        self,
+        payload: Dict[str, EntityData],
+        orphan_mode: Optional[str] = None,
+        parent_frames: Optional[Dict[str, pd.DataFrame]] = None
+    ) -> Iterator[Tuple[str, str, pd.DataFrame]]:
+        """
+        Executa limpeza + integridade, gerando (secao, entidade, df) assim que cada
+        DataFrame fica pronto: as dimensões saem logo após a limpeza; os itens e
+        os órfãos, depois da validação de integridade.
+
+        Com dedup_policy, chaves primárias repetidas são removidas antes da
+        limpeza e a seção 'duplicates' traz as contagens de cada entidade. No
+        modo incremental, só as linhas novas ou alteradas seguem para a limpeza
+        e a seção 'incremental' traz as contagens de cada entidade.
+
+        `orphan_mode` ('full' ou 'compact') substitui o modo padrão do processor.
+        `parent_frames` ({entidade: df}) são dimensões já limpas, usadas na
+        validação dos itens quando não vêm no payload (processamento em blocos).
+        """
+        orphan_mode = orphan_mode or self.orphan_mode
+        if orphan_mode not in ORPHAN_MODES:
+            raise ValueError(f"Modo de órfãos inválido: {orphan_mode!r}. Use um de {list(ORPHAN_MODES)}.")
+
+        if self.dedup_policy is not None:
+            payload, dedup = self._deduplicate(payload)
+            for entity, counts in dedup.items():
+                yield "duplicates", OUTPUT_NAMES.get(entity, entity), pd.DataFrame([counts])
+
+        if self.refined_store is None and self.incremental_state is None:
+            yield from self._iter_frames(payload, orphan_mode, parent_frames)
+            return
+
+        delta = {}
+        if self.incremental_state is not None:
+            payload, delta = self._filter_delta(payload)
+
+        refined = {}
+        for section, entity, df in self._iter_frames(payload, orphan_mode, parent_frames):
+            if section == "data":
+                refined[entity] = df
+            yield section, entity, df
+
+        for entity, (_, _, status) in delta.items():
+            counts = {
+                "received": len(status),
+                "new": int((status == NEW).sum()),
+                "changed": int((status == CHANGED).sum()),
+                "unchanged": int((status == UNCHANGED).sum()),
+            }
+            yield "incremental", OUTPUT_NAMES.get(entity, entity), pd.DataFrame([counts])
+
+        # Só depois de tudo pronto: um processamento que falhou não deixa dados parciais
+        if self.refined_store is not None:
+            stale = {}
+            for entity, (keys, _, status) in delta.items():
+                # Chaves alteradas saem do store mesmo que a nova versão não esteja em 'data'
+                stale[OUTPUT_NAMES.get(entity, entity)] = keys[status[status != UNCHANGED] == CHANGED].tolist()
+            self._write_refined(refined, stale)
+
+        # Registra os hashes só das linhas que saíram em 'data' (itens órfãos são
+        # reenviados e reavaliados na próxima carga)
+        for entity, (keys, hashes, _) in delta.items():
+            df = refined.get(OUTPUT_NAMES.get(entity, entity))
+            if df is None:
+                continue
+            done = keys.isin(primary_keys(entity, df)).to_numpy()
+            self.incremental_state.commit(entity, keys[done], hashes[done])
+
+    def _write_refined(self, refined: Dict[str, pd.DataFrame], stale: Optional[Dict[str, List[str]]] = None) -> None:
+        """
+        Grava a seção 'data' no refined store como upsert pela chave primária
+        (PRIMARY_KEYS): reenviar um payload substitui as linhas em vez de
+        acumular cópias. Entidades sem as colunas da chave são só anexadas.
+        """
+        for name, df in refined.items():
+            entity = ENTITY_ALIASES.get(name, name)
+            if has_primary_key(entity, df):
+                self.refined_store.upsert(name, df, PRIMARY_KEYS[entity], (stale or {}).get(name, ()))
+            else:
+                self.refined_store.write(name, df)
+
+    def _deduplicate(self, payload: Dict[str, EntityData]):
+        """Aplica a política de dedup a cada entidade com chave primária."""
+        deduped, counts = {}, {}
+        for name, raw_data in payload.items():
+            entity = ENTITY_ALIASES.get(name, name)
+            df = raw_data if isinstance(raw_data, pd.DataFrame) else pd.DataFrame(raw_data)
+            deduped[name], entity_counts = deduplicate(entity, df, self.dedup_policy)
+            if entity_counts is not None:
+                counts[entity] = entity_counts
+        return deduped, counts
+
+    def _filter_delta(self, payload: Dict[str, EntityData]):
+        """Separa as linhas novas/alteradas de cada entidade com chave primária."""
+        filtered, delta = {}, {}
+        for name, raw_data in payload.items():
+            entity = ENTITY_ALIASES.get(name, name)
+            df = raw_data if isinstance(raw_data, pd.DataFrame) else pd.DataFrame(raw_data)
+            if df.empty or not has_primary_key(entity, df):
+                filtered[name] = raw_data
+                continue
+
+            keys, hashes = primary_keys(entity, df), row_hashes(df)
+            status = self.incremental_state.diff(entity, keys, hashes)
+            pending = np.flatnonzero(status != UNCHANGED)
+            filtered[name] = df.take(pending).reset_index(drop=True)
+            # Chaves/hashes das linhas que vão para a limpeza + status de todas as recebidas
+            delta[entity] = (keys.iloc[pending].reset_index(drop=True), hashes[pending], status)
+            logger.info(
+                "Incremental [%s]: %d recebidas, %d para processar", entity, len(status), len(pending)
+            )
+        return filtered, delta
+
+    def _iter_frames(
+        self,
+        payload: Dict[str, EntityData],
+        orphan_mode: str = "full",
+        parent_frames: Optional[Dict[str, pd.DataFrame]] = None
+    ) -> Iterator[Tuple[str, str, pd.DataFrame]]:
         processed_dfs = {}
-        orphans_dfs = {}
+        parent_frames = parent_frames or {}
+        payload = {ENTITY_ALIASES.get(name, name): raw_data for name, raw_data in payload.items()}
 
         # 1. Limpeza e Transformação para cada entidade
-        for entity_name, raw_data in payload.items():
-            try:
-                if not raw_data:
-                    continue
-                df = pd.DataFrame(raw_data)
-                cleaner_func = self.cleaner_map.get(entity_name)
-                
-                if cleaner_func is None:
-                    logger.warning("Nenhum cleaner para entidade: %s", entity_name)
-                    continue
-                
-                df_clean = cleaner_func(df)
-                processed_dfs[entity_name] = df_clean
-                    
-            except Exception as e:
-                logger.exception("Erro ao limpar entidade %s: %s", entity_name, e)
-                raise
+        for entity_name, df_clean in self._iter_cleaned(payload):
+            if df_clean is None:
+                continue
+            processed_dfs[entity_name] = df_clean
+            if entity_name != "items":
+                yield "data", entity_name, df_clean
+                if FLAGS_COLUMN in df_clean.columns:
+                    yield "dq", entity_name, self._dq_frame(entity_name, df_clean[FLAGS_COLUMN].to_numpy(), df_clean)
 
         # 2. Validação de Integridade Referencial (CRÍTICA: order_items/items)
         try:
             # Usamos 'items' pois é o nome interno do Payload corrigido
-            if "items" in processed_dfs:
-                items_df = processed_dfs["items"]
-                
-                # --- ATENÇÃO: TRATAMENTO DE ÓRFÃOS PARA AS 3 CHAVES É SEQUENCIAL ---
-                
-                # 1. order_items -> orders
-                items_df, orphan_orders = IntegrityValidator.validate_referential_integrity(
-                    child_df=items_df, parent_df=processed_dfs.get("orders", pd.DataFrame()), child_key="order_id", parent_key="order_id"
-                )
-                
-                # 2. order_items -> products (Seu órfão de teste está aqui!)
-                items_df, orphan_products = IntegrityValidator.validate_referential_integrity(
-                    child_df=items_df, parent_df=processed_dfs.get("products", pd.DataFrame()), child_key="product_id", parent_key="product_id"
+            key_store = self.dimension_store
+            if self.incremental_state is not None:
+                # Dimensões inalteradas não passam pela limpeza: os itens as encontram no estado
+                key_store = (
+                    self.incremental_state if key_store is None
+                    else _ChainedKeyStore(self.incremental_state, key_store)
                 )
-                
-                # 3. order_items -> sellers
-                items_df, orphan_sellers = IntegrityValidator.validate_referential_integrity(
-                    child_df=items_df, parent_df=processed_dfs.get("sellers", pd.DataFrame()), child_key="seller_id", parent_key="seller_id"
+
+            if self.dimension_store is not None:
+                for entity, key in DIMENSION_KEYS.items():
+                    df_dim = processed_dfs.get(entity)
+                    if df_dim is not None and key in df_dim.columns:
+                        self.dimension_store.update(key, df_dim[key])
+
+            if "items" not in processed_dfs:
+                return
+
+            # As 3 chaves (orders, products, sellers) são checadas em uma única
+            # passada; cada item órfão cai no grupo da primeira chave que falhou.
+            parents = [
+                (group, processed_dfs.get(entity, parent_frames.get(entity)), key, key)
+                for group, entity, key in (
+                    ("items_orders", "orders", "order_id"),
+                    ("items_products", "products", "product_id"),
+                    ("items_sellers", "sellers", "seller_id"),
                 )
+            ]
+            items_df, orphan_groups, reasons = IntegrityValidator.validate_fused_integrity(
+                child_df=processed_dfs["items"],
+                parents=parents,
+                key_store=key_store,
+                collect_orphans=orphan_mode == "full",
+                scope=self.batch_column
+            )
 
-                processed_dfs["items"] = items_df
-                
-                # Adiciona órfãos para logs
-                if not orphan_orders.empty: orphans_dfs["items_orders"] = orphan_orders
-                if not orphan_products.empty: orphans_dfs["items_products"] = orphan_products
-                if not orphan_sellers.empty: orphans_dfs["items_sellers"] = orphan_sellers
-                    
         except Exception as e:
             logger.exception("Erro na validação de integridade: %s", e)
             raise
 
+        if FLAGS_COLUMN in processed_dfs["items"].columns:
+            orphan_groups = self._flag_orphans(processed_dfs["items"], orphan_groups, reasons)
+
+        # Para fins de retorno, o nome 'items' é mapeado de volta para 'order_items'
+        yield "data", "order_items", items_df
+
+        # Adiciona órfãos para logs
+        if orphan_mode == "compact":
+            orphans, counts = self._compact_orphans(
+                processed_dfs["items"], reasons, [group for group, *_ in parents], self.batch_column
+            )
+            yield "orphans", "order_items", orphans
+            yield "orphan_counts", "order_items", counts
+        for group, orphan_df in orphan_groups.items():
+            yield "orphans", group, orphan_df
+
+        if FLAGS_COLUMN in processed_dfs["items"].columns:
+            # Resumo sobre todos os itens recebidos (válidos + órfãos)
+            flags = processed_dfs["items"][FLAGS_COLUMN].to_numpy() | integrity_flags("items", reasons)
+            yield "dq", "order_items", self._dq_frame("items", flags, processed_dfs["items"])
+
+    def _dq_frame(self, entity: str, flags: np.ndarray, df: pd.DataFrame) -> pd.DataFrame:
+        """Resumo das regras de qualidade (uma linha; em lote, uma por payload)."""
+        if self.batch_column is not None:
+            return summarize_by(entity, flags, df[self.batch_column])
+        return pd.DataFrame([summarize(entity, flags)])
+
+    @staticmethod
+    def _flag_orphans(
+        items: pd.DataFrame,
+        orphan_groups: Dict[str, pd.DataFrame],
+        reasons: np.ndarray
+    ) -> Dict[str, pd.DataFrame]:
+        """Liga nos órfãos os bits de cada chave que falhou (os válidos não têm nenhum)."""
+        orphan_bits = integrity_flags("items", reasons)
+        flagged = {}
+        for group, orphan_df in orphan_groups.items():
+            # Os órfãos são linhas de `items` (take): o índice leva de volta à posição original
+            positions = items.index.get_indexer(orphan_df.index)
+            flagged[group] = orphan_df.assign(
+                **{FLAGS_COLUMN: orphan_df[FLAGS_COLUMN].to_numpy() | orphan_bits[positions]}
+            )
+        return flagged
+
+    def iter_frames_chunked(
+        self,
+        payload: Dict[str, EntityData],
+        chunk_rows: int,
+        orphan_mode: Optional[str] = None,
+        progress: Optional[Callable[[int], None]] = None,
+        item_chunks: Optional[Iterable[pd.DataFrame]] = None
+    ) -> Iterator[Tuple[str, str, pd.DataFrame]]:
+        """
+        iter_frames para payloads grandes: as dimensões são limpas uma vez e os
+        itens passam em blocos de `chunk_rows` linhas, validados contra as
+        chaves das dimensões já limpas. O dedup roda antes, sobre o payload
+        inteiro, e as seções de contagem (COUNT_SECTIONS) são somadas e saem
+        no fim. `progress(linhas)` é chamado a cada etapa concluída.
+
+        `item_chunks` traz os itens já em blocos (ex.: lidos do disco um de cada
+        vez pelos jobs), no lugar de order_items em `payload`.
+        """
+        frames = {
+            name: raw_data if isinstance(raw_data, pd.DataFrame) else pd.DataFrame(raw_data)
+            for name, raw_data in payload.items()
+        }
+        if item_chunks is not None and self.dedup_policy is not None:
+            # O dedup compara o payload inteiro: com ele ligado, os blocos voltam a ser um frame só
+            chunks = list(item_chunks)
+            if chunks:
+                frames[OUTPUT_NAMES["items"]] = pd.concat(chunks, ignore_index=True)
+            item_chunks = None
+        # Cópia rasa: mesma configuração, sem repetir o dedup em cada bloco
+        runner = copy.copy(self)
+        if self.dedup_policy is not None:
+            frames, dedup = self._deduplicate(frames)
+            for entity, counts in dedup.items():
+                yield "duplicates", OUTPUT_NAMES.get(entity, entity), pd.DataFrame([counts])
+            runner.dedup_policy = None
+            if progress is not None:
+                # Linhas descartadas pelo dedup também contam como concluídas
+                progress(sum(counts["duplicates"] for counts in dedup.values()))
+
+        totals: Dict[Tuple[str, str], Dict[str, int]] = {}
+
+        def passada(part, parent_frames=None, offset=0):
+            for section, entity, df in runner.iter_frames(part, orphan_mode, parent_frames):
+                if section in COUNT_SECTIONS:
+                    merge_summaries(totals.setdefault((section, entity), {}), df.iloc[0].to_dict())
+                    continue
+                if section == "orphans" and "row" in df.columns and offset:
+                    # Órfãos compactos sem chave primária: posição no payload, não no bloco
+                    df = df.assign(row=df["row"] + offset)
+                yield section, entity, df
+
+        # 1. Dimensões inteiras (só as chaves seguem para validar os blocos de itens)
+        items_name = next((name for name in frames if ENTITY_ALIASES.get(name, name) == "items"), None)
+        items = frames.pop(items_name) if items_name is not None else None
+        parents = {}
+        for section, entity, df in passada(frames):
+            key = DIMENSION_KEYS.get(entity)
+            if section == "data" and key in df.columns:
+                parents[entity] = df[[key]]
+            yield section, entity, df
+        if progress is not None:
+            progress(sum(len(df) for df in frames.values()))
+
+        # 2. Itens em blocos
+        if item_chunks is None and items is not None:
+            item_chunks = (
+                items.iloc[start:start + chunk_rows].reset_index(drop=True)
+                for start in range(0, len(items), chunk_rows)
+            )
+        offset = 0
+        for chunk in item_chunks or ():
+            yield from passada({items_name or OUTPUT_NAMES["items"]: chunk}, parents, offset)
+            offset += len(chunk)
+            if progress is not None:
+                progress(len(chunk))
+
+        for (section, entity), counts in totals.items():
+            yield section, entity, pd.DataFrame([counts])
+
+    def process_batch_frames(
+        self,
+        payloads: List[Dict[str, EntityData]],
+        orphan_mode: Optional[str] = None
+    ) -> List[Dict[str, Dict[str, pd.DataFrame]]]:
+        """
+        Processa N payloads em uma passada: cada entidade é concatenada com a
+        coluna BATCH_COLUMN e limpa/validada uma vez só. O que depende do lote
+        continua por payload: medianas dos cleaners, dedup e integridade (chaves
+        compostas com o payload) e as seções de contagem. Devolve uma lista com
+        as seções de cada payload, no formato de process_frames.
+        """
+        if self.incremental_state is not None:
+            # O estado incremental é sequencial: cada payload depende do commit do anterior
+            return [self.process_frames(payload, orphan_mode) for payload in payloads]
+
+        results: List[Dict[str, Dict[str, pd.DataFrame]]] = [{"data": {}, "orphans": {}} for _ in payloads]
+        combined, present = self._concat_payloads(payloads)
+
+        runner = copy.copy(self)
+        runner.batch_column = BATCH_COLUMN
+        runner.dedup_policy = None
+        runner.refined_store = None
+
+        sections = []
+        if self.dedup_policy is not None:
+            for name in list(combined):
+                entity = ENTITY_ALIASES.get(name, name)
+                combined[name], counts = deduplicate_by(entity, combined[name], BATCH_COLUMN, self.dedup_policy)
+                if counts is not None:
+                    sections.append(("duplicates", OUTPUT_NAMES.get(entity, entity), counts))
+
+        refined = {}
+        for section, entity, df in itertools.chain(sections, runner.iter_frames(combined, orphan_mode)):
+            if section == "data":
+                refined[entity] = df.drop(columns=BATCH_COLUMN)
+            parts = self._split_batch(df, len(payloads))
+            # Entidade que veio no payload sai em 'data' mesmo sem linhas válidas (como em process_frames)
+            owners = present.get(entity, ()) if section == "data" else (pid for pid, part in enumerate(parts) if part is not None)
+            for pid in owners:
+                part = parts[pid] if parts[pid] is not None else df.iloc[0:0].drop(columns=BATCH_COLUMN)
+                if section == "orphans" and "dq_issue" in part.columns and part["dq_issue"].isna().all():
+                    # Payload sem a entidade pai: sozinho, os órfãos sairiam sem o aviso
+                    part = part.drop(columns="dq_issue")
+                results[pid].setdefault(section, {})[entity] = part
+
+        if self.refined_store is not None:
+            self._write_refined(refined)
+
+        # Mantém as entidades de 'data' na ordem em que chegaram em cada payload
+        for payload, result in zip(payloads, results):
+            order = ["order_items" if name in ("items", "order_items") else name for name in payload]
+            result["data"] = {entity: result["data"][entity] for entity in order if entity in result["data"]}
+        return results
+
+    @staticmethod
+    def _concat_payloads(payloads: List[Dict[str, EntityData]]):
+        """Concatena cada entidade dos payloads com a coluna BATCH_COLUMN; devolve também quem tinha linhas."""
+        combined, present = {}, {}
+        for name in dict.fromkeys(name for payload in payloads for name in payload):
+            owners = [pid for pid, payload in enumerate(payloads) if payload.get(name) is not None and len(payload[name])]
+            if not owners:
+                continue
+            parts = [payloads[pid][name] for pid in owners]
+            if all(isinstance(part, list) for part in parts):
+                # Registros: um único construtor para todos os payloads
+                df = pd.DataFrame([record for part in parts for record in part])
+            else:
+                df = pd.concat(
+                    [part if isinstance(part, pd.DataFrame) else pd.DataFrame(part) for part in parts],
+                    ignore_index=True
+                )
+            df[BATCH_COLUMN] = np.repeat(np.asarray(owners, dtype=np.int64), [len(part) for part in parts])
+            entity = ENTITY_ALIASES.get(name, name)
+            combined[name] = df
+            present[OUTPUT_NAMES.get(entity, entity)] = owners
+        return combined, present
+
+    @staticmethod
+    def _split_batch(df: pd.DataFrame, n_payloads: int) -> List[Optional[pd.DataFrame]]:
+        """Separa df por BATCH_COLUMN (sem a coluna); None para payloads sem linhas."""
+        pids = df[BATCH_COLUMN].to_numpy()
+        if not df[BATCH_COLUMN].is_monotonic_increasing:
+            order = np.argsort(pids, kind="stable")
+            df, pids = df.take(order), pids[order]
+        starts = np.searchsorted(pids, np.arange(n_payloads), side="left")
+        ends = np.searchsorted(pids, np.arange(n_payloads), side="right")
+        df = df.drop(columns=BATCH_COLUMN)
+        # Datas de payloads com e sem fuso ficam em uma coluna object: cada parte
+        # volta ao dtype que teria sozinha
+        mixed = [col for col in DATE_COLUMNS if col in df.columns and df[col].dtype == object]
+        parts = []
+        for start, end in zip(starts, ends):
+            part = df.iloc[start:end].reset_index(drop=True) if end > start else None
+            if part is not None and mixed:
+                part = part.assign(**{col: part[col].infer_objects() for col in mixed})
+            parts.append(part)
+        return parts
+
+    @staticmethod
+    def _compact_orphans(
+        items: pd.DataFrame,
+        reasons: np.ndarray,
+        groups: List[str],
+        scope: Optional[str] = None
+    ) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Órfãos no modo compacto: chave primária (ou a posição da linha em
+        order_items, se o payload não tiver a chave) + código do motivo, com
+        as contagens por grupo (primeira chave que falhou, como no modo full).
+        Com `scope` (endpoint em lote), a coluna do payload vai junto e as
+        contagens saem por payload.
+        """
+        positions = np.flatnonzero(reasons)
+        scope_columns = [scope] if scope is not None else []
+        if has_primary_key("items", items):
+            orphans = items[scope_columns + PRIMARY_KEYS["items"]].take(positions).reset_index(drop=True)
+        else:
+            # Sem chave primária não há dedup nem incremental: a posição é a do payload
+            rows = positions
+            if scope is not None:
+                # Os payloads vêm concatenados em ordem: posição relativa ao início de cada um
+                first_row = pd.Series(np.arange(len(items))).groupby(items[scope].to_numpy()).transform("min").to_numpy()
+                rows = positions - first_row[positions]
+            orphans = items[scope_columns].take(positions).reset_index(drop=True).assign(row=rows)
+        orphans["reason"] = reasons[positions]
+
+        first_failure = reasons & (~reasons + np.uint8(1))
+        if scope is None:
+            counts = {group: int(np.count_nonzero(first_failure == (1 << bit_pos))) for bit_pos, group in enumerate(groups)}
+            counts["total"] = len(positions)
+            return orphans, pd.DataFrame([counts])
+
+        codes, scopes = pd.factorize(items[scope], sort=True)
+        counts = {scope: scopes}
+        for bit_pos, group in enumerate(groups):
+            counts[group] = np.bincount(codes, weights=first_failure == (1 << bit_pos), minlength=len(scopes)).astype(np.int64)
+        counts["total"] = np.bincount(codes, weights=reasons != 0, minlength=len(scopes)).astype(np.int64)
+        return orphans, pd.DataFrame(counts)
+
+    def process_frames(
+        self,
+        payload: Dict[str, EntityData],
+        orphan_mode: Optional[str] = None
+    ) -> Dict[str, Dict[str, pd.DataFrame]]:
+        """Executa limpeza + integridade e devolve {'data': {...}, 'orphans': {...}} em DataFrames."""
+        sections = {"data": {}, "orphans": {}}
+        if self.trace_memory:
+            with medir_pico_memoria("process_frames"):
+                for section, entity, df in self.iter_frames(payload, orphan_mode):
+                    sections.setdefault(section, {})[entity] = df
+        else:
+            for section, entity, df in self.iter_frames(payload, orphan_mode):
+                sections.setdefault(section, {})[entity] = df
+
+        # Mantém as entidades de 'data' na ordem em que chegaram no payload
+        order = ["order_items" if name in ("items", "order_items") else name for name in payload]
+        sections["data"] = {entity: sections["data"][entity] for entity in order if entity in sections["data"]}
+        return sections
+
+    def process_payload(self, payload: Dict[str, EntityData], orphan_mode: Optional[str] = None) -> Dict[str, Any]:
+        sections = self.process_frames(payload, orphan_mode)
+
         # 3. Formata resposta final e Sanitização de Saída (NaN/NaT -> None)
         final_response = {"status": "success", "data": {}, "orphans": {}}
-        
-        for entity, df in processed_dfs.items():
-            try:
-                # CORREÇÃO CRÍTICA: Substitui np.nan e NaT por None (JSON null) antes de serializar
-                df_sanitized = df.replace({np.nan: None})
-                
-                # Para fins de retorno, o nome 'items' deve ser mapeado de volta para 'order_items' 
-                # na chave de saída, se necessário. Aqui assumimos que o Pydantic OutputPayload
-                # aceitará a chave mapeada ou renomeamos antes de retornar:
-                key_name = 'order_items' if entity == 'items' else entity
-                
-                final_response["data"][key_name] = df_sanitized.to_dict(orient="records")
-            except Exception as e:
-                logger.exception("Erro ao converter df para records na entidade %s: %s", entity, e)
-                raise
-
-        # Sanitiza e adiciona os órfãos
-        for entity, df in orphans_dfs.items():
-             try:
-                df_sanitized = df.replace({np.nan: None})
-                final_response["orphans"][entity] = df_sanitized.to_dict(orient="records")
-             except Exception as e:
-                logger.exception("Erro ao converter orphans df para records na entidade %s: %s", entity, e)
-                raise
+
+        for section, frames in sections.items():
+            for entity, df in frames.items():
+                try:
+                    # CORREÇÃO CRÍTICA: Substitui np.nan e NaT por None (JSON null) antes de serializar
+                    df_sanitized = df.replace({np.nan: None})
+                    final_response.setdefault(section, {})[entity] = df_sanitized.to_dict(orient="records")
+                except Exception as e:
+                    logger.exception("Erro ao converter df para records na entidade %s: %s", entity, e)
+                    raise
 
         return final_response
 
-etl_processor = ETLProcessor()
\ No newline at end of file
+    def process_payload_json(self, payload: Dict[str, EntityData], orphan_mode: Optional[str] = None) -> bytes:
+        """
+        Mesmo resultado de process_payload, já serializado em JSON.
+
+        Cada DataFrame é codificado direto em bytes (NaN/NaT/Inf -> null em uma
+        passada vetorizada), sem replace() + to_dict() + sanitização por célula.
+        """
+        sections = self.process_frames(payload, orphan_mode)
+        try:
+            return encode_response(sections, meta={"status": "success"})
+        except Exception as e:
+            logger.exception("Erro ao serializar resposta: %s", e)
+            raise
+
+    def iter_payload_ndjson(
+        self,
+        payload: Dict[str, EntityData],
+        orphan_mode: Optional[str] = None,
+        chunk_size: int = 1000
+    ) -> Iterator[bytes]:
+        """iter_frames serializado em NDJSON, uma linha por bloco de até chunk_size registros."""
+        return iter_ndjson(self.iter_frames(payload, orphan_mode), chunk_size=chunk_size)
+
+    def process_batch_json(self, payloads: List[Dict[str, EntityData]], orphan_mode: Optional[str] = None) -> bytes:
+        """process_batch_frames serializado: {"status": ..., "results": [{payload_id, data, orphans, ...}]}."""
+        results = self.process_batch_frames(payloads, orphan_mode)
+        try:
+            parts = [
+                encode_response(sections, meta={BATCH_COLUMN: pid, "status": "success"})
+                for pid, sections in enumerate(results)
+            ]
+        except Exception as e:
+            logger.exception("Erro ao serializar resposta: %s", e)
+            raise
+        return b'{"status":"success","results":[' + b",".join(parts) + b"]}"
+
+    def process_payload_encoded(
+        self,
+        payload: Dict[str, EntityData],
+        encoder: Callable[[Dict[str, Dict[str, pd.DataFrame]]], bytes],
+        orphan_mode: Optional[str] = None
+    ) -> bytes:
+        """Processa e serializa as seções com `encoder` (ex.: Arrow IPC ou Parquet)."""
+        sections = self.process_frames(payload, orphan_mode)
+        try:
+            return encoder(sections)
+        except Exception as e:
+            logger.exception("Erro ao serializar resposta: %s", e)
+            raise
+
+etl_processor = ETLProcessor(
+    parallel=os.getenv("ETL_PARALLEL_CLEANING", "0") == "1",
+    dimension_store=dimension_store_from_env(),
+    trace_memory=os.getenv("ETL_TRACE_MEMORY", "0") == "1",
+    stats_profile=stats_profile_from_env(),
+    # Opt-in: os dtypes compactos mudam a resposta (contagens saem como inteiros: 1.0 -> 1)
+    dtype_profiles=DTYPE_PROFILES if os.getenv("ETL_COMPACT_DTYPES", "0") == "1" else None,
+    refined_store=refined_store_from_env(),
+    incremental_state=incremental_state_from_env(),
+    dedup_policy=dedup_policy_from_env(),
+    # Opt-in: a coluna dq_flags e a seção 'dq' mudam o formato da resposta
+    dq_rules=os.getenv("ETL_DQ_RULES", "0") == "1",
+    orphan_mode=os.getenv("ETL_ORPHAN_MODE", "full")
+)
\ No newline at end of file
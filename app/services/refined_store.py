@@ -0,0 +1,379 @@
+import datetime as dt
+import glob
+import logging
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.services.date_parser import parse_datetime
+from app.services.incremental import composite_keys
+from app.services.wire_formats import WireFormatUnavailable
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.fs as pafs
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow é opcional: sem ele o refined store fica indisponível
+    pa = None
+
+try:
+    import fcntl
+except ImportError:  # Windows: só o lock entre threads
+    fcntl = None
+
+logger = logging.getLogger("pta-etl-api.refined_store")
+
+# Coluna de data de referência de cada entidade (nomes de saída: 'order_items').
+# O mês dela vira a partição 'mes=YYYY-MM'; itens não têm data de compra, então
+# usam o prazo de envio. Produtos e vendedores não são particionados por mês.
+MONTH_COLUMNS = {
+    "orders": "order_purchase_timestamp",
+    "order_items": "shipping_limit_date",
+}
+PARTITION_KEY = "mes"
+
+# Filtros de igualdade aceitos na consulta (valem para as entidades que têm a coluna)
+FILTER_COLUMNS = ("order_status", "seller_state")
+
+
+class RefinedQueryError(ValueError):
+    """Consulta inválida para a entidade (coluna ou filtro inexistente)."""
+
+
+def _require_pyarrow() -> None:
+    if pa is None:
+        raise WireFormatUnavailable("O refined store (Parquet) exige o pacote 'pyarrow'.")
+
+
+def _key_digest(keys: pd.Series) -> np.ndarray:
+    """Hashes de 64 bits (ordenados) das chaves em texto de composite_keys."""
+    return np.sort(pd.util.hash_array(np.asarray(keys, dtype=object)))
+
+
+def _normalize_table(table: "pa.Table") -> "pa.Table":
+    """
+    Tipos canônicos do store, para que arquivos escritos pela API e pelo
+    run_etl.py (ou por lotes com dtypes diferentes) formem um único dataset:
+    categóricos viram texto, inteiros int64, floats float64, datas timestamp UTC.
+    """
+    fields, columns = [], []
+    for field, column in zip(table.schema, table.columns):
+        tipo = field.type
+        if pa.types.is_dictionary(tipo):
+            tipo = tipo.value_type
+        if pa.types.is_large_string(tipo) or pa.types.is_string(tipo):
+            tipo = pa.string()
+        elif pa.types.is_integer(tipo):
+            tipo = pa.int64()
+        elif pa.types.is_floating(tipo):
+            tipo = pa.float64()
+        elif pa.types.is_timestamp(tipo):
+            tipo = pa.timestamp("us", tz="UTC")
+        fields.append(pa.field(field.name, tipo))
+        columns.append(column.cast(tipo) if tipo != column.type else column)
+    return pa.Table.from_arrays(columns, schema=pa.schema(fields))
+
+
+class RefinedStore:
+    """
+    Store refinado em Parquet: <raiz>/<entidade>/mes=YYYY-MM/<origem>~<execução>-<token>-N.parquet.
+
+    Cada escrita tem uma origem (arquivo do run_etl.py ou requisição da API) e
+    um id de execução; reescrever a mesma origem e chamar prune() remove só os
+    arquivos das execuções anteriores dela. upsert() substitui as linhas pela
+    chave primária, independente da origem (usado pela API). As leituras usam pyarrow.dataset com
+    memory-map, projeção de colunas e filtros empurrados para o scan (partições
+    de mês descartadas pelo caminho; row groups, pelas estatísticas).
+    """
+
+    def __init__(self, root: str):
+        _require_pyarrow()
+        self.root = root
+        self._schemas: Dict[str, tuple] = {}
+        # Resumo das chaves de cada arquivo: caminho -> ((mtime, tamanho, colunas), hashes)
+        self._digests: Dict[str, Tuple[tuple, Optional[np.ndarray]]] = {}
+        self._entity_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # Só o caminho atravessa processos (pool em modo 'process', run_etl.py)
+        return {"root": self.root}
+
+    def __setstate__(self, state):
+        self.__init__(state["root"])
+
+    def _entity_dir(self, entity: str) -> str:
+        return os.path.join(self.root, entity)
+
+    @contextmanager
+    def _exclusive(self, entity: str) -> Iterator[None]:
+        """
+        Serializa as reescritas de uma entidade: lock entre threads e, onde
+        houver fcntl, flock em <raiz>/.<entidade>.lock entre processos (pool em
+        modo 'process', workers do run_etl.py).
+        """
+        with self._lock:
+            lock = self._entity_locks.setdefault(entity, threading.Lock())
+        with lock:
+            if fcntl is None:
+                yield
+                return
+            os.makedirs(self.root, exist_ok=True)
+            with open(os.path.join(self.root, f".{entity}.lock"), "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def write(self, entity: str, df: pd.DataFrame, source: Optional[str] = None, run_id: Optional[str] = None) -> str:
+        """Grava df como novos arquivos da entidade e devolve o id da execução."""
+        run_id = run_id or uuid.uuid4().hex[:12]
+        source = source or "api"
+        if df.empty:
+            return run_id
+
+        month_column = MONTH_COLUMNS.get(entity)
+        if month_column in df.columns:
+            datas = df[month_column]
+            if not pd.api.types.is_datetime64_any_dtype(datas.dtype):
+                datas = parse_datetime(datas, utc=True)
+            df = df.assign(**{month_column: datas, PARTITION_KEY: datas.dt.strftime("%Y-%m")})
+
+        table = _normalize_table(pa.Table.from_pandas(df, preserve_index=False))
+        partitioning = None
+        if PARTITION_KEY in table.column_names:
+            partitioning = ds.partitioning(pa.schema([(PARTITION_KEY, pa.string())]), flavor="hive")
+
+        ds.write_dataset(
+            table,
+            base_dir=self._entity_dir(entity),
+            format="parquet",
+            partitioning=partitioning,
+            # Token por escrita: chunks da mesma execução não sobrescrevem uns aos outros
+            basename_template=f"{source}~{run_id}-{uuid.uuid4().hex[:8]}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+        )
+        logger.debug("Refined store: %d linhas gravadas em %s (%s~%s)", len(df), entity, source, run_id)
+        return run_id
+
+    def prune(self, entity: str, source: str, keep_run_id: str) -> int:
+        """Remove os arquivos de execuções anteriores da mesma origem."""
+        removed = 0
+        pattern = os.path.join(glob.escape(self._entity_dir(entity)), "**", f"{glob.escape(source)}~*.parquet")
+        with self._exclusive(entity):
+            for path in glob.glob(pattern, recursive=True):
+                if not os.path.basename(path).startswith(f"{source}~{keep_run_id}-"):
+                    os.remove(path)
+                    removed += 1
+        return removed
+
+    def _file_digest(self, path: str, key_columns: List[str]) -> Optional[np.ndarray]:
+        """
+        Hashes das chaves do arquivo (None se ele não tem as colunas-chave). Lidos
+        uma vez por versão do arquivo e guardados em memória (8 bytes por linha).
+        """
+        stat = os.stat(path)
+        tag = (stat.st_mtime_ns, stat.st_size, tuple(key_columns))
+        with self._lock:
+            cached = self._digests.get(path)
+        if cached is not None and cached[0] == tag:
+            return cached[1]
+
+        with pq.ParquetFile(path, memory_map=True) as parquet:
+            if any(col not in parquet.schema_arrow.names for col in key_columns):
+                digest = None
+            else:
+                digest = _key_digest(composite_keys(parquet.read(columns=key_columns).to_pandas(), key_columns))
+        with self._lock:
+            self._digests[path] = (tag, digest)
+        return digest
+
+    def _candidate_files(self, entity: str, key_columns: List[str], targets: np.ndarray) -> List[str]:
+        """Arquivos cujo resumo de chaves contém algum dos hashes em `targets`."""
+        files = self._files(entity)
+        with self._lock:
+            # Arquivos que não existem mais saem do cache
+            for path in [path for path in self._digests if path.startswith(self._entity_dir(entity) + os.sep)]:
+                if path not in files:
+                    del self._digests[path]
+
+        candidates = []
+        for path in files:
+            digest = self._file_digest(path, key_columns)
+            if digest is None or not len(digest):
+                continue
+            # Pré-filtro pela faixa de hashes do arquivo; depois busca binária
+            inside = targets[(targets >= digest[0]) & (targets <= digest[-1])]
+            if not len(inside):
+                continue
+            pos = np.searchsorted(digest, inside).clip(max=len(digest) - 1)
+            if (digest[pos] == inside).any():
+                candidates.append(path)
+        return candidates
+
+    def delete_keys(self, entity: str, key_columns: List[str], keys: Sequence[str]) -> int:
+        """
+        Remove as versões antigas das chaves em `keys` (texto de composite_keys)
+        antes de um upsert. Os arquivos candidatos saem do resumo de hashes de
+        chave de cada arquivo, mantido em memória: só os que contêm alguma das
+        chaves têm as colunas-chave relidas e são reescritos.
+        """
+        with self._exclusive(entity):
+            return self._delete_keys(entity, key_columns, keys)
+
+    def _delete_keys(self, entity: str, key_columns: List[str], keys: Sequence[str]) -> int:
+        if not len(keys):
+            return 0
+        alvo = pd.Index(keys).unique()
+        removed = 0
+        for path in self._candidate_files(entity, key_columns, _key_digest(alvo.to_series())):
+            with pq.ParquetFile(path, memory_map=True) as parquet:
+                mask = composite_keys(parquet.read(columns=key_columns).to_pandas(), key_columns).isin(alvo).to_numpy()
+                if not mask.any():  # colisão de hash
+                    continue
+                table = parquet.read().filter(pa.array(~mask))
+            removed += int(mask.sum())
+            with self._lock:
+                self._digests.pop(path, None)
+            if table.num_rows == 0:
+                os.remove(path)
+                continue
+            # Nome com '.' na frente: ignorado por pyarrow.dataset enquanto não for renomeado
+            tmp_path = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.tmp")
+            pq.write_table(table, tmp_path)
+            os.replace(tmp_path, path)
+        logger.debug("Refined store: %d linhas antigas removidas de %s", removed, entity)
+        return removed
+
+    def upsert(
+        self,
+        entity: str,
+        df: pd.DataFrame,
+        key_columns: List[str],
+        stale_keys: Sequence[str] = (),
+        source: Optional[str] = None,
+        run_id: Optional[str] = None
+    ) -> str:
+        """
+        Grava df substituindo as versões já gravadas das mesmas chaves (e das
+        chaves em `stale_keys`, ex. linhas alteradas que não saíram em df): o
+        mesmo payload gravado duas vezes não duplica linhas. Chaves repetidas
+        dentro de df ficam só com a última ocorrência.
+        """
+        keys = composite_keys(df, key_columns)
+        latest = ~keys.duplicated(keep="last").to_numpy()
+        if not latest.all():
+            df, keys = df[latest], keys[latest]
+        # Remoção e escrita sob o mesmo lock: duas gravações das mesmas chaves não se intercalam
+        with self._exclusive(entity):
+            self._delete_keys(entity, key_columns, pd.Index(keys).append(pd.Index(stale_keys, dtype=object)))
+            return self.write(entity, df, source=source, run_id=run_id)
+
+    def _files(self, entity: str) -> List[str]:
+        return sorted(glob.glob(os.path.join(glob.escape(self._entity_dir(entity)), "**", "*.parquet"), recursive=True))
+
+    def _schema(self, entity: str, files: List[str]) -> "pa.Schema":
+        # Schema unificado (int + float -> float, nulo + texto -> texto), lido só
+        # dos rodapés e recalculado apenas quando os arquivos mudam
+        key = tuple((path, os.path.getmtime(path)) for path in files)
+        with self._lock:
+            cached = self._schemas.get(entity)
+            if cached and cached[0] == key:
+                return cached[1]
+        schemas = [pq.read_schema(path, memory_map=True) for path in files]
+        schema = pa.unify_schemas(schemas, promote_options="permissive")
+        if entity in MONTH_COLUMNS and PARTITION_KEY not in schema.names:
+            schema = schema.append(pa.field(PARTITION_KEY, pa.string()))
+        with self._lock:
+            self._schemas[entity] = (key, schema)
+        return schema
+
+    def entities(self) -> List[str]:
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root) if self._files(name))
+
+    def query(
+        self,
+        entity: str,
+        columns: Optional[Sequence[str]] = None,
+        date_from: Optional[dt.date] = None,
+        date_to: Optional[dt.date] = None,
+        filters: Optional[Dict[str, Sequence[str]]] = None,
+        limit: Optional[int] = None,
+    ) -> pd.DataFrame:
+        """
+        Lê a entidade aplicando projeção (`columns`), intervalo de datas
+        (inclusivo, sobre a coluna de referência da entidade) e filtros de
+        igualdade ({coluna: [valores]}), todos empurrados para o scan Parquet.
+        """
+        files = self._files(entity)
+        if not files:
+            raise RefinedQueryError(f"Entidade sem dados no refined store: {entity!r}.")
+
+        schema = self._schema(entity, files)
+        dataset = ds.dataset(
+            self._entity_dir(entity),
+            schema=schema,
+            format="parquet",
+            partitioning=(
+                ds.partitioning(pa.schema([(PARTITION_KEY, pa.string())]), flavor="hive")
+                if entity in MONTH_COLUMNS else None
+            ),
+            filesystem=pafs.LocalFileSystem(use_mmap=True),
+        )
+
+        if columns:
+            unknown = [col for col in columns if col not in schema.names]
+            if unknown:
+                raise RefinedQueryError(f"Colunas inexistentes em {entity!r}: {unknown}.")
+
+        expression = None
+
+        def _and(condition):
+            return condition if expression is None else expression & condition
+
+        if date_from or date_to:
+            month_column = MONTH_COLUMNS.get(entity)
+            if month_column is None:
+                raise RefinedQueryError(f"A entidade {entity!r} não tem coluna de data para filtrar.")
+            # A partição de mês elimina diretórios inteiros; a coluna refina dentro do mês
+            if date_from:
+                inicio = pd.Timestamp(date_from, tz="UTC")
+                expression = _and(ds.field(PARTITION_KEY) >= inicio.strftime("%Y-%m"))
+                expression = _and(ds.field(month_column) >= pa.scalar(inicio, pa.timestamp("us", tz="UTC")))
+            if date_to:
+                fim = pd.Timestamp(date_to, tz="UTC") + pd.Timedelta(days=1)
+                expression = _and(ds.field(PARTITION_KEY) <= pd.Timestamp(date_to).strftime("%Y-%m"))
+                expression = _and(ds.field(month_column) < pa.scalar(fim, pa.timestamp("us", tz="UTC")))
+
+        for column, values in (filters or {}).items():
+            if not values:
+                continue
+            if column not in schema.names:
+                raise RefinedQueryError(f"A entidade {entity!r} não tem a coluna {column!r} para filtrar.")
+            expression = _and(ds.field(column).isin(list(values)))
+
+        columns = list(columns) if columns else [name for name in schema.names if name != PARTITION_KEY]
+        if limit is not None:
+            table = dataset.head(limit, columns=columns, filter=expression)
+        else:
+            table = dataset.to_table(columns=columns, filter=expression)
+        return table.to_pandas()
+
+
+def refined_store_from_env() -> Optional[RefinedStore]:
+    path = os.getenv("ETL_REFINED_STORE_PATH")
+    if not path:
+        return None
+    if pa is None:
+        logger.warning("ETL_REFINED_STORE_PATH definido, mas o pyarrow não está instalado: store desativado.")
+        return None
+    return RefinedStore(path)
@@ -0,0 +1,310 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger("pta-etl-api.cache")
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    media_type: str
+    expires_at: float
+
+
+def canonical_json(body: bytes) -> Tuple[Optional[str], Any]:
+    """
+    (hash, documento): SHA-256 do JSON em forma canônica (chaves ordenadas, sem
+    espaços) e o documento já decodificado, para quem ainda vai validá-lo não
+    decodificar o corpo de novo. O mesmo payload com outra formatação ou ordem
+    de chaves tem o mesmo hash. (None, None) se o corpo não for JSON válido.
+    """
+    try:
+        document = json.loads(body)
+    except (ValueError, UnicodeDecodeError):
+        return None, None
+    canonical = json.dumps(document, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest(), document
+
+
+def canonical_json_hash(body: bytes) -> Optional[str]:
+    """Só o hash de canonical_json."""
+    return canonical_json(body)[0]
+
+
+class ResponseCache:
+    """
+    Cache de respostas já serializadas, endereçado pelo conteúdo da requisição.
+
+    Duas camadas: LRU em memória limitado por bytes e, opcionalmente, arquivos
+    em disco (sobrevivem a reinícios). Entradas expiram após `ttl` segundos. A
+    chave inclui a versão do processamento (cleaners, perfil estatístico,
+    regras); quando ela muda, check_version() descarta tudo o que foi gravado
+    com a versão anterior.
+
+    Em disco, cada versão tem seu diretório. O índice é montado no primeiro
+    check_version(), que apaga os diretórios de outras versões (deixados por
+    execuções anteriores da API). O lock protege só os índices: leituras e
+    gravações de arquivos acontecem fora dele. get() e put() fazem I/O de
+    disco, então a API os chama fora do event loop.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 64 * 2**20,
+        ttl: float = 300.0,
+        disk_dir: Optional[str] = None,
+        disk_max_bytes: int = 512 * 2**20
+    ):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.version: Optional[str] = None
+        self._memory: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self._memory_bytes = 0
+        # Índice dos arquivos em disco (chave -> tamanho), em ordem de uso
+        self._disk: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        # Serializa as trocas de versão (o lock dos índices não segura I/O)
+        self._version_lock = threading.Lock()
+        self.metrics = {
+            "hits": 0, "misses": 0, "memory_hits": 0, "disk_hits": 0,
+            "stores": 0, "evictions": 0, "expirations": 0, "invalidations": 0,
+            "stale_disk_entries": 0,
+        }
+
+    @classmethod
+    def from_env(cls) -> "ResponseCache":
+        return cls(
+            max_bytes=int(os.getenv("ETL_CACHE_MAX_BYTES", str(64 * 2**20))),
+            ttl=float(os.getenv("ETL_CACHE_TTL_SECONDS", "300")),
+            disk_dir=os.getenv("ETL_CACHE_DIR") or None,
+            disk_max_bytes=int(os.getenv("ETL_CACHE_DISK_MAX_BYTES", str(512 * 2**20))),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0 or bool(self.disk_dir)
+
+    def key(self, content_hash: str, variant: str) -> str:
+        """Chave da entrada: conteúdo da requisição + variante da resposta + versão."""
+        material = f"{self.version}\n{variant}\n{content_hash}"
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def check_version(self, version: str) -> None:
+        """
+        Registra a versão atual do processamento; se mudou, invalida o cache e
+        carrega o índice em disco da nova versão.
+        """
+        if version == self.version:
+            return
+        with self._version_lock:
+            if version == self.version:
+                return
+            if self.version is not None:
+                logger.info("Versão do processamento mudou (%s -> %s): cache invalidado", self.version, version)
+                self.invalidate()
+            entries = self._scan_disk(version) if self.disk_dir else []
+            with self._lock:
+                self._disk = OrderedDict((key, size) for key, size in entries)
+                self._disk_bytes = sum(size for _, size in entries)
+                self.version = version
+
+    # ---------------------------------------------------------------- memória
+
+    def _memory_put(self, key: str, entry: CachedResponse) -> None:
+        if len(entry.body) > self.max_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old.body)
+        self._memory[key] = entry
+        self._memory_bytes += len(entry.body)
+        while self._memory_bytes > self.max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted.body)
+            self.metrics["evictions"] += 1
+
+    def _memory_pop(self, key: str) -> None:
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory_bytes -= len(entry.body)
+
+    # ------------------------------------------------------------------ disco
+
+    @staticmethod
+    def _version_dir(version: str) -> str:
+        return hashlib.sha256(version.encode("utf-8")).hexdigest()[:16]
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, self._version_dir(self.version), key[:2], key)
+
+    def _scan_disk(self, version: str) -> List[Tuple[str, int]]:
+        """Apaga os diretórios de outras versões e lista (chave, tamanho) da versão, do menos ao mais recente."""
+        current = self._version_dir(version)
+        os.makedirs(self.disk_dir, exist_ok=True)
+        for name in os.listdir(self.disk_dir):
+            if name == current:
+                continue
+            path = os.path.join(self.disk_dir, name)
+            logger.info("Cache em disco: descartando entradas de outra versão (%s)", name)
+            self.metrics["stale_disk_entries"] += sum(len(files) for _, _, files in os.walk(path))
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
+
+        entries = []
+        for root, _, files in os.walk(os.path.join(self.disk_dir, current)):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                stat = os.stat(os.path.join(root, name))
+                entries.append((stat.st_mtime, name, stat.st_size))
+        return [(key, size) for _, key, size in sorted(entries)]
+
+    def _disk_read(self, key: str) -> Optional[CachedResponse]:
+        try:
+            with open(self._disk_path(key), "rb") as f:
+                header = json.loads(f.readline())
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        return CachedResponse(body, header["media_type"], header["expires_at"])
+
+    def _disk_write(self, key: str, entry: CachedResponse) -> int:
+        """Grava o arquivo da entrada (sem tocar no índice) e devolve o tamanho."""
+        path = self._disk_path(key)
+        header = json.dumps({"media_type": entry.media_type, "expires_at": entry.expires_at}).encode("utf-8")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Atômico: um leitor concorrente nunca vê o arquivo pela metade (e o
+        # temporário é único, para duas gravações da mesma chave não se misturarem)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=f".{key}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(header + b"\n" + entry.body)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        return len(header) + 1 + len(entry.body)
+
+    def _disk_remove_files(self, keys: List[str]) -> None:
+        for key in keys:
+            try:
+                os.remove(self._disk_path(key))
+            except FileNotFoundError:
+                pass
+
+    def _disk_forget(self, key: str) -> List[str]:
+        # Só o índice (sob o lock); o arquivo é removido depois, fora dele
+        size = self._disk.pop(key, None)
+        if size is None:
+            return []
+        self._disk_bytes -= size
+        return [key]
+
+    # ----------------------------------------------------------------- público
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        now = time.time()
+        stale: List[str] = []
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry.expires_at > now:
+                    self._memory.move_to_end(key)
+                    self.metrics["hits"] += 1
+                    self.metrics["memory_hits"] += 1
+                    return entry
+                self._memory_pop(key)
+                stale = self._disk_forget(key)
+                self.metrics["expirations"] += 1
+            on_disk = bool(self.disk_dir) and key in self._disk
+            if not on_disk:
+                self.metrics["misses"] += 1
+        if not on_disk:
+            self._disk_remove_files(stale)
+            return None
+
+        entry = self._disk_read(key)
+        with self._lock:
+            if entry is not None and entry.expires_at > now and key in self._disk:
+                self._disk.move_to_end(key)
+                # Promove para a memória: os próximos acertos não tocam o disco
+                self._memory_put(key, entry)
+                self.metrics["hits"] += 1
+                self.metrics["disk_hits"] += 1
+                return entry
+            stale = self._disk_forget(key)
+            if entry is not None:
+                self.metrics["expirations"] += 1
+            self.metrics["misses"] += 1
+        self._disk_remove_files(stale)
+        return None
+
+    def put(self, key: str, body: bytes, media_type: str) -> None:
+        entry = CachedResponse(body, media_type, time.time() + self.ttl)
+        with self._lock:
+            if self.max_bytes > 0:
+                self._memory_put(key, entry)
+            self.metrics["stores"] += 1
+        if not self.disk_dir or self.version is None:
+            return
+
+        try:
+            size = self._disk_write(key, entry)
+        except OSError as e:
+            logger.warning("Falha ao gravar o cache em disco: %s", e)
+            return
+        evicted: List[str] = []
+        with self._lock:
+            self._disk_bytes += size - self._disk.pop(key, 0)
+            self._disk[key] = size
+            while self._disk_bytes > self.disk_max_bytes and self._disk:
+                oldest, oldest_size = self._disk.popitem(last=False)
+                evicted.append(oldest)
+                self._disk_bytes -= oldest_size
+                self.metrics["evictions"] += 1
+        self._disk_remove_files(evicted)
+
+    def invalidate(self) -> None:
+        """Descarta todas as entradas (memória e disco)."""
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            removed = list(self._disk)
+            self._disk.clear()
+            self._disk_bytes = 0
+            self.metrics["invalidations"] += 1
+        self._disk_remove_files(removed)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.metrics["hits"] + self.metrics["misses"]
+            return {
+                **self.metrics,
+                "hit_ratio": round(self.metrics["hits"] / lookups, 4) if lookups else 0.0,
+                "version": self.version,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "memory_max_bytes": self.max_bytes,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_bytes,
+                "disk_max_bytes": self.disk_max_bytes if self.disk_dir else 0,
+                "ttl_seconds": self.ttl,
+            }
+
+
+response_cache = ResponseCache.from_env()
@@ -0,0 +1,198 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+import pandas as pd
+
+from app.services.adjust_outliers import calcular_limites_iqr, limites_iqr_de_sketches, tratar_outliers_iqr_lote
+from app.services.quantile_sketch import KLLSketch
+
+logger = logging.getLogger("pta-etl-api.stats_profile")
+
+# Colunas numéricas que recebem imputação por mediana + capping IQR, por entidade
+# (nomes internos do ETLProcessor: 'items' = order_items)
+PROFILE_COLUMNS = {
+    "products": ['product_weight_g', 'product_length_cm', 'product_height_cm', 'product_width_cm'],
+    "items": ['price', 'freight_value'],
+}
+
+
+class StatsProfile:
+    """
+    Perfil estatístico ajustado uma vez ("fit once, apply many").
+
+    Guarda, por entidade e coluna, a mediana usada na imputação e os limites IQR
+    de capping, calculados sobre um dataset de referência. Aplicar o perfil é só
+    fillna + clip vetorizados: não recalcula estatísticas por requisição e dá o
+    mesmo resultado qualquer que seja o tamanho do lote (inclusive < 3 linhas).
+    """
+
+    def __init__(
+        self,
+        medians: Dict[str, Dict[str, float]],
+        bounds: Dict[str, Dict[str, List[float]]],
+        fator_iqr: float = 1.5,
+        fitted_at: Optional[str] = None
+    ):
+        self.medians = medians
+        self.bounds = bounds
+        self.fator_iqr = fator_iqr
+        self.fitted_at = fitted_at or time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+
+    @property
+    def version(self) -> str:
+        """Hash do conteúdo: muda sempre que medianas ou limites mudam."""
+        content = json.dumps({"medians": self.medians, "bounds": self.bounds}, sort_keys=True)
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+
+    @classmethod
+    def fit(cls, frames: Dict[str, pd.DataFrame], fator_iqr: float = 1.5) -> "StatsProfile":
+        """Ajusta o perfil sobre os DataFrames de referência ({entidade: df})."""
+        medians, bounds = {}, {}
+        for entity, columns in PROFILE_COLUMNS.items():
+            df = frames.get(entity)
+            if df is None or df.empty:
+                continue
+            columns = [col for col in columns if col in df.columns]
+            if not columns:
+                continue
+
+            numeric = df[columns].apply(pd.to_numeric, errors='coerce')
+            # Mesma sequência dos cleaners: imputa a mediana e só então calcula o IQR
+            entity_medians = pd.Series({col: numeric[col].median() for col in columns}, dtype=float).fillna(0)
+            numeric = numeric.fillna(entity_medians)
+            inferior, superior = calcular_limites_iqr(numeric, columns, fator_iqr)
+
+            medians[entity] = {col: float(entity_medians[col]) for col in columns}
+            bounds[entity] = {
+                col: [float(inferior[col]), float(superior[col])]
+                for col in columns if not (pd.isna(inferior[col]) or pd.isna(superior[col]))
+            }
+
+        return cls(medians, bounds, fator_iqr)
+
+    def apply(self, entity: str, df: pd.DataFrame) -> pd.DataFrame:
+        """Imputa as medianas e aplica os limites do perfil (altera df no lugar)."""
+        entity_medians = self.medians.get(entity, {})
+        columns = [col for col in entity_medians if col in df.columns]
+        if not columns:
+            return df
+
+        for col in columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+        df[columns] = df[columns].fillna(pd.Series(entity_medians)[columns])
+
+        entity_bounds = self.bounds.get(entity, {})
+        limites = (
+            pd.Series({col: lim[0] for col, lim in entity_bounds.items()}, dtype=float),
+            pd.Series({col: lim[1] for col, lim in entity_bounds.items()}, dtype=float),
+        )
+        return tratar_outliers_iqr_lote(df, columns, limites=limites)
+
+    def fill_medians(self, entity: str, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Só imputa as medianas do perfil (altera df no lugar), sem conversão
+        numérica nem capping: os passos dos cleaners da API, que não aplicam IQR.
+        """
+        for col, mediana in self.medians.get(entity, {}).items():
+            if col in df.columns:
+                df[col] = df[col].fillna(mediana)
+        return df
+
+    def to_dict(self) -> dict:
+        return {
+            "version": self.version,
+            "fitted_at": self.fitted_at,
+            "fator_iqr": self.fator_iqr,
+            "medians": self.medians,
+            "bounds": self.bounds,
+        }
+
+    def save(self, path: str) -> None:
+        # Escrita atômica: outro processo nunca lê um perfil pela metade
+        # (temporário com nome único: dois refits simultâneos não escrevem no mesmo arquivo)
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self.to_dict(), f, indent=2)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path: str) -> "StatsProfile":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["medians"], data["bounds"], data.get("fator_iqr", 1.5), data.get("fitted_at"))
+
+
+class SketchProfileFitter:
+    """
+    Ajuste aproximado do StatsProfile em uma única passada por chunks, com
+    memória O(k) por coluna (sketches KLL) em vez da coluna inteira.
+
+    Os nulos são só contados: no fim, a mediana estimada entra no sketch no
+    lugar deles, como a imputação faria antes do cálculo do IQR em fit().
+    """
+
+    # Tamanho dos blocos de mediana imputada inseridos no sketch
+    _BLOCO_IMPUTACAO = 1_000_000
+
+    def __init__(self, k: int = 1024, fator_iqr: float = 1.5):
+        self.k = k
+        self.fator_iqr = fator_iqr
+        self.sketches: Dict[str, Dict[str, KLLSketch]] = {}
+        self.nulos: Dict[str, Dict[str, int]] = {}
+
+    def update(self, entity: str, df: pd.DataFrame) -> "SketchProfileFitter":
+        for col in PROFILE_COLUMNS.get(entity, []):
+            if col not in df.columns:
+                continue
+            values = pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=float)
+            self.sketches.setdefault(entity, {}).setdefault(col, KLLSketch(self.k)).update(values)
+            nulos = self.nulos.setdefault(entity, {})
+            nulos[col] = nulos.get(col, 0) + int(np.isnan(values).sum())
+        return self
+
+    def profile(self) -> StatsProfile:
+        medians, bounds = {}, {}
+        for entity, sketches in self.sketches.items():
+            entity_medians, imputados = {}, {}
+            for col, sketch in sketches.items():
+                mediana = sketch.quantile(0.5)
+                mediana = 0.0 if pd.isna(mediana) else mediana
+                entity_medians[col] = float(mediana)
+
+                imputado = KLLSketch.from_dict(sketch.to_dict())
+                restantes = self.nulos[entity][col]
+                while restantes > 0:
+                    bloco = min(restantes, self._BLOCO_IMPUTACAO)
+                    imputado.update(np.full(bloco, mediana))
+                    restantes -= bloco
+                imputados[col] = imputado
+
+            inferior, superior = limites_iqr_de_sketches(imputados, self.fator_iqr)
+            medians[entity] = entity_medians
+            bounds[entity] = {
+                col: [float(inferior[col]), float(superior[col])]
+                for col in imputados if not (pd.isna(inferior[col]) or pd.isna(superior[col]))
+            }
+        return StatsProfile(medians, bounds, self.fator_iqr)
+
+
+def stats_profile_from_env() -> Optional[StatsProfile]:
+    path = os.getenv("ETL_STATS_PROFILE_PATH")
+    if not path or not os.path.exists(path):
+        return None
+    profile = StatsProfile.load(path)
+    logger.info("Perfil estatístico carregado de %s (versão %s)", path, profile.version)
+    return profile
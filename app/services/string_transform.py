@@ -0,0 +1,54 @@
+import os
+import unicodedata
+from functools import lru_cache
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+# Tamanho máximo do cache LRU de cada transformação (valores distintos guardados
+# entre requisições). Cidades, UFs e categorias Olist têm poucos milhares de valores.
+STRING_CACHE_SIZE = int(os.getenv("ETL_STRING_CACHE_SIZE", "4096"))
+
+
+@lru_cache(maxsize=STRING_CACHE_SIZE)
+def normalizar_cidade(valor: str) -> str:
+    """Remove acentos (NFKD + ASCII), passa para maiúsculas e tira espaços."""
+    sem_acento = unicodedata.normalize('NFKD', valor).encode('ascii', errors='ignore').decode('utf-8')
+    return sem_acento.upper().strip()
+
+
+@lru_cache(maxsize=STRING_CACHE_SIZE)
+def normalizar_maiusculas(valor: str) -> str:
+    return valor.upper().strip()
+
+
+@lru_cache(maxsize=STRING_CACHE_SIZE)
+def normalizar_categoria(valor: str) -> str:
+    """Minúsculas, sem espaços nas pontas, '_' no lugar de ' '; vazios/nulos viram 'indefinido'."""
+    categoria = valor.lower().strip().replace(' ', '_')
+    return 'indefinido' if categoria in ('nan', 'none', '') else categoria
+
+
+def transformar_categorias(serie: pd.Series, transform: Callable[[str], str]) -> pd.Series:
+    """
+    Aplica `transform` só aos valores distintos da coluna (dictionary encoding)
+    e devolve o resultado como categórico.
+
+    Equivale a serie.astype(str).map(transform), inclusive para nulos
+    (None -> 'None', NaN -> 'nan'), mas o custo é proporcional à cardinalidade
+    e não ao número de linhas; valores distintos que viram o mesmo texto
+    (ex.: 'São Paulo' e 'sao paulo ') compartilham a mesma categoria.
+    """
+    valores = serie.to_numpy(dtype=object, copy=True)
+    nulos = pd.isna(valores)
+    if nulos.any():
+        # Mantém a forma textual de cada tipo de nulo, como astype(str) faria
+        valores[nulos] = [str(valor) for valor in valores[nulos]]
+
+    codes, uniques = pd.factorize(valores)
+    transformados = pd.Index([transform(str(valor)) for valor in uniques], dtype=object)
+    remap, categorias = pd.factorize(transformados)
+
+    categorical = pd.Categorical.from_codes(remap[codes] if len(codes) else np.empty(0, dtype=np.intp), categories=categorias)
+    return pd.Series(categorical, index=serie.index, name=serie.name)
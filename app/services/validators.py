@@ -1,5 +1,9 @@
+import numpy as np
 import pandas as pd
-from typing import Tuple, Dict, Any
+from typing import Tuple, Dict, Any, List, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from app.services.dimension_store import DimensionKeyStore
 
 class IntegrityValidator:
     """Responsável por validar a integridade referencial entre datasets."""
@@ -33,4 +37,103 @@ class IntegrityValidator:
         if not orphan_records.empty:
             orphan_records['dq_issue'] = f"Orphan: {child_key} not found in parent dataset"
 
-        return valid_records, orphan_records
\ No newline at end of file
+        return valid_records, orphan_records
+
+    @staticmethod
+    def _scoped_isin(
+        child_scope: pd.Series,
+        child_keys: pd.Series,
+        parent_scope: pd.Series,
+        parent_keys: pd.Series
+    ) -> np.ndarray:
+        """isin do par (escopo, chave): as chaves viram códigos inteiros e o par, um int64 único."""
+        codes, uniques = pd.factorize(pd.concat([child_keys, parent_keys], ignore_index=True))
+        scopes, _ = pd.factorize(pd.concat([child_scope, parent_scope], ignore_index=True))
+        # Chave nula (código -1) ainda casa com chave nula do mesmo escopo, como no isin
+        pairs = scopes.astype(np.int64) * (len(uniques) + 1) + codes
+        n_child = len(child_keys)
+        return pd.Series(pairs[:n_child]).isin(np.unique(pairs[n_child:])).to_numpy()
+
+    @staticmethod
+    def validate_fused_integrity(
+        child_df: pd.DataFrame,
+        parents: List[Tuple[str, pd.DataFrame, str, str]],
+        key_store: Optional["DimensionKeyStore"] = None,
+        collect_orphans: bool = True,
+        scope: Optional[str] = None
+    ) -> Tuple[pd.DataFrame, Dict[str, pd.DataFrame], np.ndarray]:
+        """
+        Valida todas as chaves estrangeiras do dataset filho em uma única passada.
+
+        `parents` é uma lista de (grupo_orfao, parent_df, child_key, parent_key); a
+        i-ésima chave ocupa o bit 1 << i da máscara de motivos. O resultado é
+        equivalente a chamar validate_referential_integrity em sequência: uma
+        linha órfã vai para o grupo da primeira chave que falhou. As linhas do
+        filho são copiadas uma única vez (cada linha vai para exatamente um frame).
+
+        Com `key_store`, chaves ausentes do pai (ou de um pai vazio) ainda são
+        aceitas se já estiverem no índice persistente de dimensões.
+
+        Com `collect_orphans=False`, os registros órfãos não são copiados (o
+        dicionário volta vazio) e só a máscara de motivos os identifica.
+
+        Com `scope` (coluna presente no filho e nos pais, ex.: o id do payload
+        no endpoint em lote), as chaves só casam dentro do mesmo escopo.
+
+        Retorna (registros_validos, {grupo: orfaos}, mascara_de_motivos).
+        """
+        reasons = np.zeros(len(child_df), dtype=np.uint8)
+
+        for bit_pos, (_, parent_df, child_key, parent_key) in enumerate(parents):
+            bit = np.uint8(1 << bit_pos)
+            has_parent = parent_df is not None and not parent_df.empty
+            if not has_parent and key_store is None:
+                reasons |= bit
+                continue
+            if child_df.empty:
+                continue
+            if child_key not in child_df.columns:
+                raise ValueError(f"Chave {child_key} não encontrada no dataset filho.")
+
+            if has_parent:
+                if parent_key not in parent_df.columns:
+                    raise ValueError(f"Chave {parent_key} não encontrada no dataset pai.")
+                if scope is not None:
+                    mask_orphan = ~IntegrityValidator._scoped_isin(
+                        child_df[scope], child_df[child_key], parent_df[scope], parent_df[parent_key]
+                    )
+                else:
+                    # isin usa uma tabela hash sobre os ids únicos do pai (sem set() intermediário)
+                    mask_orphan = ~child_df[child_key].isin(parent_df[parent_key].unique()).to_numpy(copy=True)
+            else:
+                mask_orphan = np.ones(len(child_df), dtype=bool)
+
+            # Só as chaves que o payload não resolveu vão ao índice persistente
+            if key_store is not None and mask_orphan.any():
+                missing = child_df[child_key].iloc[np.flatnonzero(mask_orphan)]
+                mask_orphan[mask_orphan] = ~key_store.contains(parent_key, missing)
+
+            reasons[mask_orphan] |= bit
+
+        valid_records = child_df.take(np.flatnonzero(reasons == 0))
+        if not collect_orphans:
+            return valid_records, {}, reasons
+
+        # Bit menos significativo ligado = primeira chave que falhou
+        first_failure = reasons & (~reasons + np.uint8(1))
+        orphans = {}
+        for bit_pos, (group, parent_df, child_key, _) in enumerate(parents):
+            positions = np.flatnonzero(first_failure == (1 << bit_pos))
+            if len(positions) == 0:
+                continue
+            orphan_records = child_df.take(positions)
+            issue = f"Orphan: {child_key} not found in parent dataset"
+            if key_store is None and scope is not None and parent_df is not None and not parent_df.empty:
+                # Em lote, só os escopos que trouxeram o pai recebem o aviso (como em chamadas separadas)
+                has_parent_rows = orphan_records[scope].isin(parent_df[scope].unique()).to_numpy()
+                orphan_records['dq_issue'] = np.where(has_parent_rows, issue, None)
+            elif key_store is not None or (parent_df is not None and not parent_df.empty):
+                orphan_records['dq_issue'] = issue
+            orphans[group] = orphan_records
+
+        return valid_records, orphans, reasons
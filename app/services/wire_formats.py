@@ -0,0 +1,151 @@
+import io
+import zipfile
+from typing import Dict, Iterable
+
+import pandas as pd
+
+from app.services.ingestion import IngestionError
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow é opcional: sem ele a API segue só com JSON
+    pa = None
+
+# Stream Arrow IPC: várias streams concatenadas, uma por tabela. O nome da
+# tabela vai nos metadados do schema ('entity', e 'section' nas respostas).
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+# Parquet: um .parquet por tabela dentro de um ZIP, já que um arquivo Parquet
+# só comporta um schema ('orders.parquet' no pedido; 'data/orders.parquet' e
+# 'orphans/items_orders.parquet' na resposta).
+PARQUET_MEDIA_TYPE = "application/vnd.apache.parquet"
+
+COLUMNAR_MEDIA_TYPES = (ARROW_STREAM_MEDIA_TYPE, PARQUET_MEDIA_TYPE)
+
+
+class WireFormatUnavailable(RuntimeError):
+    """Formato colunar pedido, mas o pyarrow não está instalado."""
+
+
+def _require_pyarrow() -> None:
+    if pa is None:
+        raise WireFormatUnavailable("Formatos Arrow/Parquet exigem o pacote 'pyarrow'.")
+
+
+def check_available(media_type: str) -> None:
+    """Falha antes do processamento se o formato colunar pedido não puder ser usado."""
+    if media_type in COLUMNAR_MEDIA_TYPES:
+        _require_pyarrow()
+
+
+def _quality(params: Iterable[str]) -> float:
+    for param in params:
+        name, _, value = param.partition("=")
+        if name.strip().lower() == "q":
+            try:
+                return float(value)
+            except ValueError:
+                return 0.0
+    return 1.0
+
+
+def negotiate(media_type: str) -> str:
+    """
+    Retorna o formato colunar escolhido em um header Content-Type/Accept, ou ''
+    (JSON). Os pesos q do Accept são respeitados: o formato colunar só é escolhido
+    se tiver peso maior que o do JSON (application/json ou curingas); no empate,
+    vale a ordem do header. q=0 exclui o formato.
+    """
+    best, best_q = "", 0.0
+    for part in (media_type or "").split(","):
+        candidate, *params = part.split(";")
+        candidate = candidate.strip().lower()
+        q = _quality(params)
+        if candidate in COLUMNAR_MEDIA_TYPES:
+            chosen = candidate
+        elif candidate in ("application/json", "application/*", "*/*"):
+            chosen = ""
+        else:
+            continue
+        if q > best_q:
+            best, best_q = chosen, q
+    return best
+
+
+def _check_entity(entity: str, allowed_entities: Iterable[str]) -> None:
+    if entity not in allowed_entities:
+        raise IngestionError(f"Entidade desconhecida: {entity!r}. Use uma de {list(allowed_entities)}.")
+
+
+def read_arrow_stream(body: bytes, allowed_entities: Iterable[str]) -> Dict[str, pd.DataFrame]:
+    _require_pyarrow()
+    allowed_entities = tuple(allowed_entities)
+    frames = {}
+    reader = pa.BufferReader(body)
+    try:
+        while reader.tell() < len(body):
+            table = ipc.open_stream(reader).read_all()
+            entity = (table.schema.metadata or {}).get(b"entity", b"").decode("utf-8")
+            _check_entity(entity, allowed_entities)
+            frames[entity] = table.to_pandas()
+    except pa.ArrowInvalid as e:
+        raise IngestionError(f"Stream Arrow inválido: {e}")
+    return frames
+
+
+def read_parquet_zip(body: bytes, allowed_entities: Iterable[str]) -> Dict[str, pd.DataFrame]:
+    _require_pyarrow()
+    allowed_entities = tuple(allowed_entities)
+    frames = {}
+    try:
+        with zipfile.ZipFile(io.BytesIO(body)) as archive:
+            for member in archive.namelist():
+                entity = member.rsplit("/", 1)[-1].removesuffix(".parquet")
+                _check_entity(entity, allowed_entities)
+                frames[entity] = pq.read_table(io.BytesIO(archive.read(member))).to_pandas()
+    except (zipfile.BadZipFile, pa.ArrowInvalid) as e:
+        raise IngestionError(f"Pacote Parquet inválido: {e}")
+    return frames
+
+
+def _to_table(df: pd.DataFrame) -> "pa.Table":
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def write_arrow_stream(sections: Dict[str, Dict[str, pd.DataFrame]]) -> bytes:
+    _require_pyarrow()
+    sink = pa.BufferOutputStream()
+    for section, frames in sections.items():
+        for entity, df in frames.items():
+            table = _to_table(df)
+            table = table.replace_schema_metadata({
+                **(table.schema.metadata or {}), b"section": section, b"entity": entity
+            })
+            with ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def write_parquet_zip(sections: Dict[str, Dict[str, pd.DataFrame]]) -> bytes:
+    _require_pyarrow()
+    buffer = io.BytesIO()
+    # Parquet já é comprimido: o ZIP só empacota (ZIP_STORED)
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_STORED) as archive:
+        for section, frames in sections.items():
+            for entity, df in frames.items():
+                member = io.BytesIO()
+                pq.write_table(_to_table(df), member)
+                archive.writestr(f"{section}/{entity}.parquet", member.getvalue())
+    return buffer.getvalue()
+
+
+READERS = {
+    ARROW_STREAM_MEDIA_TYPE: read_arrow_stream,
+    PARQUET_MEDIA_TYPE: read_parquet_zip,
+}
+
+WRITERS = {
+    ARROW_STREAM_MEDIA_TYPE: write_arrow_stream,
+    PARQUET_MEDIA_TYPE: write_parquet_zip,
+}
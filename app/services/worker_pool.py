@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger("pta-etl-api.worker_pool")
+
+# Modos suportados: 'thread' compartilha os DataFrames com a thread do servidor
+# (sem cópia); 'process' isola o GIL, mas serializa o payload via pickle.
+POOL_MODES = ("thread", "process")
+
+
+class PoolSaturatedError(RuntimeError):
+    """Lançado quando pool + fila de espera já estão cheios."""
+
+
+def _timed_call(func: Callable[..., Any], submitted_at: float, *args: Any) -> Tuple[float, Any]:
+    # Executa dentro do worker: mede quanto tempo a tarefa ficou na fila.
+    # time.time() (e não perf_counter) para ser comparável entre processos.
+    started_at = time.time()
+    return started_at - submitted_at, func(*args)
+
+
+def _collect(func: Callable[..., Iterator[Any]], *args: Any) -> List[Any]:
+    # Modo 'process': um gerador não atravessa processos, então o worker devolve tudo
+    return list(func(*args))
+
+
+def _close_quietly(iterator: Iterator[Any]) -> None:
+    # O cliente desconectou no meio do stream: libera o gerador (se um next()
+    # ainda estiver rodando no worker, ele termina sozinho)
+    try:
+        iterator.close()
+    except ValueError:
+        pass
+
+
+_END = object()
+
+
+class ETLWorkerPool:
+    """Executa o processamento CPU-bound fora do event loop do uvicorn."""
+
+    def __init__(self, mode: str = "thread", size: int = 4, queue_depth: int = 16):
+        if mode not in POOL_MODES:
+            raise ValueError(f"Modo de pool inválido: {mode}. Use 'thread' ou 'process'.")
+        if size < 1 or queue_depth < 0:
+            raise ValueError("Tamanho do pool deve ser >= 1 e fila >= 0.")
+
+        self.mode = mode
+        self.size = size
+        self.queue_depth = queue_depth
+        self._executor: Optional[Executor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    @classmethod
+    def from_env(cls) -> "ETLWorkerPool":
+        return cls(
+            mode=os.getenv("ETL_POOL_MODE", "thread"),
+            size=int(os.getenv("ETL_POOL_SIZE", str(min(4, os.cpu_count() or 1)))),
+            queue_depth=int(os.getenv("ETL_POOL_QUEUE_DEPTH", "16")),
+        )
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.mode == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.size)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix="etl-worker")
+            logger.info("Pool de workers iniciado: modo=%s size=%d fila=%d", self.mode, self.size, self.queue_depth)
+        return self._executor
+
+    def _get_slots(self) -> asyncio.Semaphore:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.size + self.queue_depth)
+        if self._slots.locked():
+            raise PoolSaturatedError("Fila de processamento cheia.")
+        return self._slots
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Tuple[Any, float]:
+        """
+        Executa func(*args) no pool e retorna (resultado, espera_na_fila_em_segundos).
+
+        No máximo size + queue_depth requisições ficam em voo; acima disso
+        PoolSaturatedError é lançado imediatamente em vez de enfileirar sem limite.
+        """
+        async with self._get_slots():
+            loop = asyncio.get_running_loop()
+            queue_wait, result = await loop.run_in_executor(
+                self._get_executor(), _timed_call, func, time.time(), *args
+            )
+        return result, queue_wait
+
+    async def stream(self, func: Callable[..., Iterator[Any]], *args: Any) -> Tuple[AsyncIterator[Any], float]:
+        """
+        Executa o gerador func(*args) no pool e retorna (itens, espera_na_fila_em_segundos).
+
+        O slot fica ocupado até o fim do stream (ou a desconexão do cliente), com
+        o mesmo limite de run(). O primeiro item é produzido antes do retorno, então
+        a espera na fila já é conhecida ao montar os headers. No modo 'thread' cada
+        item é produzido sob demanda em um worker; no modo 'process' o worker gera
+        todos os itens e eles são repassados depois.
+        """
+        slots = self._get_slots()
+        await slots.acquire()
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        try:
+            if self.mode == "process":
+                queue_wait, items = await loop.run_in_executor(executor, _timed_call, _collect, time.time(), func, *args)
+                iterator = iter(items)
+                first = next(iterator, _END)
+            else:
+                iterator = func(*args)
+                queue_wait, first = await loop.run_in_executor(executor, _timed_call, next, time.time(), iterator, _END)
+        except BaseException:
+            slots.release()
+            raise
+
+        async def items() -> AsyncIterator[Any]:
+            item = first
+            try:
+                while item is not _END:
+                    yield item
+                    if self.mode == "process":
+                        item = next(iterator, _END)
+                    else:
+                        item = await loop.run_in_executor(executor, next, iterator, _END)
+            finally:
+                slots.release()
+                if item is not _END and self.mode == "thread":
+                    executor.submit(_close_quietly, iterator)
+
+        return items(), queue_wait
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+        self._slots = None
+
+
+etl_worker_pool = ETLWorkerPool.from_env()
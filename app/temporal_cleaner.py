@@ -1,44 +1,20 @@
-import pandas as pd
-import numpy as np
-
-# Colunas que sempre tentaremos converter para data
-DATE_COLUMNS = [
-    'order_purchase_timestamp', 'order_approved_at',
-    'order_delivered_carrier_date', 'order_delivered_customer_date',
-    'order_estimated_delivery_date', 'shipping_limit_date'
-]
+# Colunas que sempre tentaremos converter para data (lista compartilhada com a API)
+from app.services.date_parser import DATE_COLUMNS, parse_datetime_columns
+# Regras de qualidade declaradas uma vez por entidade (as mesmas da API)
+from app.services.dq_rules import apply_rules
 
 def convert_to_datetime_utc(df):
     """Converte colunas temporais para UTC."""
     df_conv = df.copy()
-    for col in DATE_COLUMNS:
-        if col in df_conv.columns:
-            df_conv[col] = pd.to_datetime(df_conv[col], errors='coerce', utc=True)
+    parse_datetime_columns(df_conv, DATE_COLUMNS, utc=True)
     return df_conv
 
-def validate_pedidos(df):
-    """Regras específicas para PEDIDOS"""
-    df_dq = df.copy()
+def validate_pedidos(df, agora=None):
+    """Regras específicas para PEDIDOS (cronologia, data no futuro, ...) na coluna dq_flags"""
     print("   🛡️ Validando regras de PEDIDOS...")
-   
-    # Regra: Entrega antes da compra
-    if 'order_delivered_customer_date' in df_dq.columns and 'order_purchase_timestamp' in df_dq.columns:
-        df_dq['dq_erro_cronologia'] = df_dq['order_delivered_customer_date'] < df_dq['order_purchase_timestamp']
-   
-    # Regra: Data no futuro
-    if 'order_purchase_timestamp' in df_dq.columns:
-        now_utc = pd.Timestamp.now(tz='UTC')
-        df_dq['dq_erro_futuro'] = df_dq['order_purchase_timestamp'] > now_utc
-        
-    return df_dq
+    return apply_rules('orders', df.copy(), agora)
 
-def validate_itens(df):
-    """Regras específicas para ITENS"""
-    df_dq = df.copy()
+def validate_itens(df, agora=None):
+    """Regras específicas para ITENS (data limite nula ou inválida, preço, frete) na coluna dq_flags"""
     print("   🛡️ Validando regras de ITENS...")
-
-    # Regra: Data limite de envio nula ou inválida
-    if 'shipping_limit_date' in df_dq.columns:
-        df_dq['dq_erro_data_limite'] = df_dq['shipping_limit_date'].isna()
-        
-    return df_dq
\ No newline at end of file
+    return apply_rules('items', df.copy(), agora)
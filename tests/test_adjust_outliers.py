@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services.adjust_outliers import limites_iqr_de_sketches, tratar_outliers_iqr, tratar_outliers_iqr_lote
+from app.services.quantile_sketch import KLLSketch
+
+K = 256
+# Erro de rank típico ~1.7/k (docstring do KLLSketch); a margem cobre a variância
+ERRO_RANK = 3 / K
+
+
+def _erro_de_rank(dados_ordenados, valor, q):
+    rank = np.searchsorted(dados_ordenados, valor, side="right") / len(dados_ordenados)
+    return abs(rank - q)
+
+
+@pytest.mark.parametrize("em_pedacos", [False, True])
+def test_quantis_do_sketch_dentro_do_erro(em_pedacos):
+    rng = np.random.default_rng(42)
+    dados = rng.lognormal(mean=3, sigma=1, size=200_000)
+
+    if em_pedacos:
+        sketch = KLLSketch(k=K)
+        for pedaco in np.array_split(dados, 7):
+            sketch.merge(KLLSketch(k=K).update(pedaco))
+    else:
+        sketch = KLLSketch(k=K).update(dados)
+
+    ordenados = np.sort(dados)
+    for q in (0.01, 0.25, 0.5, 0.75, 0.99):
+        assert _erro_de_rank(ordenados, sketch.quantile(q), q) <= ERRO_RANK
+        # Mesmo ponto de np.quantile, a menos do erro de rank
+        assert _erro_de_rank(ordenados, np.quantile(dados, q), q) <= 1 / len(dados)
+
+
+def test_limites_de_sketches_perto_dos_exatos():
+    rng = np.random.default_rng(7)
+    df = pd.DataFrame({"price": rng.gamma(2, 50, 50_000), "freight_value": rng.normal(20, 5, 50_000)})
+    sketches = {col: KLLSketch(k=K).update(df[col].to_numpy()) for col in df.columns}
+
+    inferior, superior = limites_iqr_de_sketches(sketches)
+
+    for col in df.columns:
+        ordenados = np.sort(df[col].to_numpy())
+        q1, q3 = sketches[col].quantile(0.25), sketches[col].quantile(0.75)
+        assert _erro_de_rank(ordenados, q1, 0.25) <= ERRO_RANK
+        assert _erro_de_rank(ordenados, q3, 0.75) <= ERRO_RANK
+        assert superior[col] == pytest.approx(q3 + 1.5 * (q3 - q1))
+        assert inferior[col] == pytest.approx(q1 - 1.5 * (q3 - q1))
+
+
+def test_lote_igual_a_tratar_outliers_iqr_por_coluna():
+    rng = np.random.default_rng(3)
+    df = pd.DataFrame({
+        "price": np.append(rng.normal(100, 10, 500), [5000, -900, np.nan]),
+        "freight_value": np.append(rng.exponential(15, 500), [800, np.nan, 0]),
+        "constante": np.full(503, 1.0),
+        "texto": ["a"] * 503,
+    })
+    colunas = ["price", "freight_value", "constante", "inexistente"]
+
+    esperado = df.copy()
+    for col in ["price", "freight_value", "constante"]:
+        esperado = tratar_outliers_iqr(esperado, col, metodo="capping")
+    obtido = tratar_outliers_iqr_lote(df.copy(), colunas)
+
+    pd.testing.assert_frame_equal(obtido, esperado)
@@ -0,0 +1,54 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from app.services import data_cleaner
+from app.services.stats_profile import StatsProfile
+
+
+def _produtos() -> pd.DataFrame:
+    return pd.DataFrame({
+        'product_id': ['p1', 'p2', 'p3', 'p4', 'p5'],
+        'product_category_name': ['a', None, 'b', 'a', 'b'],
+        'product_weight_g': [100.0, np.nan, 300.0, 50000.0, 200.0],
+        'product_length_cm': [10.0, 20.0, np.nan, 30.0, 40.0],
+    })
+
+
+def _itens() -> pd.DataFrame:
+    return pd.DataFrame({
+        'order_id': ['o1', 'o2', 'o3', 'o4'],
+        'price': [10.0, 12.0, 11.0, 9999.0],
+        'freight_value': [1.0, np.nan, 2.0, 3.0],
+    })
+
+
+def test_perfil_nao_muda_os_passos_da_limpeza_de_produtos():
+    perfil = StatsProfile.fit({'products': _produtos()})
+
+    sem_perfil = data_cleaner.limpar_produtos(_produtos())
+    com_perfil = data_cleaner.limpar_produtos(_produtos(), perfil)
+
+    # Mesmas medianas (perfil ajustado no próprio lote) e nenhum capping nos dois casos
+    pd.testing.assert_frame_equal(com_perfil, sem_perfil)
+    assert com_perfil['product_weight_g'].max() == 50000.0
+
+
+def test_perfil_nao_aplica_capping_nos_itens():
+    perfil = StatsProfile.fit({'items': _itens()})
+
+    pd.testing.assert_frame_equal(data_cleaner.limpar_itens(_itens(), perfil), _itens())
+    pd.testing.assert_frame_equal(data_cleaner.limpar_itens(_itens()), _itens())
+
+
+def test_save_usa_temporario_unico(tmp_path):
+    path = tmp_path / 'perfil.json'
+    # Um temporário com o nome fixo antigo não atrapalha a gravação
+    (tmp_path / 'perfil.json.tmp').write_text('lixo')
+    perfil = StatsProfile.fit({'products': _produtos(), 'items': _itens()})
+
+    perfil.save(str(path))
+
+    assert StatsProfile.load(str(path)).version == perfil.version
+    assert sorted(os.listdir(tmp_path)) == ['perfil.json', 'perfil.json.tmp']
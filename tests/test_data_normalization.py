@@ -0,0 +1,82 @@
+import itertools
+
+import pandas as pd
+
+from app.services.data_normalization import CATEGORIAS_PRAZO, classificar_prazo_entrega, limpar_pedidos_inplace
+
+
+def verificar_prazo(row):
+    """Versão linha a linha (df.apply) substituída por classificar_prazo_entrega."""
+    data_entrega = row.get('order_delivered_customer_date')
+    data_estimada = row.get('order_estimated_delivery_date')
+
+    if pd.isnull(data_entrega):
+        return 'Não Entregue'
+    if pd.isnull(data_estimada):
+        return 'Não'
+    if data_entrega <= data_estimada:
+        return 'Sim'
+    return 'Não'
+
+
+DATAS = [
+    pd.NaT,
+    pd.Timestamp('2018-03-10 00:00:00', tz='UTC'),
+    pd.Timestamp('2018-03-10 09:30:00', tz='UTC'),  # mesmo dia, mais tarde
+    pd.Timestamp('2018-03-09 23:59:59', tz='UTC'),  # véspera
+    pd.Timestamp('2018-04-02 12:00:00', tz='UTC'),  # atrasado
+]
+
+
+def _pedidos(pares) -> pd.DataFrame:
+    entrega, estimada = zip(*pares)
+    return pd.DataFrame({
+        'order_delivered_customer_date': pd.to_datetime(list(entrega), utc=True),
+        'order_estimated_delivery_date': pd.to_datetime(list(estimada), utc=True),
+    })
+
+
+def test_igual_a_versao_linha_a_linha_em_todas_as_combinacoes():
+    df = _pedidos(itertools.product(DATAS, repeat=2))
+
+    esperado = df.apply(verificar_prazo, axis=1)
+    obtido = classificar_prazo_entrega(df['order_delivered_customer_date'], df['order_estimated_delivery_date'])
+
+    assert obtido.astype(str).tolist() == esperado.tolist()
+    assert list(obtido.cat.categories) == CATEGORIAS_PRAZO
+
+
+def test_casos_nat_mesmo_dia_e_atraso():
+    dia = pd.Timestamp('2018-03-10 00:00:00', tz='UTC')
+    df = _pedidos([
+        (pd.NaT, dia),                             # não entregue
+        (pd.NaT, pd.NaT),                          # não entregue, sem estimativa
+        (dia, pd.NaT),                             # entregue, sem estimativa
+        (dia, dia),                                # mesmo instante
+        (dia + pd.Timedelta(hours=9), dia),        # mesmo dia, depois do horário estimado
+        (dia + pd.Timedelta(days=3), dia),         # atrasado
+        (dia - pd.Timedelta(days=3), dia),         # adiantado
+    ])
+
+    obtido = classificar_prazo_entrega(df['order_delivered_customer_date'], df['order_estimated_delivery_date'])
+
+    assert obtido.astype(str).tolist() == ['Não Entregue', 'Não Entregue', 'Não', 'Sim', 'Não', 'Não', 'Sim']
+    assert obtido.astype(str).tolist() == df.apply(verificar_prazo, axis=1).tolist()
+
+
+def test_limpar_pedidos_com_datas_em_texto():
+    df = pd.DataFrame({
+        'order_id': ['a', 'b', 'c', 'd'],
+        'order_purchase_timestamp': ['2018-03-01 10:00:00'] * 4,
+        'order_delivered_customer_date': [None, '2018-03-10 08:00:00', '2018-03-10 18:00:00', 'sem data'],
+        'order_estimated_delivery_date': ['2018-03-10 00:00:00', '2018-03-10 08:00:00', '2018-03-10 00:00:00', None],
+    })
+    esperado = df.assign(**{
+        col: pd.to_datetime(df[col], errors='coerce', utc=True)
+        for col in ('order_delivered_customer_date', 'order_estimated_delivery_date')
+    }).apply(verificar_prazo, axis=1)
+
+    limpo = limpar_pedidos_inplace(df.copy())
+
+    assert limpo['entrega_no_prazo'].astype(str).tolist() == esperado.tolist()
+    assert limpo['entrega_no_prazo'].astype(str).tolist() == ['Não Entregue', 'Sim', 'Não', 'Não Entregue']
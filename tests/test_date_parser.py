@@ -0,0 +1,89 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services import date_parser
+from app.services.date_parser import parse_datetime, parse_datetime_columns
+
+
+def _pandas(serie, utc=False):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        return pd.to_datetime(serie, errors="coerce", utc=utc)
+
+
+def _parse(serie, **kwargs):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        return parse_datetime(serie, **kwargs)
+
+
+CASOS = {
+    "iso_com_hora": ["2017-10-02 10:56:33", "2017-10-03 08:00:00", None, "2017-10-02 10:56:33"],
+    "dia_mes_ano": ["13/02/2017", "10/02/2017", "13/02/2017"],
+    "mes_dia_ano": ["10/02/2017", "11/02/2017"],
+    "nao_casa_com_o_formato": ["2017-10-02T10:56:33", "2017-10-04 09:15:00", "2017-10-04", "bad", ""],
+    "com_fuso": ["2017-10-02T10:56:33+02:00", "2017-10-03T08:00:00+02:00", None],
+    "sem_formato_detectavel": ["ontem", "bad", None],
+    "tudo_nulo": [None, None, np.nan],
+}
+
+
+@pytest.mark.parametrize("utc", [False, True])
+@pytest.mark.parametrize("caso", list(CASOS))
+def test_igual_ao_pd_to_datetime(caso, utc):
+    serie = pd.Series(CASOS[caso], index=np.arange(10, 10 + len(CASOS[caso])), name="col", dtype=object)
+
+    pd.testing.assert_series_equal(_parse(serie, utc=utc), _pandas(serie, utc=utc))
+
+
+def test_valores_que_nao_casam_viram_nat():
+    serie = pd.Series(["2017-10-02 10:56:33", "2017-10-04", "2017-10-02T10:56:33", "bad"])
+
+    result = _parse(serie)
+
+    assert result.iloc[0] == pd.Timestamp("2017-10-02 10:56:33")
+    assert result.iloc[1:].isna().all()
+
+
+def test_cada_valor_distinto_e_convertido_uma_vez(monkeypatch):
+    chamadas = []
+    original = date_parser._parse_unique
+
+    def espiao(uniques, fmt, utc):
+        chamadas.append((len(uniques), fmt))
+        return original(uniques, fmt, utc)
+
+    monkeypatch.setattr(date_parser, "_parse_unique", espiao)
+    serie = pd.Series(["2017-10-02 10:56:33", "2017-10-03 08:00:00", None] * 1000)
+
+    result = parse_datetime(serie)
+
+    # Formato detectado uma vez e só os 2 valores distintos convertidos
+    assert chamadas == [(2, "%Y-%m-%d %H:%M:%S")]
+    assert result.iloc[3] == pd.Timestamp("2017-10-02 10:56:33")
+    assert result.iloc[2::3].isna().all()
+
+
+def test_coluna_com_fuso_mantem_o_fuso_e_converte_para_utc():
+    serie = pd.Series(["2017-10-02T10:56:33+02:00", None])
+
+    assert str(_parse(serie).dtype) == "datetime64[ns, UTC+02:00]"
+    convertido = _parse(serie, utc=True)
+    assert convertido.iloc[0] == pd.Timestamp("2017-10-02 08:56:33", tz="UTC")
+    assert pd.isna(convertido.iloc[1])
+
+
+def test_coluna_toda_nula_e_contagem_de_invalidas():
+    df = pd.DataFrame({
+        "order_approved_at": [None, None],
+        "order_purchase_timestamp": ["2017-10-02 10:56:33", "bad"],
+    })
+
+    invalid = parse_datetime_columns(df, ["order_approved_at", "order_purchase_timestamp", "ausente"])
+
+    assert invalid == {"order_approved_at": 0, "order_purchase_timestamp": 1}
+    assert pd.api.types.is_datetime64_any_dtype(df["order_approved_at"].dtype)
+    assert df["order_approved_at"].isna().all()
@@ -0,0 +1,24 @@
+import pandas as pd
+
+from app.services.dedup import dedup_policy_from_env, deduplicate
+
+
+def test_dedup_desligado_por_padrao(monkeypatch):
+    monkeypatch.delenv("ETL_DEDUP_POLICY", raising=False)
+    assert dedup_policy_from_env() is None
+
+    monkeypatch.setenv("ETL_DEDUP_POLICY", "last")
+    assert dedup_policy_from_env() == "last"
+
+
+def test_colunas_com_objetos_json_nao_quebram_o_dedup():
+    df = pd.DataFrame({
+        "order_id": ["a", "a", "b", "a"],
+        "extra": [{"x": 1, "y": [1, 2]}, {"y": [1, 2], "x": 1}, {"x": 2}, ["outro"]],
+    })
+
+    deduped, counts = deduplicate("orders", df, "first")
+
+    assert deduped["order_id"].tolist() == ["a", "b"]
+    # Mesmo objeto com as chaves em outra ordem conta como linha idêntica
+    assert counts == {"received": 4, "duplicates": 2, "identical": 1}
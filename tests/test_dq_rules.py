@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services.dq_rules import (
+    DQ_RULES, FLAGS_COLUMN, _dtype, apply_rules, evaluate_rules, integrity_flags, rule_bits, summarize
+)
+
+AGORA = pd.Timestamp("2024-01-01", tz="UTC")
+
+
+def _pedidos():
+    return pd.DataFrame({
+        "order_id": ["ok", "cronologia", "futuro", "ambos", "sem_data"],
+        "order_purchase_timestamp": pd.to_datetime(
+            ["2023-01-10", "2023-01-10", "2025-01-01", "2025-01-01", None]
+        ),
+        "order_delivered_customer_date": pd.to_datetime(
+            ["2023-01-20", "2023-01-01", None, "2024-12-01", "2023-01-20"]
+        ),
+    })
+
+
+def test_bits_na_ordem_da_lista():
+    assert rule_bits("orders") == {"erro_cronologia": 1, "erro_futuro": 2}
+    assert rule_bits("items") == {"erro_data_limite": 1, "orfao_pedido": 2, "orfao_produto": 4, "orfao_vendedor": 8}
+    assert rule_bits("products") == {}
+
+
+@pytest.mark.parametrize("n, esperado", [(1, np.uint8), (8, np.uint8), (9, np.uint16), (16, np.uint16),
+                                         (17, np.uint32), (33, np.uint64)])
+def test_menor_inteiro_sem_sinal(monkeypatch, n, esperado):
+    monkeypatch.setitem(DQ_RULES, "teste", [(f"r{i}", (), None) for i in range(n)])
+
+    assert _dtype("teste") == esperado
+    assert evaluate_rules("teste", pd.DataFrame({"a": [1]})).dtype == esperado
+
+
+def test_avalia_regras_de_pedidos():
+    flags = evaluate_rules("orders", _pedidos(), AGORA)
+
+    assert flags.dtype == np.uint8
+    # NaT não viola cronologia nem futuro
+    assert flags.tolist() == [0, 1, 2, 3, 0]
+
+
+def test_avalia_data_limite_nula_nos_itens():
+    itens = pd.DataFrame({"shipping_limit_date": pd.to_datetime(["2023-01-01", None, None])})
+
+    assert evaluate_rules("items", itens, AGORA).tolist() == [0, 1, 1]
+
+
+def test_regra_sem_coluna_fica_desligada_e_entidade_sem_regras_e_none():
+    so_compra = _pedidos().drop(columns="order_delivered_customer_date")
+
+    assert evaluate_rules("orders", so_compra, AGORA).tolist() == [0, 0, 2, 2, 0]
+    assert evaluate_rules("sellers", pd.DataFrame({"seller_id": ["s1"]})) is None
+
+
+def test_datas_em_texto_sao_lidas():
+    texto = _pedidos().astype({"order_purchase_timestamp": str, "order_delivered_customer_date": str})
+
+    assert evaluate_rules("orders", texto, AGORA).tolist() == [0, 1, 2, 3, 0]
+
+
+def test_apply_rules_grava_a_coluna_no_lugar():
+    df = _pedidos()
+
+    assert apply_rules("orders", df, AGORA) is df
+    assert df[FLAGS_COLUMN].tolist() == [0, 1, 2, 3, 0]
+    assert df[FLAGS_COLUMN].dtype == np.uint8
+
+    vendedores = pd.DataFrame({"seller_id": ["s1"]})
+    assert FLAGS_COLUMN not in apply_rules("sellers", vendedores).columns
+
+
+def test_bits_de_orfao_vem_da_mascara_de_integridade():
+    # Motivos: 1 = order_id, 2 = product_id, 4 = seller_id
+    flags = integrity_flags("items", np.array([0, 1, 2, 4, 5], dtype=np.uint8))
+
+    assert flags.tolist() == [0, 2, 4, 8, 10]
+    assert not integrity_flags("orders", np.array([1], dtype=np.uint8)).any()
+
+
+def test_summarize_conta_linhas_por_regra():
+    flags = evaluate_rules("orders", _pedidos(), AGORA)
+
+    assert summarize("orders", flags) == {
+        "linhas": 5, "erro_cronologia": 2, "erro_futuro": 2, "linhas_com_violacao": 3
+    }
+    assert summarize("orders", np.zeros(0, dtype=np.uint8)) == {
+        "linhas": 0, "erro_cronologia": 0, "erro_futuro": 0, "linhas_com_violacao": 0
+    }
@@ -0,0 +1,85 @@
+import json
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services.dtype_profiles import DTYPE_PROFILES, ID_DTYPE, compactar_dtypes
+from app.services.json_encoder import encode_response
+from app.services.processor_core import ETLProcessor
+
+
+def _produtos():
+    return pd.DataFrame({
+        "product_id": ["p1", "p2", "p3"],
+        "product_category_name": ["cama", "cama", "beleza"],
+        "product_name_lenght": [40.0, 12.0, 7.0],
+        "product_photos_qty": [1, 2, 3],
+        "product_weight_g": [500.0, 30000.0, 200.0],
+        "product_length_cm": [19.5, 8.25, 0.1],
+        "product_height_cm": [2.0**24, 8.0, 1.0],
+        "product_width_cm": [13.0, np.nan, 100.0],
+    })
+
+
+def test_perfil_de_produtos():
+    df = compactar_dtypes("products", _produtos(), final=True)
+
+    if ID_DTYPE is not None:
+        assert df["product_id"].dtype == ID_DTYPE
+    assert isinstance(df["product_category_name"].dtype, pd.CategoricalDtype)
+    # Contagens: menor inteiro sem sinal que comporta os valores
+    assert df["product_name_lenght"].dtype == np.uint8
+    assert df["product_photos_qty"].dtype == np.uint8
+    # Medidas inteiras < 2**24 viram float32; frações, valores >= 2**24 e colunas com nulos ficam float64
+    assert df["product_weight_g"].dtype == np.float32
+    assert df["product_length_cm"].dtype == np.float64
+    assert df["product_height_cm"].dtype == np.float64
+    assert df["product_width_cm"].dtype == np.float64
+
+
+def test_floats_so_sao_reduzidos_depois_da_limpeza():
+    df = compactar_dtypes("products", _produtos(), final=False)
+
+    assert df["product_name_lenght"].dtype == np.float64
+    assert df["product_weight_g"].dtype == np.float64
+    assert df["product_photos_qty"].dtype == np.uint8
+
+
+@pytest.mark.parametrize("valor", [0.1, 0.3, 58.9, 1234.56, 16777215.0, 2.0**24 + 1])
+def test_float32_so_quando_o_texto_nao_muda(valor):
+    df = compactar_dtypes("items", pd.DataFrame({"price": [valor, 2.0]}), final=True)
+
+    # Mesmo valor e mesmo texto depois da compactação
+    assert df["price"].astype(np.float64).tolist() == [valor, 2.0]
+    assert [repr(float(v)) for v in df["price"]] == [repr(valor), "2.0"]
+
+
+def test_relatorio_soma_bytes_economizados():
+    relatorio = {}
+    compactar_dtypes("products", _produtos(), final=True, relatorio=relatorio)
+
+    assert relatorio["product_photos_qty"] == 3 * (8 - 1)
+    assert relatorio["product_name_lenght"] == 3 * (8 - 1)
+    assert relatorio["product_weight_g"] == 3 * (8 - 4)
+    # Colunas que não mudam de dtype não entram no relatório
+    assert "product_length_cm" not in relatorio
+
+
+def test_resposta_com_e_sem_perfil_tem_os_mesmos_valores():
+    payload = {
+        "orders": [{"order_id": "o1", "customer_id": "c1", "order_status": "delivered"}],
+        "products": _produtos().replace({np.nan: None}).to_dict(orient="records"),
+        "order_items": [
+            {"order_id": "o1", "order_item_id": 1, "product_id": "p1", "seller_id": "s1", "price": 58.9, "freight_value": 13.0},
+        ],
+        "sellers": [{"seller_id": "s1", "seller_zip_code_prefix": 13023, "seller_city": "campinas", "seller_state": "SP"}],
+    }
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        sem_perfil = encode_response(ETLProcessor().process_frames(payload))
+        com_perfil = encode_response(ETLProcessor(dtype_profiles=DTYPE_PROFILES).process_frames(payload))
+
+    # Só a forma dos números muda (1.0 -> 1); os valores são os mesmos
+    assert json.loads(com_perfil) == json.loads(sem_perfil)
@@ -0,0 +1,55 @@
+import io
+import json
+
+import pandas as pd
+import pytest
+
+from app.services.ingestion import ColumnarIngestor, IngestionError, iter_json_blocks, iter_ndjson_blocks
+
+ENTIDADES = ("orders", "order_items")
+
+DOCUMENTO = {
+    "orders": [
+        {"order_id": f"o{i}", "valor": i * 1234.5678, "cidade": "São Paulo ção", "ok": i % 2 == 0, "nada": None}
+        for i in range(25)
+    ],
+    "order_items": {"order_id": ["o1", "o2", "o3"], "price": [58.9, 1e-7, -12]},
+}
+
+
+def _frames(blocks):
+    ingestor = ColumnarIngestor(allowed_entities=ENTIDADES)
+    for block in blocks:
+        ingestor.add_block(*block)
+    return ingestor.frames()
+
+
+@pytest.mark.parametrize("block_size", [1, 7, 64, 1 << 20])
+def test_json_lido_aos_poucos_igual_ao_documento_inteiro(block_size):
+    body = json.dumps(DOCUMENTO, ensure_ascii=False, indent=1).encode("utf-8")
+    esperado = ColumnarIngestor(allowed_entities=ENTIDADES)
+    esperado.feed_json(body)
+
+    blocks = list(iter_json_blocks(io.BytesIO(body), block_size=block_size, batch=10))
+
+    assert [len(value) for entity, kind, value in blocks if kind == "records"] == [10, 10, 5]
+    got = _frames(blocks)
+    for entity, df in esperado.frames().items():
+        pd.testing.assert_frame_equal(got[entity], df)
+
+
+def test_ndjson_lido_aos_poucos():
+    body = b"".join(
+        json.dumps({"entity": entity, "records": records}).encode("utf-8") + b"\n"
+        for entity, records in [("orders", DOCUMENTO["orders"][:3]), ("orders", DOCUMENTO["orders"][3:])]
+    )
+
+    got = _frames(iter_ndjson_blocks(io.BytesIO(body.rstrip(b"\n")), block_size=5))
+
+    assert got["orders"]["order_id"].tolist() == [f"o{i}" for i in range(25)]
+
+
+@pytest.mark.parametrize("body", [b'{"orders": [{"order_id": 1}', b'{"orders": [1] 2}', b'[]', b'{"orders": []} x'])
+def test_json_malformado(body):
+    with pytest.raises(IngestionError):
+        list(iter_json_blocks(io.BytesIO(body), block_size=3))
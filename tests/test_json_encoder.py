@@ -0,0 +1,58 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+from app.bench_serialization import caminho_antigo, caminho_novo, gerar_frames
+from app.services.json_encoder import encode_records, iter_ndjson
+
+
+def _baseline(df: pd.DataFrame) -> list:
+    """Registros como o json.dumps da resposta antiga: floats em repr, NaN/±Inf como null."""
+    records = df.astype(object).where(df.notna(), None).to_dict(orient="records")
+    for record in records:
+        for key, value in record.items():
+            if isinstance(value, float) and not np.isfinite(value):
+                record[key] = None
+    return json.loads(json.dumps(records))
+
+
+def test_floats_saem_com_a_representacao_mais_curta():
+    df = pd.DataFrame({
+        "price": [58.9, 0.1 + 0.2, 123456.789, 1e20, 1e-7, -0.0, np.nan, np.inf],
+        "freight_value": np.array([58.9, 1.5, 2, 3, 4, 5, 6, 7], dtype=np.float32),
+        "weight": pd.array([1.5, None, 2.25, 3, 4, 5, 6, 7], dtype="Float64"),
+        "seller_id": ["a", "b", None, "d\"", "ç", "f", "g", "h"],
+    })
+
+    encoded = encode_records(df)
+
+    assert '"price":58.9,' in encoded
+    assert "58.899999999999999" not in encoded
+    assert json.loads(encoded) == _baseline(df)
+
+
+def test_texto_com_a_marca_interna_nao_vira_numero():
+    marcado = "\ue0001.5\ue000"
+    df = pd.DataFrame({"price": [58.9, np.inf], "seller_id": [marcado, "x"]})
+
+    assert json.loads(encode_records(df)) == [
+        {"price": 58.9, "seller_id": marcado},
+        {"price": None, "seller_id": "x"},
+    ]
+
+
+def test_resposta_igual_ao_caminho_antigo():
+    sections = gerar_frames(2000)
+
+    assert json.loads(caminho_novo(sections)) == json.loads(caminho_antigo(sections))
+
+
+def test_ndjson_preserva_os_floats():
+    df = pd.DataFrame({"price": [58.9, 0.1 + 0.2, 19.99]})
+
+    lines = [json.loads(line) for line in iter_ndjson([("data", "order_items", df)], chunk_size=2)]
+
+    records = [r for line in lines[:-1] for r in line["records"]]
+    assert records == [{"price": 58.9}, {"price": 0.30000000000000004}, {"price": 19.99}]
+    assert lines[-1] == {"status": "success"}
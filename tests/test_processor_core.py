@@ -0,0 +1,70 @@
+import warnings
+
+import pytest
+
+from app.services.json_encoder import encode_response
+from app.services.processor_core import ETLProcessor
+
+
+def _payload(prefixo, datas, envio):
+    orders = [
+        {
+            "order_id": f"{prefixo}{i}", "customer_id": f"c{i}", "order_status": "delivered",
+            "order_purchase_timestamp": data, "order_approved_at": data,
+            "order_delivered_carrier_date": None, "order_delivered_customer_date": data,
+            "order_estimated_delivery_date": data,
+        }
+        for i, data in enumerate(datas)
+    ]
+    items = [
+        {
+            "order_id": f"{prefixo}{i}", "order_item_id": 1, "product_id": "p1", "seller_id": "s1",
+            "shipping_limit_date": envio, "price": 58.9, "freight_value": 13.29,
+        }
+        for i in range(len(datas) + 1)  # o último item é órfão
+    ]
+    return {
+        "orders": orders,
+        "products": [{"product_id": "p1", "product_weight_g": None, "product_length_cm": 19}],
+        "order_items": items,
+        "sellers": [{"seller_id": "s1", "seller_state": "SP"}],
+    }
+
+
+PAYLOADS = [
+    _payload("a", ["10/02/2017", "11/02/2017"], "10/02/2017"),
+    _payload("b", ["13/02/2017", None], "13/02/2017"),
+    _payload("c", ["2017-10-02T10:56:33+02:00", "2017-10-03T08:00:00+02:00"], "2017-10-02T10:56:33+02:00"),
+    _payload("d", ["2017-10-02T10:56:33", "2017-10-04 09:15:00"], "2017-10-04 09:15:00"),
+    # Sem pedidos: todos os itens órfãos, sem o aviso dq_issue
+    {**_payload("e", ["2017-10-02"], "2017-10-02"), "orders": []},
+]
+
+
+@pytest.mark.parametrize("dedup_policy", [None, "newest"])
+@pytest.mark.parametrize("orphan_mode", ["full", "compact"])
+def test_lote_igual_a_chamadas_separadas(dedup_policy, orphan_mode):
+    processor = ETLProcessor(dq_rules=True, dedup_policy=dedup_policy)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)
+        separados = [processor.process_frames(payload, orphan_mode) for payload in PAYLOADS]
+        lote = processor.process_batch_frames(PAYLOADS, orphan_mode)
+
+    for sozinho, no_lote in zip(separados, lote):
+        assert encode_response(no_lote) == encode_response(sozinho)
+
+
+@pytest.mark.parametrize("orphan_mode", ["full", "compact"])
+def test_limpeza_paralela_igual_a_sequencial(orphan_mode):
+    sequencial = ETLProcessor(parallel=False, dq_rules=True)
+    paralelo = ETLProcessor(parallel=True, dq_rules=True)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)
+        for payload in PAYLOADS:
+            esperado = sequencial.process_frames(payload, orphan_mode)
+            obtido = paralelo.process_frames(payload, orphan_mode)
+
+            assert list(obtido["data"]) == list(esperado["data"])
+            assert encode_response(obtido) == encode_response(esperado)
@@ -0,0 +1,66 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from app.services.refined_store import RefinedStore  # noqa: E402
+
+
+def _vendedores(prefixo: str, n: int) -> pd.DataFrame:
+    return pd.DataFrame({"seller_id": [f"{prefixo}{i}" for i in range(n)], "seller_state": ["SP"] * n})
+
+
+def test_upsert_repetido_nao_duplica_linhas(tmp_path):
+    store = RefinedStore(str(tmp_path))
+    df = _vendedores("s", 20)
+
+    for _ in range(3):
+        store.upsert("sellers", df, ["seller_id"])
+
+    result = store.query("sellers")
+    assert len(result) == 20
+    assert not result["seller_id"].duplicated().any()
+
+
+def test_upsert_substitui_a_versao_antiga(tmp_path):
+    store = RefinedStore(str(tmp_path))
+    store.upsert("sellers", _vendedores("s", 5), ["seller_id"])
+
+    store.upsert("sellers", _vendedores("s", 2).assign(seller_state="RJ"), ["seller_id"])
+
+    result = store.query("sellers").set_index("seller_id")["seller_state"]
+    assert result.to_dict() == {"s0": "RJ", "s1": "RJ", "s2": "SP", "s3": "SP", "s4": "SP"}
+
+
+def test_delete_keys_so_reescreve_arquivos_com_as_chaves(tmp_path):
+    store = RefinedStore(str(tmp_path))
+    for lote in range(5):
+        store.write("sellers", _vendedores(f"l{lote}_", 100))
+    antes = {path: os.stat(path).st_mtime_ns for path in store._files("sellers")}
+    com_as_chaves = [path for path in antes if pd.read_parquet(path)["seller_id"].iloc[0].startswith("l2_")]
+
+    removed = store.delete_keys("sellers", ["seller_id"], ["l2_7", "l2_8", "inexistente"])
+
+    reescritos = [path for path in antes if os.stat(path).st_mtime_ns != antes[path]]
+    assert removed == 2
+    assert reescritos == com_as_chaves
+    assert len(store.query("sellers")) == 498
+
+
+def test_upserts_concorrentes_das_mesmas_chaves(tmp_path):
+    store = RefinedStore(str(tmp_path))
+    df = pd.DataFrame({"seller_id": [f"s{i}" for i in range(200)], "valor": np.arange(200)})
+
+    threads = [threading.Thread(target=store.upsert, args=("sellers", df, ["seller_id"])) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    result = store.query("sellers")
+    assert len(result) == 200
+    assert not result["seller_id"].duplicated().any()
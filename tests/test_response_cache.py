@@ -0,0 +1,50 @@
+import pytest
+
+from app.services.processor_core import ETLProcessor
+from app.services.response_cache import ResponseCache, canonical_json
+
+
+def test_camada_em_disco_sobrevive_ao_reinicio_da_mesma_versao(tmp_path):
+    cache = ResponseCache(max_bytes=0, disk_dir=str(tmp_path))
+    cache.check_version("v1")
+    key = cache.key("hash", "json|full")
+    cache.put(key, b'{"data": {}}', "application/json")
+
+    reiniciado = ResponseCache(max_bytes=0, disk_dir=str(tmp_path))
+    reiniciado.check_version("v1")
+
+    entry = reiniciado.get(key)
+    assert entry is not None and entry.body == b'{"data": {}}'
+    assert reiniciado.stats()["disk_hits"] == 1
+
+
+def test_entradas_de_outra_versao_saem_do_disco_ao_carregar(tmp_path):
+    antigo = ResponseCache(max_bytes=0, disk_dir=str(tmp_path))
+    antigo.check_version("v1")
+    antigo.put(antigo.key("hash", "json|full"), b"x" * 100, "application/json")
+
+    cache = ResponseCache(max_bytes=0, disk_dir=str(tmp_path))
+    cache.check_version("v2")
+
+    stats = cache.stats()
+    assert stats["disk_entries"] == 0 and stats["disk_bytes"] == 0
+    assert stats["stale_disk_entries"] == 1
+    assert len(list(tmp_path.iterdir())) == 0
+
+
+def test_canonical_json_devolve_o_documento():
+    a, documento = canonical_json(b'{"b": 1, "a": [1, 2]}')
+    b, _ = canonical_json(b'{\n  "a": [1, 2],\n  "b": 1\n}')
+
+    assert a == b
+    assert documento == {"a": [1, 2], "b": 1}
+    assert canonical_json(b"{nope") == (None, None)
+
+
+def test_cache_desligado_com_refined_store(tmp_path):
+    pytest.importorskip("pyarrow")
+    from app.services.refined_store import RefinedStore
+
+    assert ETLProcessor().response_cacheable()
+    # Um acerto pularia a gravação do payload no refined store
+    assert not ETLProcessor(refined_store=RefinedStore(str(tmp_path))).response_cacheable()
@@ -0,0 +1,74 @@
+import pandas as pd
+import pytest
+
+from app.services.validators import IntegrityValidator
+
+PARENT_KEYS = [
+    ("items_orders", "orders", "order_id"),
+    ("items_products", "products", "product_id"),
+    ("items_sellers", "sellers", "seller_id"),
+]
+
+ITEMS = pd.DataFrame({
+    "order_id": ["o1", "o2", "x", "x", "o1", "x", "o2", None],
+    "product_id": ["p1", "y", "p1", "y", "p2", "y", "p1", "p1"],
+    "seller_id": ["s1", "s1", "z", "s1", "z", "z", "s2", "s1"],
+    "price": [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0],
+})
+
+DIMENSIONS = {
+    "orders": pd.DataFrame({"order_id": ["o1", "o2"]}),
+    "products": pd.DataFrame({"product_id": ["p1", "p2"]}),
+    "sellers": pd.DataFrame({"seller_id": ["s1", "s2"]}),
+}
+
+
+def _sequencial(items, dimensions):
+    """Caminho antigo: três validate_referential_integrity em sequência."""
+    orphans = {}
+    for group, entity, key in PARENT_KEYS:
+        items, orphan_df = IntegrityValidator.validate_referential_integrity(
+            child_df=items, parent_df=dimensions.get(entity, pd.DataFrame()), child_key=key, parent_key=key
+        )
+        if not orphan_df.empty:
+            orphans[group] = orphan_df
+    return items, orphans
+
+
+def _assert_mesmo_frame(obtido, esperado):
+    if esperado.empty:
+        # O caminho antigo devolvia um frame vazio sem dtypes (object); o novo mantém os do filho
+        assert obtido.empty and list(obtido.columns) == list(esperado.columns)
+    else:
+        pd.testing.assert_frame_equal(obtido, esperado)
+
+
+def _fundido(items, dimensions):
+    parents = [(group, dimensions.get(entity), key, key) for group, entity, key in PARENT_KEYS]
+    valid, orphans, _ = IntegrityValidator.validate_fused_integrity(items, parents)
+    return valid, orphans
+
+
+@pytest.mark.parametrize("sem", [None, "products", "orders"])
+def test_validacao_fundida_igual_a_sequencial(sem):
+    dimensions = {entity: df for entity, df in DIMENSIONS.items() if entity != sem}
+
+    esperado_validos, esperado_orfaos = _sequencial(ITEMS, dimensions)
+    validos, orfaos = _fundido(ITEMS, dimensions)
+
+    _assert_mesmo_frame(validos, esperado_validos)
+    assert list(orfaos) == list(esperado_orfaos)
+    for group, df in esperado_orfaos.items():
+        _assert_mesmo_frame(orfaos[group], df)
+
+
+def test_orfao_de_varios_pais_cai_na_primeira_chave():
+    _, orfaos = _fundido(ITEMS, DIMENSIONS)
+
+    # Linha 3 (pedido, produto e vendedor inexistentes) e 5: primeiro motivo é o pedido
+    assert orfaos["items_orders"].index.tolist() == [2, 3, 5, 7]
+    assert orfaos["items_products"].index.tolist() == [1]
+    assert orfaos["items_sellers"].index.tolist() == [4]
+    assert set(orfaos["items_orders"]["dq_issue"]) == {"Orphan: order_id not found in parent dataset"}
+    assert set(orfaos["items_products"]["dq_issue"]) == {"Orphan: product_id not found in parent dataset"}
+    assert set(orfaos["items_sellers"]["dq_issue"]) == {"Orphan: seller_id not found in parent dataset"}